@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Batch OCR: the pages are rendered and run through the OCR by a pool of
+worker processes. Their boxes are written back by the calling process, so its
+caches remain consistent.
+
+OcrQueue keeps track of the pages still to run through the OCR, so that a
+long run (a whole work directory for instance) can be interrupted and
+resumed.
+"""
+
+import json
+import logging
+import os
+
+import pyocr
+import pyocr.builders
+
+from .fs import LocalFileSystem
+from .index import inst_doc
+from .parallel import get_nb_workers
+from .parallel import make_pool
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_ocr_tool(name=None):
+    """
+    Returns:
+        The OCR tool with this name, or the first one available if 'name' is
+        None. None if there is no such tool.
+    """
+    for tool in pyocr.get_available_tools():
+        if name is None or tool.get_name() == name:
+            return tool
+    return None
+
+
+def _ocr_page(job):
+    """
+    Render the page and run it through the OCR.
+
+    Arguments:
+        job --- (docpath, docid, doctype, page number, OCR tool name,
+            OCR language)
+
+    Returns:
+        (line boxes, error or None)
+    """
+    (docpath, docid, doctype, page_nb, tool_name, lang) = job
+    try:
+        tool = get_ocr_tool(tool_name)
+        if tool is None:
+            raise Exception("OCR tool {} not found".format(tool_name))
+        doc = inst_doc(LocalFileSystem(), docpath, docid, doctype)
+        if doc is None:
+            raise Exception("Document {} not found".format(docid))
+        img = doc.pages[page_nb].img
+        boxes = tool.image_to_string(
+            img, lang=lang, builder=pyocr.builders.LineBoxBuilder()
+        )
+        return (boxes, None)
+    except Exception as exc:
+        logger.warning("OCR failed on page %d of %s", page_nb, docid,
+                       exc_info=exc)
+        return (None, str(exc))
+
+
+def _ocr_page_in_worker(job):
+    """
+    Run in a worker process (see ocr_pages()).
+    """
+    # Tesseract uses many threads by default. With one OCR run per worker,
+    # they would only compete with the other workers.
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    return _ocr_page(job)
+
+
+def ocr_pages(pages, ocr_tool, ocr_lang, nb_workers=None):
+    """
+    Run the pages through the OCR and write their boxes.
+
+    Arguments:
+        pages --- pages (the documents must exist on disk)
+        ocr_tool --- pyocr tool
+        nb_workers --- number of worker processes. None = one per CPU.
+
+    Yields:
+        (page, error or None), in the order of 'pages', as soon as they are
+        done
+    """
+    pages = list(pages)
+    jobs = [
+        (page.doc.path, page.doc.docid, page.doc.doctype, page.page_nb,
+         ocr_tool.get_name(), ocr_lang)
+        for page in pages
+    ]
+    nb_workers = min(len(jobs), get_nb_workers(nb_workers))
+    if nb_workers <= 1:
+        yield from _write_boxes(pages, (_ocr_page(job) for job in jobs))
+        return
+    with make_pool(nb_workers) as pool:
+        yield from _write_boxes(
+            pages, pool.imap(_ocr_page_in_worker, jobs)
+        )
+
+
+def _write_boxes(pages, results):
+    for (page, (boxes, error)) in zip(pages, results):
+        if error is None:
+            page.boxes = boxes
+        yield (page, error)
+
+
+class OcrQueue(object):
+    """
+    Pages still to run through the OCR. Stored next to the index, so that
+    an interrupted run can be resumed.
+
+    The list of pages is written once, when the run starts. Pages done are
+    then appended to a log (one page ID per line), so that removing pages
+    never requires rewriting the whole queue.
+
+    Pages must be removed from the queue only once the index has been
+    updated with their new boxes.
+    """
+
+    FILENAME = "ocr_queue.json"
+    DONE_FILENAME = "ocr_queue.done"
+    VERSION = 1
+
+    def __init__(self, indexdir):
+        self.path = os.path.join(indexdir, self.FILENAME)
+        self.done_path = os.path.join(indexdir, self.DONE_FILENAME)
+        self.ocr_lang = None
+        # pages remaining when the run was started or loaded. Not updated
+        # by remove().
+        self.pageids = []
+
+    def start(self, pageids, ocr_lang):
+        """
+        Replace the content of the queue (including the one of any run that
+        has been interrupted)
+        """
+        self.ocr_lang = ocr_lang
+        self.pageids = list(pageids)
+        self._unlink(self.done_path)
+        content = {
+            'version': self.VERSION,
+            'ocr_lang': self.ocr_lang,
+            'pageids': self.pageids,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fd:
+            json.dump(content, fd, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """
+        Returns:
+            True if the queue of an interrupted run has been found
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as fd:
+                content = json.load(fd)
+        except FileNotFoundError:  # NOQA (Python 3.x only)
+            return False
+        except (OSError, ValueError) as exc:
+            logger.warning("Failed to read OCR queue %s", self.path,
+                           exc_info=exc)
+            return False
+
+        if content.get('version') != self.VERSION:
+            logger.info("OCR queue %s is obsolete", self.path)
+            return False
+
+        done = self._load_done()
+        self.ocr_lang = content['ocr_lang']
+        self.pageids = [
+            pageid for pageid in content['pageids'] if pageid not in done
+        ]
+        logger.info("OCR queue loaded: %d pages (%d already done)",
+                    len(self.pageids), len(done))
+        return True
+
+    def _load_done(self):
+        try:
+            with open(self.done_path, "r", encoding="utf-8") as fd:
+                lines = fd.read().split("\n")
+        except FileNotFoundError:  # NOQA (Python 3.x only)
+            return set()
+        # the last line is either empty or incomplete (interrupted write)
+        return set(lines[:-1])
+
+    def remove(self, pageids):
+        """
+        Remove the pages from the queue on disk
+        """
+        lines = "".join(pageid + "\n" for pageid in pageids)
+        if lines == "":
+            return
+        with open(self.done_path, "a", encoding="utf-8") as fd:
+            fd.write(lines)
+
+    def clear(self):
+        """
+        To call once all the pages have been done
+        """
+        self.pageids = []
+        self._unlink(self.path)
+        self._unlink(self.done_path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:  # NOQA (Python 3.x only)
+            pass
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+import collections
+import contextlib
+import logging
+import os
+import re
+import sqlite3
+
+import numpy
+
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN_REGEX = re.compile(r"\w+")
+
+
+class MultiLabelBayes(object):
+    """
+    Naive Bayes classifier for all the labels at once.
+
+    Each label is a yes/no classifier (same algorithm as simplebayes), but
+    all the labels share the same vocabulary. A document is tokenized only
+    once, and all the labels are scored with a single vectorized operation.
+
+    Each document is trained on all the labels: "yes" for the labels it
+    has, "no" for all the others. So the "no" token counts of a label are
+    not stored: they are the token counts of all the documents, minus its
+    "yes" counts, minus the counts of the documents trained before the label
+    was added. Only those last two are stored per label, as sparse rows
+    (sorted token columns, counts): the size of the model grows with the
+    vocabulary of each label, not with labels x whole vocabulary.
+
+    The model is stored in a single SQLite database. Only the labels and
+    the tokens that have been modified since the last load()/save() are
+    written back.
+    """
+
+    FILENAME = "model.db"
+    VERSION = 2
+
+    # token columns and counts are stored as arrays of int32
+    DB_DTYPE = numpy.dtype("<i4")
+
+    # initial number of token columns. Doubled each time it is full
+    INITIAL_CAPACITY = 1024
+
+    EMPTY_ROW = (
+        numpy.zeros((0,), dtype=DB_DTYPE), numpy.zeros((0,), dtype=DB_DTYPE)
+    )
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.labels = []  # row --> label name
+        self.label_rows = {}  # label name --> row
+        self.vocabulary = {}  # token --> column
+        self.tokens = []  # column --> token
+        # token counts of all the documents trained (column --> count)
+        self.total = numpy.zeros((self.INITIAL_CAPACITY,), dtype=numpy.int64)
+        self.total_tally = 0
+        # row --> sparse row (see _add_to_row()): token counts of the
+        # documents having the label
+        self.yes = []
+        # row --> sparse row: token counts of the documents trained before
+        # the label was added
+        self.before = []
+        # total number of tokens in the rows above, per label
+        self.yes_tally = numpy.zeros((0,), dtype=numpy.int64)
+        self.before_tally = numpy.zeros((0,), dtype=numpy.int64)
+        # what must be written by the next save()
+        self.dirty_labels = set()
+        self.removed_labels = set()
+        self.dirty_tokens = set()  # columns
+        # False if the content of the database cannot be updated
+        # incrementally (missing or obsolete)
+        self.db_in_sync = False
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Returns:
+            collections.Counter: token --> number of occurrences
+        """
+        return collections.Counter(TOKEN_REGEX.findall(text.lower()))
+
+    def has_label(self, label_name):
+        return label_name in self.label_rows
+
+    def add_label(self, label_name):
+        if label_name in self.label_rows:
+            return
+        self.label_rows[label_name] = len(self.labels)
+        self.labels.append(label_name)
+        columns = numpy.flatnonzero(self.total[:len(self.tokens)])
+        self.yes.append(self.EMPTY_ROW)
+        self.before.append((
+            columns.astype(self.DB_DTYPE),
+            self.total[columns].astype(self.DB_DTYPE),
+        ))
+        self.yes_tally = numpy.append(self.yes_tally, 0)
+        self.before_tally = numpy.append(self.before_tally, self.total_tally)
+        self.dirty_labels.add(label_name)
+
+    def remove_label(self, label_name):
+        row = self.label_rows.pop(label_name, None)
+        if row is None:
+            return
+        self.labels.pop(row)
+        self.label_rows = {name: idx for (idx, name) in enumerate(self.labels)}
+        self.yes.pop(row)
+        self.before.pop(row)
+        self.yes_tally = numpy.delete(self.yes_tally, row)
+        self.before_tally = numpy.delete(self.before_tally, row)
+        self.dirty_labels.discard(label_name)
+        self.removed_labels.add(label_name)
+
+    def rename_label(self, old_label_name, new_label_name):
+        row = self.label_rows.pop(old_label_name)
+        self.labels[row] = new_label_name
+        self.label_rows[new_label_name] = row
+        self.dirty_labels.discard(old_label_name)
+        self.removed_labels.add(old_label_name)
+        self.dirty_labels.add(new_label_name)
+
+    def _grow(self, nb_tokens):
+        capacity = self.total.shape[0]
+        if nb_tokens <= capacity:
+            return
+        while capacity < nb_tokens:
+            capacity *= 2
+        self.total = numpy.pad(self.total, (0, capacity - self.total.shape[0]))
+
+    def _get_columns(self, tokens, create):
+        """
+        Arguments:
+            tokens --- see tokenize()
+            create --- if False, unknown tokens are ignored
+
+        Returns:
+            (column indexes, token counts): two numpy arrays
+        """
+        columns = []
+        counts = []
+        for (token, count) in tokens.items():
+            column = self.vocabulary.get(token)
+            if column is None:
+                if not create:
+                    continue
+                column = len(self.tokens)
+                self.vocabulary[token] = column
+                self.tokens.append(token)
+            columns.append(column)
+            counts.append(count)
+        if create:
+            self._grow(len(self.vocabulary))
+        return (
+            numpy.array(columns, dtype=numpy.intp),
+            numpy.array(counts, dtype=numpy.int64),
+        )
+
+    @classmethod
+    def _add_to_row(cls, row, columns, counts):
+        """
+        Arguments:
+            row --- sparse row: (sorted token columns, token counts)
+            counts --- may be negative. Counts never go below 0.
+
+        Returns:
+            The updated sparse row
+        """
+        (all_columns, inverse) = numpy.unique(
+            numpy.concatenate((row[0], columns)), return_inverse=True
+        )
+        all_counts = numpy.zeros(all_columns.shape, dtype=numpy.int64)
+        numpy.add.at(all_counts, inverse, numpy.concatenate((row[1], counts)))
+        keep = (all_counts > 0)
+        return (
+            all_columns[keep].astype(cls.DB_DTYPE),
+            all_counts[keep].astype(cls.DB_DTYPE),
+        )
+
+    @staticmethod
+    def _get_from_row(row, columns):
+        """
+        Returns:
+            The counts of the tokens 'columns' in the sparse row
+        """
+        (row_columns, row_counts) = row
+        if len(row_columns) <= 0:
+            return numpy.zeros(columns.shape, dtype=numpy.int64)
+        idx = numpy.minimum(
+            numpy.searchsorted(row_columns, columns), len(row_columns) - 1
+        )
+        return numpy.where(row_columns[idx] == columns, row_counts[idx], 0)
+
+    def _add_yes(self, label_names, columns, counts):
+        for label_name in label_names:
+            row = self.label_rows[label_name]
+            old = self.yes[row]
+            new = self._add_to_row(old, columns, counts)
+            self.yes[row] = new
+            self.yes_tally[row] += int(new[1].sum()) - int(old[1].sum())
+            self.dirty_labels.add(label_name)
+
+    def train(self, tokens, yes_labels):
+        """
+        Arguments:
+            tokens --- see tokenize()
+            yes_labels --- names of the labels that the document has. The
+                document is trained as "no" for all the other labels.
+        """
+        (columns, counts) = self._get_columns(tokens, create=True)
+        if len(columns) <= 0:
+            return
+        self.total[columns] += counts
+        self.total_tally += int(counts.sum())
+        self.dirty_tokens.update(columns.tolist())
+        self._add_yes(yes_labels, columns, counts)
+
+    def untrain(self, tokens, yes_labels):
+        """
+        Reverse of train(). Counts never go below 0.
+        """
+        (columns, counts) = self._get_columns(tokens, create=False)
+        if len(columns) <= 0:
+            return
+        removed = numpy.minimum(self.total[columns], counts)
+        self.total[columns] -= removed
+        self.total_tally -= int(removed.sum())
+        self.dirty_tokens.update(columns.tolist())
+        self._add_yes(yes_labels, columns, -counts)
+
+    def relabel(self, tokens, removed_labels, added_labels):
+        """
+        Update the training of a document whose labels have changed
+
+        Arguments:
+            tokens --- see tokenize()
+            removed_labels --- names of the labels the document doesn't
+                have anymore
+            added_labels --- names of the labels the document now has
+        """
+        (columns, counts) = self._get_columns(tokens, create=False)
+        if len(columns) <= 0:
+            return
+        self._add_yes(removed_labels, columns, -counts)
+        self._add_yes(added_labels, columns, counts)
+
+    def score(self, tokens):
+        """
+        Arguments:
+            tokens --- see tokenize()
+
+        Returns:
+            {label name: {"yes": score, "no": score}, ...}
+        """
+        return self.score_many([tokens])[0]
+
+    def score_many(self, tokens_list):
+        """
+        Score many documents at once: all the labels and all the documents
+        are scored with a single matrix product.
+
+        Arguments:
+            tokens_list --- [tokens, ...] (see tokenize())
+
+        Returns:
+            [{label name: {"yes": score, "no": score}, ...}, ...]
+        """
+        out = [
+            {label_name: {"yes": 0.0, "no": 0.0} for label_name in self.labels}
+            for tokens in tokens_list
+        ]
+        docs_columns = [
+            self._get_columns(tokens, create=False) for tokens in tokens_list
+        ]
+        columns = numpy.unique(numpy.concatenate(
+            [numpy.zeros((0,), dtype=numpy.intp)] +
+            [doc_columns for (doc_columns, doc_counts) in docs_columns]
+        ))
+        if len(columns) <= 0 or len(self.labels) <= 0:
+            return out
+
+        # tokens x documents
+        counts = numpy.zeros((len(columns), len(tokens_list)))
+        for (doc_idx, (doc_columns, doc_counts)) in enumerate(docs_columns):
+            counts[numpy.searchsorted(columns, doc_columns), doc_idx] = \
+                doc_counts
+
+        # labels x tokens
+        yes = numpy.array(
+            [self._get_from_row(row, columns) for row in self.yes],
+            dtype=numpy.float64
+        )
+        before = numpy.array(
+            [self._get_from_row(row, columns) for row in self.before],
+            dtype=numpy.float64
+        )
+        no = numpy.maximum(self.total[columns] - yes - before, 0.0)
+
+        # probability that any given token is in a document having the label
+        no_tally = numpy.maximum(
+            self.total_tally - self.yes_tally - self.before_tally, 0
+        )
+        total_tally = self.yes_tally + no_tally
+        prc = numpy.divide(
+            self.yes_tally, total_tally,
+            out=numpy.zeros(total_tally.shape, dtype=numpy.float64),
+            where=(total_tally > 0)
+        )[:, numpy.newaxis]
+
+        p_yes = yes * prc
+        p_no = no * (1.0 - prc)
+        denominator = p_yes + p_no
+        known = (denominator > 0)
+        p_yes = numpy.divide(
+            p_yes, denominator, out=numpy.zeros(p_yes.shape), where=known
+        )
+        p_no = numpy.divide(
+            p_no, denominator, out=numpy.zeros(p_no.shape), where=known
+        )
+        # labels x documents
+        yes_scores = p_yes @ counts
+        no_scores = p_no @ counts
+
+        for (doc_idx, doc_out) in enumerate(out):
+            for (row, label_name) in enumerate(self.labels):
+                doc_out[label_name] = {
+                    "yes": float(yes_scores[row, doc_idx]),
+                    "no": float(no_scores[row, doc_idx]),
+                }
+        return out
+
+    @staticmethod
+    def _encode_row(row):
+        return (row[0].tobytes(), row[1].tobytes())
+
+    def _decode_row(self, columns, counts):
+        return (
+            numpy.frombuffer(columns, dtype=self.DB_DTYPE),
+            numpy.frombuffer(counts, dtype=self.DB_DTYPE),
+        )
+
+    def save(self, directory):
+        """
+        Write the modified labels and tokens in the database
+        """
+        path = os.path.join(directory, self.FILENAME)
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            with db:  # single transaction
+                if not self.db_in_sync:
+                    self._init_db(db)
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value)"
+                    " VALUES ('total_tally', ?)", (str(self.total_tally),)
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO tokens (id, token, total)"
+                    " VALUES (?, ?, ?)",
+                    (
+                        (column, self.tokens[column],
+                         int(self.total[column]))
+                        for column in sorted(self.dirty_tokens)
+                    )
+                )
+                db.executemany(
+                    "DELETE FROM labels WHERE name = ?",
+                    ((label_name,) for label_name in self.removed_labels)
+                )
+                for label_name in self.dirty_labels:
+                    row = self.label_rows[label_name]
+                    db.execute(
+                        "INSERT OR REPLACE INTO labels"
+                        " (name, yes_tally, before_tally,"
+                        " yes_columns, yes_counts,"
+                        " before_columns, before_counts)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (label_name, int(self.yes_tally[row]),
+                         int(self.before_tally[row])) +
+                        self._encode_row(self.yes[row]) +
+                        self._encode_row(self.before[row])
+                    )
+        logger.info("Label guesser model written: %d labels modified,"
+                    " %d labels removed, %d tokens modified",
+                    len(self.dirty_labels), len(self.removed_labels),
+                    len(self.dirty_tokens))
+        self.dirty_labels = set()
+        self.removed_labels = set()
+        self.dirty_tokens = set()
+        self.db_in_sync = True
+
+    def _init_db(self, db):
+        """
+        Drop whatever the database contains and prepare it for a full
+        rewrite of the model
+        """
+        db.execute("DROP TABLE IF EXISTS meta")
+        db.execute("DROP TABLE IF EXISTS tokens")
+        db.execute("DROP TABLE IF EXISTS labels")
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE tokens"
+            " (id INTEGER PRIMARY KEY, token TEXT, total INTEGER)"
+        )
+        db.execute(
+            "CREATE TABLE labels ("
+            " name TEXT PRIMARY KEY, yes_tally INTEGER, before_tally INTEGER,"
+            " yes_columns BLOB, yes_counts BLOB,"
+            " before_columns BLOB, before_counts BLOB)"
+        )
+        db.execute("INSERT INTO meta (key, value) VALUES ('version', ?)",
+                   (str(self.VERSION),))
+        self.removed_labels = set()
+        self.dirty_labels = set(self.labels)
+        self.dirty_tokens = set(range(len(self.tokens)))
+
+    def load(self, directory):
+        """
+        Returns False if there is no usable model in this directory
+        """
+        self._reset()
+        path = os.path.join(directory, self.FILENAME)
+        if not os.path.exists(path):
+            logger.info("No label guesser model found (%s)", path)
+            return False
+        try:
+            with contextlib.closing(sqlite3.connect(path)) as db:
+                meta = dict(db.execute("SELECT key, value FROM meta"))
+                if meta.get('version') != str(self.VERSION):
+                    logger.info("Label guesser model %s is obsolete", path)
+                    return False
+                tokens = db.execute(
+                    "SELECT token, total FROM tokens ORDER BY id"
+                ).fetchall()
+                labels = db.execute(
+                    "SELECT name, yes_tally, before_tally,"
+                    " yes_columns, yes_counts, before_columns, before_counts"
+                    " FROM labels"
+                ).fetchall()
+        except sqlite3.Error as exc:
+            logger.warning("Failed to read label guesser model %s",
+                           path, exc_info=exc)
+            return False
+
+        self.tokens = [token for (token, total) in tokens]
+        self.vocabulary = {
+            token: column for (column, token) in enumerate(self.tokens)
+        }
+        self._grow(len(tokens))
+        self.total[:len(tokens)] = [total for (token, total) in tokens]
+        self.total_tally = int(meta.get('total_tally', 0))
+        self.labels = [label[0] for label in labels]
+        self.label_rows = {
+            name: row for (row, name) in enumerate(self.labels)
+        }
+        self.yes_tally = numpy.array(
+            [label[1] for label in labels], dtype=numpy.int64
+        )
+        self.before_tally = numpy.array(
+            [label[2] for label in labels], dtype=numpy.int64
+        )
+        self.yes = [self._decode_row(label[3], label[4]) for label in labels]
+        self.before = [
+            self._decode_row(label[5], label[6]) for label in labels
+        ]
+
+        self.db_in_sync = True
+        logger.info("Label guesser model loaded: %d labels, %d tokens",
+                    len(self.labels), len(self.tokens))
+        return True
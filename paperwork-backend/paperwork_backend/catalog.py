@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import collections
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+CATALOG_ENTRY = collections.namedtuple(
+    "CATALOG_ENTRY",
+    ["docid", "doctype", "nb_pages", "labels", "last_mod", "filehash"]
+)
+
+
+def make_catalog_entry(doc, labels, last_mod, filehash):
+    """
+    Arguments:
+        labels --- labels currently on the document (labels.Label)
+        last_mod --- as returned by doc.last_mod
+        filehash --- as stored in the index (hexadecimal string)
+    """
+    return CATALOG_ENTRY(
+        docid=doc.docid,
+        doctype=doc.doctype,
+        nb_pages=doc.nb_pages,
+        labels=[(label.name, label.get_color_str()) for label in labels],
+        last_mod=last_mod,
+        filehash=filehash,
+    )
+
+
+class DocCatalog(object):
+    """
+    Compact summary of the indexed documents, stored next to the Whoosh index.
+
+    It contains everything required to rebuild the document list and the
+    label list when starting, without having to look at the work directory:
+    docid, doctype, number of pages, labels (name + color), last
+    modification time and file hash.
+    """
+
+    FILENAME = "catalog.json"
+    VERSION = 1
+
+    def __init__(self, indexdir):
+        self.path = os.path.join(indexdir, self.FILENAME)
+        self._entries = {}  # docid --> CATALOG_ENTRY
+        self.dirty = False
+
+    def load(self):
+        """
+        Read the whole catalog in one go. Returns False if the catalog
+        is missing or unusable (caller is expected to rebuild it).
+        """
+        self._entries = {}
+        self.dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as fd:
+                content = json.load(fd)
+        except FileNotFoundError:  # NOQA (Python 3.x only)
+            logger.info("No document catalog found (%s)", self.path)
+            return False
+        except (OSError, ValueError) as exc:
+            logger.warning("Failed to read document catalog %s."
+                           " Will rebuild it", self.path, exc_info=exc)
+            return False
+
+        if content.get('version') != self.VERSION:
+            logger.info("Document catalog %s is obsolete. Will rebuild it",
+                        self.path)
+            return False
+
+        for (docid, doctype, nb_pages, labels, last_mod, filehash) in \
+                content['docs']:
+            self._entries[docid] = CATALOG_ENTRY(
+                docid=docid, doctype=doctype, nb_pages=nb_pages,
+                labels=[tuple(label) for label in labels],
+                last_mod=last_mod, filehash=filehash
+            )
+        logger.info("Document catalog loaded: %d documents",
+                    len(self._entries))
+        return True
+
+    def save(self):
+        """
+        Write the catalog back on disk (only if it has been modified).
+        """
+        if not self.dirty:
+            return
+        content = {
+            'version': self.VERSION,
+            'docs': [list(entry) for entry in self._entries.values()],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fd:
+            json.dump(content, fd, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        logger.info("Document catalog written: %d documents",
+                    len(self._entries))
+
+    def update_doc(self, doc, labels, last_mod, filehash):
+        """
+        See make_catalog_entry()
+        """
+        entry = make_catalog_entry(doc, labels, last_mod, filehash)
+        self.add_entry(entry)
+        return entry
+
+    def add_entry(self, entry):
+        self._entries[entry.docid] = entry
+        self.dirty = True
+
+    def remove(self, docid):
+        if self._entries.pop(docid, None) is not None:
+            self.dirty = True
+
+    def keep_only(self, docids):
+        """
+        Drop all the entries not in 'docids'
+        """
+        for docid in set(self._entries.keys()).difference(docids):
+            self._entries.pop(docid)
+            self.dirty = True
+
+    def get(self, docid):
+        return self._entries.get(docid)
+
+    def docids(self):
+        return self._entries.keys()
+
+    def values(self):
+        return self._entries.values()
+
+    def __contains__(self, docid):
+        return docid in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -14,12 +14,14 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Paperwork.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import datetime
 import gettext
 import logging
+import threading
 import time
-import hashlib
 
+from ..hashcache import FILE_HASH_CACHE
 from ..labels import Label
 
 
@@ -27,12 +29,126 @@ _ = gettext.gettext
 logger = logging.getLogger(__name__)
 
 
+class DocDirCache(object):
+    """
+    Names of the files in the document directories. Listing a directory is
+    expensive, and the page count and the document type are both deduced
+    from it: each directory is listed at most once per modification. An
+    entry remains valid as long as the stamp of the directory (see
+    fs.getstamp()) doesn't change.
+
+    The stamp is checked on each access, so changes made by other processes
+    are seen too. Code changing the content of a document directory should
+    still call forget(): some file systems have coarse timestamps.
+    """
+
+    DEFAULT_MAX_SIZE = 4096  # directories
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        # path --> (stamp, file names)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_filenames(self, fs, path):
+        """
+        Returns:
+            A tuple of file names (not paths)
+
+        Raises:
+            OSError/IOError if the directory cannot be listed
+        """
+        stamp = fs.getstamp(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        filenames = tuple(info.name for info in fs.enumerate(path, ()))
+
+        with self._lock:
+            self._entries[path] = (stamp, filenames)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return filenames
+
+    def forget(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+DOC_DIR_CACHE = DocDirCache()
+
+
+class PageList(object):
+
+    """
+    Page list of a document. Pages are accessed using the [] operator or by
+    iterating. They are only instantiated when accessed, and then kept
+    (see BasicDoc._make_page()).
+    """
+
+    __slots__ = ("doc", "_pages")
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._pages = {}  # page_nb --> page
+
+    def _get(self, page_nb):
+        page = self._pages.get(page_nb)
+        # the page number of an existing page may have been changed
+        # (see ImgPage.change_index())
+        if page is None or page.page_nb != page_nb:
+            page = self.doc._make_page(page_nb)
+            self._pages[page_nb] = page
+        return page
+
+    def __getitem__(self, idx):
+        nb_pages = len(self)
+        if isinstance(idx, slice):
+            return [self._get(i) for i in range(*idx.indices(nb_pages))]
+        if idx < 0:
+            idx += nb_pages
+        if idx < 0 or idx >= nb_pages:
+            raise IndexError("Page {} not in document {}".format(
+                idx, self.doc
+            ))
+        return self._get(idx)
+
+    def __len__(self):
+        return self.doc.nb_pages
+
+    def __contains__(self, page):
+        return (page.doc == self.doc and 0 <= page.page_nb < len(self))
+
+    def __eq__(self, other):
+        return isinstance(other, PageList) and self.doc == other.doc
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __iter__(self):
+        for page_nb in range(0, len(self)):
+            yield self._get(page_nb)
+
+    def reset(self):
+        """
+        Forget the page objects instantiated so far
+        """
+        self._pages = {}
+
+
 class BasicDoc(object):
     LABEL_FILE = "labels"
     DOCNAME_FORMAT = "%Y%m%d_%H%M_%S"
     EXTRA_TEXT_FILE = "extra.txt"
 
-    pages = []
+    # many documents are kept in memory (index and GUI): no __dict__
+    __slots__ = ("fs", "path", "__docid", "_previous_labels", "_pages")
+
     can_edit = False
 
     def __init__(self, fs, docpath, docid=None):
@@ -63,6 +179,7 @@ class BasicDoc(object):
             self.__docid = docid
             self.path = docpath
 
+        self._pages = None  # see pages
         # We need to keep track of the labels:
         # When updating bayesian filters for label guessing,
         # we need to know the new label list, but also the *previous* label
@@ -85,11 +202,38 @@ class BasicDoc(object):
 
     last_mod = property(__get_last_mod)
 
+    def _get_file_last_mods(self):
+        """
+        Modification times of all the files of the document directory,
+        obtained with a single directory read (instead of one query per
+        file).
+
+        Returns:
+            {file name: modification time (see fs.getmtime())}
+        """
+        return {
+            info.name: info.ctime
+            for info in self.fs.enumerate(self.path, ("ctime",))
+        }
+
     def __get_nb_pages(self):
         return self._get_nb_pages()
 
     nb_pages = property(__get_nb_pages)
 
+    def _make_page(self, page_nb):
+        """
+        Instantiate the page object of the page 'page_nb'
+        """
+        raise NotImplementedError()
+
+    def __get_pages(self):
+        if self._pages is None:
+            self._pages = PageList(self)
+        return self._pages
+
+    pages = property(__get_pages)
+
     def print_page_cb(self, print_op, print_context, page_nb, keep_refs={}):
         """
         Arguments:
@@ -123,6 +267,7 @@ class BasicDoc(object):
         """
         logger.info("Destroying doc: %s" % self.path)
         self.fs.rm_rf(self.path)
+        DOC_DIR_CACHE.forget(self.path)
         logger.info("Done")
 
     def add_label(self, label):
@@ -343,6 +488,7 @@ class BasicDoc(object):
         if self.path != new_docpath:
             logger.info("Changing docid: %s -> %s", self.path, new_docpath)
             self.fs.rename(self.path, new_docpath)
+            DOC_DIR_CACHE.forget(self.path)
             self.path = new_docpath
 
     docid = property(__get_docid, _set_docid)
@@ -387,11 +533,12 @@ class BasicDoc(object):
     extra_text = property(__get_extra_text, __set_extra_text)
 
     @staticmethod
-    def hash_file(fs, path):
-        with fs.open(path, 'rb') as fd:
-            content = fd.read()
-            dochash = hashlib.sha256(content).hexdigest()
-        return int(dochash, 16)
+    def hash_file(fs, path, file_info=None):
+        """
+        Arguments:
+            file_info --- see hashcache.FileHashCache.get_hash()
+        """
+        return int(FILE_HASH_CACHE.get_hash(fs, path, file_info), 16)
 
     def clone(self):
         raise NotImplementedError()
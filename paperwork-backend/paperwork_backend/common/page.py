@@ -14,11 +14,12 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Paperwork.  If not, see <http://www.gnu.org/licenses/>.
 
-from copy import copy
+import collections
 import logging
 import os
 import os.path
 import tempfile
+import threading
 
 import PIL.Image
 
@@ -30,6 +31,63 @@ from ..util import split_words
 logger = logging.getLogger(__name__)
 
 
+class PageTextCache(object):
+    """
+    Text of the pages, as extracted from their box files. Parsing box files
+    is expensive, so each one is parsed at most once per modification: an
+    entry remains valid as long as the stamp of its file (see fs.getstamp())
+    doesn't change.
+    """
+
+    DEFAULT_MAX_SIZE = 1024  # pages
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()  # path --> (stamp, text)
+        self._lock = threading.Lock()
+
+    def get(self, fs, path, extract_func):
+        """
+        Arguments:
+            path --- file from which the text is extracted
+            extract_func --- called to extract the text if it is not
+                already known. Must return a list of lines.
+
+        Returns:
+            A list of lines
+        """
+        try:
+            stamp = fs.getstamp(path)
+        except OSError:
+            return extract_func()
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                return list(entry[1])
+
+        txt = extract_func()
+
+        with self._lock:
+            self._entries[path] = (stamp, list(txt))
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return txt
+
+    def forget(self, path):
+        """
+        Should be called when the file is rewritten (some file systems have
+        coarse timestamps)
+        """
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+PAGE_TEXT_CACHE = PageTextCache()
+
+
 class PageExporter(Exporter):
     def __init__(self, page, img_format='PNG', mime='image/png',
                  valid_exts=['png']):
@@ -143,19 +201,24 @@ class BasicPage(object):
 
     PAGE_ID_SEPARATOR = "|"
 
+    # format --> (mime type, file extensions). Exporters are only
+    # instantiated by build_exporter()
+    EXPORT_FORMATS = collections.OrderedDict([
+        ('PNG', ('image/png', ["png"])),
+        ('JPEG', ('image/jpeg', ["jpeg", "jpg"])),
+    ])
+
+    __slots__ = ("fs", "doc", "page_nb")
+
     def __init__(self, doc, page_nb):
         """
-        Don't create directly. Please use ImgDoc.get_page()
+        Don't create directly. Please use doc.pages
         """
         self.fs = doc.fs
         self.doc = doc
         self.page_nb = page_nb
 
         assert(self.page_nb >= 0)
-        self.__prototype_exporters = {
-            'PNG': PageExporter(self, 'PNG', 'image/png', ["png"]),
-            'JPEG': PageExporter(self, 'JPEG', 'image/jpeg', ["jpeg", "jpg"]),
-        }
 
     def __get_pageid(self):
         return self.doc.docid + self.PAGE_ID_SEPARATOR + str(self.page_nb)
@@ -235,7 +298,7 @@ class BasicPage(object):
         raise NotImplementedError()
 
     def get_export_formats(self):
-        return self.__prototype_exporters.keys()
+        return self.EXPORT_FORMATS.keys()
 
     def build_exporter(self, file_format='PNG', preview_page_nb=0):
         """
@@ -243,7 +306,9 @@ class BasicPage(object):
             preview_page_nb: Juste here for consistency with
                 doc.build_exporter()
         """
-        return copy(self.__prototype_exporters[file_format.upper()])
+        file_format = file_format.upper()
+        (mime, valid_exts) = self.EXPORT_FORMATS[file_format]
+        return PageExporter(self, file_format, mime, valid_exts)
 
     def __str__(self):
         return "%s p%d" % (str(self.doc), self.page_nb + 1)
@@ -29,7 +29,7 @@ from .util import find_language
 
 
 logger = logging.getLogger(__name__)
-FS = fs.GioFileSystem()
+FS = fs.LocalFileSystem()
 
 DEFAULT_OCR_LANG = "eng"  # if really we can't guess anything
 
@@ -127,7 +127,7 @@ class PaperworkConfig(object):
     Paperwork config. See each accessor to know for what purpose each value is
     used.
     """
-    CURRENT_INDEX_VERSION = "7"
+    CURRENT_INDEX_VERSION = "9"
 
     def __init__(self):
         self.settings = {
@@ -3,7 +3,7 @@ from .common.export import dummy_export_progress_cb
 from . import fs
 
 
-FS = fs.GioFileSystem()
+FS = fs.LocalFileSystem()
 
 
 class MultipleDocExporter(Exporter):
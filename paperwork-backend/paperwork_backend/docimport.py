@@ -18,22 +18,44 @@
 Document import (PDF, images, etc)
 """
 
-import gc
+import collections
+import concurrent.futures
 import gettext
 import logging
+import time
 
 from gi.repository import GLib
-from gi.repository import Gio
 from natsort import natsorted
 from PIL import Image
+from PIL import ImageSequence
 
+from .common.doc import DOC_DIR_CACHE
+from .hashcache import FILE_HASH_CACHE
 from .pdf.doc import PdfDoc
+from .pdf.doc import check_pdf
 from .img.doc import ImgDoc
+from .img.page import ImgPage
+from .parallel import get_nb_workers
+from .parallel import make_pool
+from .parallel import split_in_batches
 from . import fs
 
 _ = gettext.gettext
 logger = logging.getLogger(__name__)
 
+# number of PDF files checked by a worker in one go (and looked up at once in
+# the index)
+PDF_IMPORT_BATCH_SIZE = 20
+
+# number of TIFF frames encoded by a worker in one go
+TIFF_FRAMES_PER_JOB = 8
+
+# EXIF tag
+EXIF_ORIENTATION = 0x0112
+
+# image modes that can be saved as JPEG
+JPEG_MODES = ("1", "L", "RGB", "CMYK")
+
 IMG_MIME_TYPES = [
     ("BMP", "image/x-ms-bmp"),
     ("GIF", "image/gif"),
@@ -105,10 +127,297 @@ class ImportResult(object):
         return len(self.new_docs) > 0 or len(self.upd_docs) > 0
 
 
+def _check_pdfs(files):
+    """
+    Run in a worker process (see PdfDirectoryImporter).
+
+    Arguments:
+        files --- [(file_uri, file size), ...]
+
+    Returns:
+        [(file_uri, file size, file hash, number of pages, error), ...]
+        If the file cannot be imported, error is not None.
+    """
+    out = []
+    for (file_uri, size) in files:
+        try:
+            filehash = PdfDoc.hash_file(FS, file_uri)
+        except IOError as exc:
+            logger.warning("Failed to read %s", file_uri, exc_info=exc)
+            out.append((file_uri, size, None, None, str(exc)))
+            continue
+        (nb_pages, error) = check_pdf(file_uri)
+        out.append((file_uri, size, filehash, nb_pages, error))
+    return out
+
+
+def _can_copy_jpeg(img):
+    """
+    Check if an image file can be used as is as a page image file, instead
+    of being decoded and encoded again (slow and lossy).
+
+    Arguments:
+        img --- PIL image, opened but not loaded (only the headers have been
+            read)
+    """
+    if img.format != "JPEG" or img.mode not in ("RGB", "L"):
+        return False
+    (width, height) = img.size
+    if width <= 0 or height <= 0:
+        return False
+    if (Image.MAX_IMAGE_PIXELS is not None and
+            width * height > Image.MAX_IMAGE_PIXELS):
+        return False
+    # page images are always displayed as they are stored: if the EXIF
+    # data say the image must be rotated, it must be transcoded (like
+    # before)
+    try:
+        exif = img._getexif() or {}
+    except Exception as exc:
+        logger.warning("Invalid EXIF data", exc_info=exc)
+        return False
+    return exif.get(EXIF_ORIENTATION, 1) == 1
+
+
+def _get_tmp_uri(dst_uri):
+    """
+    Page image files are written under a temporary name first, and renamed
+    once complete: a failed import must not leave a page file behind (it
+    would be counted as a page and prevent the renumbering of the following
+    ones).
+    """
+    return dst_uri + ".tmp"
+
+
+def _remove_failed_page_file(dst_uri):
+    for uri in (_get_tmp_uri(dst_uri), dst_uri):
+        try:
+            if FS.exists(uri):
+                FS.unlink(uri, trash=False)
+        except Exception as exc:
+            logger.warning("Failed to remove %s", uri, exc_info=exc)
+
+
+def _save_page_img(img, dst_uri):
+    if img.mode not in JPEG_MODES:
+        img = img.convert("RGB")
+    tmp_uri = _get_tmp_uri(dst_uri)
+    with FS.open(tmp_uri, "wb") as fd:
+        img.save(fd, format="JPEG")
+    FS.rename(tmp_uri, dst_uri)
+
+
+def _import_image(files):
+    """
+    Run in a worker process (see _add_image_pages()).
+
+    Arguments:
+        files --- (URI of the image file to import, URI of the page image
+            file)
+
+    Returns:
+        (True if the file has been copied as is, error or None)
+    """
+    (src_uri, dst_uri) = files
+    try:
+        with FS.open(src_uri, "rb") as fd:
+            img = Image.open(fd)
+            passthrough = _can_copy_jpeg(img)
+            if not passthrough:
+                img.load()
+        if passthrough:
+            tmp_uri = _get_tmp_uri(dst_uri)
+            FS.copy(src_uri, tmp_uri, metadata=False)
+            FS.rename(tmp_uri, dst_uri)
+        else:
+            _save_page_img(img, dst_uri)
+        return (passthrough, None)
+    except Exception as exc:
+        logger.warning("Failed to import %s", src_uri, exc_info=exc)
+        _remove_failed_page_file(dst_uri)
+        return (False, str(exc))
+
+
+def _run_jobs(func, jobs, nb_workers=None):
+    """
+    Run the jobs in a pool of worker processes (or in the current process if
+    there is only one job)
+
+    Returns:
+        The results, in the order of the jobs
+    """
+    nb_workers = min(len(jobs), get_nb_workers(nb_workers))
+    if nb_workers <= 1:
+        return [func(job) for job in jobs]
+    with make_pool(nb_workers) as pool:
+        return list(pool.imap(func, jobs))
+
+
+def _register_new_pages(doc, first_page_nb, results):
+    """
+    Must be called once the workers have written the page image files.
+    Page files that couldn't be written leave holes in the page numbers:
+    they are filled by renumbering the following pages.
+
+    Arguments:
+        results --- [(source, error or None), ...], one per page, in page
+            order
+
+    Returns:
+        (sources of the new pages, new pages)
+    """
+    DOC_DIR_CACHE.forget(doc.path)
+
+    sources = []
+    pages = []
+    errors = []
+    for (source, error) in results:
+        page_nb = first_page_nb + len(errors) + len(pages)
+        if error is not None:
+            errors.append((source, error))
+            continue
+        page = ImgPage(doc, page_nb)
+        if len(errors) > 0:
+            # fill the holes left by the pages that couldn't be imported
+            page.change_index(offset=-len(errors))
+        FILE_HASH_CACHE.forget(page.get_doc_file_path())
+        page.boxes = []
+        sources.append(source)
+        pages.append(doc.pages[page.page_nb])
+    if len(pages) <= 0 and len(errors) > 0:
+        if first_page_nb <= 0:
+            doc.destroy()
+        raise Exception("Import of {} failed: {}".format(*errors[0]))
+    if len(errors) > 0:
+        logger.warning("%d page(s) could not be imported in %s",
+                       len(errors), doc)
+    return (sources, pages)
+
+
+def _add_image_pages(doc, file_uris, nb_workers=None):
+    """
+    Add the images at the end of the document, one page per image, in the
+    order of 'file_uris'. JPEG files are copied as is when possible. The
+    other images are transcoded by a pool of worker processes.
+
+    Returns:
+        (imported file URIs, new pages, number of JPEG files copied as is)
+    """
+    doc.fs.mkdir_p(doc.path)
+    first_page_nb = doc.nb_pages
+    # page numbers are assigned now, so the workers can write the page
+    # files directly
+    jobs = [
+        (file_uri, ImgPage(doc, first_page_nb + idx).get_doc_file_path())
+        for (idx, file_uri) in enumerate(file_uris)
+    ]
+    results = _run_jobs(_import_image, jobs, nb_workers)
+    nb_copied = len([
+        passthrough for (passthrough, error) in results
+        if passthrough and error is None
+    ])
+    (imported, pages) = _register_new_pages(doc, first_page_nb, [
+        (file_uri, error)
+        for (file_uri, (passthrough, error)) in zip(file_uris, results)
+    ])
+    logger.info("%d images imported in %s (%d copied as is)",
+                len(pages), doc, nb_copied)
+    return (imported, pages, nb_copied)
+
+
+def _encode_tiff_frames(job):
+    """
+    Run in a worker process (see _add_tiff_pages()). Only one frame is
+    loaded at a time.
+
+    Arguments:
+        job --- (TIFF file URI, number of the first frame,
+            [page image file URI, ...])
+
+    Returns:
+        [error or None, ...] (one per frame)
+    """
+    (tiff_uri, first_frame, dst_uris) = job
+    out = []
+    try:
+        with FS.open(tiff_uri, "rb") as fd:
+            frames = ImageSequence.Iterator(Image.open(fd))
+            for (idx, dst_uri) in enumerate(dst_uris):
+                try:
+                    frame = frames[first_frame + idx]
+                    frame.load()
+                    _save_page_img(frame, dst_uri)
+                    out.append(None)
+                except Exception as exc:
+                    logger.warning("Failed to import frame %d of %s",
+                                   first_frame + idx, tiff_uri, exc_info=exc)
+                    _remove_failed_page_file(dst_uri)
+                    out.append(str(exc))
+    except Exception as exc:
+        logger.warning("Failed to read %s", tiff_uri, exc_info=exc)
+        for dst_uri in dst_uris[len(out):]:
+            _remove_failed_page_file(dst_uri)
+        out += [str(exc)] * (len(dst_uris) - len(out))
+    return out
+
+
+def _add_tiff_pages(doc, tiff_uris, nb_workers=None):
+    """
+    Add all the frames of the TIFF files at the end of the document, one
+    page per frame. The frames are encoded in JPEG by a pool of worker
+    processes, each working on a range of consecutive frames.
+
+    Returns:
+        (imported file URIs, new pages)
+    """
+    doc.fs.mkdir_p(doc.path)
+    first_page_nb = doc.nb_pages
+    page_nb = first_page_nb
+    jobs = []
+    sources = []
+    for tiff_uri in tiff_uris:
+        try:
+            with doc.fs.open(tiff_uri, "rb") as fd:
+                # only reads the frame headers
+                nb_frames = getattr(Image.open(fd), "n_frames", 1)
+        except Exception as exc:
+            # the worker will fail too and report the error
+            logger.warning("Failed to read %s", tiff_uri, exc_info=exc)
+            nb_frames = 1
+        logger.info("%s: %d frames", tiff_uri, nb_frames)
+        for first_frame in range(0, nb_frames, TIFF_FRAMES_PER_JOB):
+            nb_job_frames = min(TIFF_FRAMES_PER_JOB, nb_frames - first_frame)
+            jobs.append((tiff_uri, first_frame, [
+                ImgPage(doc, page_nb + idx).get_doc_file_path()
+                for idx in range(0, nb_job_frames)
+            ]))
+            sources += [tiff_uri] * nb_job_frames
+            page_nb += nb_job_frames
+
+    errors = []
+    for job_errors in _run_jobs(_encode_tiff_frames, jobs, nb_workers):
+        errors += job_errors
+    (sources, pages) = _register_new_pages(
+        doc, first_page_nb, list(zip(sources, errors))
+    )
+    imported = []
+    for source in sources:
+        if source not in imported:
+            imported.append(source)
+    logger.info("%d TIFF frames imported in %s", len(pages), doc)
+    return (imported, pages)
+
+
 class BaseImporter(object):
-    def __init__(self, fs, file_extensions):
+    def __init__(self, fs, file_extensions, nb_workers=None):
+        """
+        Arguments:
+            nb_workers --- degree of parallelism of the importers supporting
+                it. None = one worker per CPU.
+        """
         self.fs = fs
         self.file_extensions = file_extensions
+        self.nb_workers = nb_workers
 
     @staticmethod
     def can_import(file_uris, current_doc=None):
@@ -127,17 +436,24 @@ class BaseImporter(object):
         return []
 
     def check_file_type(self, file_uri):
-        # TODO(Jflesch): should use fs.py
         lfile_uri = file_uri.lower()
         for extension in self.file_extensions:
             if lfile_uri.endswith(extension):
                 return True
-        gfile = Gio.File.new_for_uri(file_uri)
-        info = gfile.query_info(
-            "standard::content-type", Gio.FileQueryInfoFlags.NONE
-        )
-        mime = info.get_content_type()
-        return mime in [m[1] for m in self.get_mime_types()]
+        info = self.fs.get_info(file_uri, ("content_type",))
+        return self.check_file_info(info)
+
+    def check_file_info(self, info):
+        """
+        Same as check_file_type(), but based on the information returned by
+        fs.enumerate() (the content type must have been requested): no
+        extra query.
+        """
+        lname = info.name.lower()
+        for extension in self.file_extensions:
+            if lname.endswith(extension):
+                return True
+        return info.content_type in [m[1] for m in self.get_mime_types()]
 
 
 class PdfImporter(BaseImporter):
@@ -216,11 +532,22 @@ class PdfImporter(BaseImporter):
 
 class PdfDirectoryImporter(BaseImporter):
     """
-    Import many PDF files as many documents
+    Import many PDF files as many documents.
+
+    The import is pipelined: the folder is enumerated while a pool of
+    worker processes hashes and checks the files found so far, the hashes
+    are looked up in the index batch by batch, and the files are copied
+    by a pool of threads.
     """
 
-    def __init__(self, fs):
-        super().__init__(fs, [".pdf"])
+    def __init__(self, fs, nb_workers=None):
+        """
+        Arguments:
+            nb_workers --- number of worker processes hashing and checking
+                the files, and number of threads copying them. None = one
+                per CPU.
+        """
+        super().__init__(fs, [".pdf"], nb_workers)
 
     def can_import(self, file_uris, current_doc=None):
         """
@@ -232,13 +559,26 @@ class PdfDirectoryImporter(BaseImporter):
         try:
             for file_uri in file_uris:
                 file_uri = self.fs.safe(file_uri)
-                for child in self.fs.recurse(file_uri):
-                    if self.check_file_type(child):
+                for child in self.fs.enumerate_recursive(
+                        file_uri, ("content_type",)):
+                    if self.check_file_info(child):
                         return True
-        except GLib.GError:
+        except (GLib.GError, IOError):
             pass
         return False
 
+    def _find_pdfs(self, file_uris):
+        """
+        Yields:
+            (file_uri, file size)
+        """
+        for file_uri in file_uris:
+            logger.info("Importing PDF from '%s'" % (file_uri))
+            for child in self.fs.enumerate_recursive(
+                    file_uri, ("size", "content_type")):
+                if self.check_file_info(child):
+                    yield (child.uri, child.size)
+
     def import_doc(self, file_uris, docsearch, current_doc=None):
         """
         Import the specified PDF files
@@ -247,32 +587,71 @@ class PdfDirectoryImporter(BaseImporter):
         doc = None
         docs = []
         pages = []
+        imported = []
+        filehashes = set()
+        nb_files = 0
+        nb_bytes = 0
+        start = time.time()
 
         file_uris = [self.fs.safe(uri) for uri in file_uris]
-        imported = []
-        for file_uri in file_uris:
-            logger.info("Importing PDF from '%s'" % (file_uri))
-            idx = 0
+        nb_threads = get_nb_workers(self.nb_workers)
+        # copies not checked yet: (file URI, new document, future)
+        copies = collections.deque()
+        try:
+            with make_pool(self.nb_workers) as pool, \
+                    concurrent.futures.ThreadPoolExecutor(
+                        nb_threads) as copiers:
+                batches = split_in_batches(
+                    self._find_pdfs(file_uris), PDF_IMPORT_BATCH_SIZE
+                )
+                for results in pool.imap(_check_pdfs, batches):
+                    in_index = docsearch.get_hashes_in_index([
+                        result[2] for result in results
+                        if result[2] is not None
+                    ])
+                    for (child, size, filehash, nb_pages, error) in results:
+                        nb_files += 1
+                        nb_bytes += size
+                        if error is not None:
+                            continue
+                        if filehash in in_index or filehash in filehashes:
+                            logger.info(
+                                "Document %s already found in the index."
+                                " Skipped", child
+                            )
+                            continue
+                        filehashes.add(filehash)
+                        # document ids must be allocated one at a time
+                        new_doc = PdfDoc(self.fs, docsearch.rootdir)
+                        self.fs.mkdir_p(new_doc.path)
+                        copies.append((
+                            child, new_doc,
+                            copiers.submit(new_doc.copy_pdf, child, nb_pages)
+                        ))
+                    self._log_speed(start, nb_files, nb_bytes)
+                while len(copies) > 0:
+                    (child, new_doc, future) = copies[0]
+                    try:
+                        future.result()
+                    except IOError as exc:
+                        logger.warning("Failed to import %s", child,
+                                       exc_info=exc)
+                        self._remove_doc_dir(new_doc)
+                    else:
+                        imported.append(child)
+                        docs.append(new_doc)
+                        doc = new_doc
+                    copies.popleft()
+        finally:
+            # import interrupted: the copies still running have been waited
+            # for when leaving the thread pool
+            for (child, new_doc, future) in copies:
+                future.cancel()
+                self._remove_doc_dir(new_doc)
+        for doc in docs:
+            pages += [p for p in doc.pages]
+        (files_per_s, bytes_per_s) = self._log_speed(start, nb_files, nb_bytes)
 
-            for child in self.fs.recurse(file_uri):
-                gc.collect()
-                if not self.check_file_type(child):
-                    continue
-                h = PdfDoc.hash_file(self.fs, child)
-                if docsearch.is_hash_in_index(h):
-                    logger.info(
-                        "Document %s already found in the index. Skipped",
-                        child
-                    )
-                    continue
-                imported.append(child)
-                doc = PdfDoc(self.fs, docsearch.rootdir)
-                error = doc.import_pdf(child)
-                if error:
-                    continue
-                docs.append(doc)
-                pages += [p for p in doc.pages]
-                idx += 1
         return ImportResult(
             imported_file_uris=imported,
             select_doc=doc, new_docs=docs,
@@ -280,10 +659,27 @@ class PdfDirectoryImporter(BaseImporter):
             stats={
                 _("PDF"): len(docs),
                 _("Document(s)"): len(docs),
-                _("Page(s)"): sum([d.nb_pages for d in docs]),
+                _("Page(s)"): len(pages),
+                _("File(s)/s"): round(files_per_s, 1),
+                _("MB/s"): round(bytes_per_s / 1024 / 1024, 1),
             },
         )
 
+    def _remove_doc_dir(self, doc):
+        try:
+            self.fs.rm_rf(doc.path, trash=False)
+        except IOError as exc:
+            logger.warning("Failed to remove %s", doc.path, exc_info=exc)
+
+    @staticmethod
+    def _log_speed(start, nb_files, nb_bytes):
+        duration = max(time.time() - start, 0.001)
+        files_per_s = nb_files / duration
+        bytes_per_s = nb_bytes / duration
+        logger.info("PDF import: %d files examined (%.1f files/s,"
+                    " %.1f bytes/s)", nb_files, files_per_s, bytes_per_s)
+        return (files_per_s, bytes_per_s)
+
     @staticmethod
     def get_select_mime_types():
         return [
@@ -318,10 +714,11 @@ class ImageDirectoryImporter(BaseImporter):
         try:
             for file_uri in file_uris:
                 file_uri = self.fs.safe(file_uri)
-                for child in self.fs.recurse(file_uri):
-                    if self.check_file_type(child):
+                for child in self.fs.enumerate_recursive(
+                        file_uri, ("content_type",)):
+                    if self.check_file_info(child):
                         return True
-        except GLib.GError:
+        except (GLib.GError, IOError):
             pass
         return False
 
@@ -344,28 +741,33 @@ class ImageDirectoryImporter(BaseImporter):
         page = None
 
         file_uris = natsorted(file_uris)
-        imported = []
+        to_import = []
 
         for file_uri in file_uris:
             file_uri = self.fs.safe(file_uri)
             logger.info("Importing images from '%s'" % (file_uri))
 
-            for child in self.fs.recurse(file_uri):
-                if ".thumb." in child:
+            children = []
+            for child in self.fs.enumerate_recursive(
+                    file_uri, ("content_type",)):
+                if ".thumb." in child.name:
                     # We are re-importing an old document --> ignore thumbnails
-                    logger.info("{} ignored".format(child))
+                    logger.info("{} ignored".format(child.uri))
                     continue
-                if not self.check_file_type(child):
+                if not self.check_file_info(child):
                     continue
-                imported.append(child)
-                with self.fs.open(child, "rb") as fd:
-                    img = Image.open(fd)
-                    img.load()
-                page = current_doc.add_page(img, [])
-                if new_docs == []:
-                    upd_docs_pages.append(page)
-                else:
-                    new_docs_pages.append(page)
+                children.append(child.uri)
+            to_import += natsorted(children)
+
+        (imported, pages, nb_copied) = _add_image_pages(
+            current_doc, to_import, self.nb_workers
+        )
+        if len(pages) > 0:
+            page = pages[-1]
+        if new_docs == []:
+            upd_docs_pages = pages
+        else:
+            new_docs_pages = pages
 
         return ImportResult(
             imported_file_uris=imported,
@@ -374,7 +776,8 @@ class ImageDirectoryImporter(BaseImporter):
             new_docs_pages=new_docs_pages,
             upd_docs_pages=upd_docs_pages,
             stats={
-                _("Image file(s)"): len(file_uris),
+                _("Image file(s)"): len(imported),
+                _("JPEG file(s) copied as is"): nb_copied,
                 _("Document(s)"): 0 if new_docs == [] else 1,
                 _("Page(s)"): len(new_docs_pages) + len(upd_docs_pages),
             }
@@ -396,6 +799,91 @@ class ImageDirectoryImporter(BaseImporter):
         )
 
 
+class TiffImporter(BaseImporter):
+    """
+    Import TIFF files, with all their frames (multi-page scans, faxes, etc).
+    They are added to the current document if it can be edited, or as a new
+    document.
+    """
+
+    MIME_TYPES = [
+        ("TIFF", "image/tiff"),
+    ]
+
+    def __init__(self, fs):
+        super().__init__(fs, [".tif", ".tiff"])
+
+    def can_import(self, file_uris, current_doc=None):
+        """
+        Check that all the specified files look like TIFF files
+        """
+        if len(file_uris) <= 0:
+            return False
+        try:
+            for file_uri in file_uris:
+                file_uri = self.fs.safe(file_uri)
+                if not self.check_file_type(file_uri):
+                    return False
+        except (GLib.GError, IOError):
+            return False
+        return True
+
+    def import_doc(self, file_uris, docsearch, current_doc=None):
+        """
+        Import all the frames of the specified TIFF files
+        """
+        if (current_doc is None or
+                current_doc.is_new or
+                not current_doc.can_edit):
+            if not current_doc or not current_doc.can_edit:
+                current_doc = ImgDoc(self.fs, docsearch.rootdir)
+            new_docs = [current_doc]
+            upd_docs = []
+        else:
+            new_docs = []
+            upd_docs = [current_doc]
+        new_docs_pages = []
+        upd_docs_pages = []
+        page = None
+
+        file_uris = [self.fs.safe(uri) for uri in file_uris]
+        logger.info("Importing TIFF files %s", file_uris)
+        (imported, pages) = _add_tiff_pages(
+            current_doc, file_uris, self.nb_workers
+        )
+        if len(pages) > 0:
+            page = pages[-1]
+        if new_docs == []:
+            upd_docs_pages = pages
+        else:
+            new_docs_pages = pages
+
+        return ImportResult(
+            imported_file_uris=imported,
+            select_doc=current_doc, select_page=page,
+            new_docs=new_docs, upd_docs=upd_docs,
+            new_docs_pages=new_docs_pages,
+            upd_docs_pages=upd_docs_pages,
+            stats={
+                _("Image file(s)"): len(imported),
+                _("Document(s)"): 0 if new_docs == [] else 1,
+                _("Page(s)"): len(new_docs_pages) + len(upd_docs_pages),
+            }
+        )
+
+    @staticmethod
+    def get_select_mime_types():
+        return TiffImporter.MIME_TYPES
+
+    @staticmethod
+    def get_mime_types():
+        return TiffImporter.MIME_TYPES
+
+    def __str__(self):
+        return _("Append all the pages of the TIFF file(s) to the current"
+                 " document")
+
+
 class ImageImporter(BaseImporter):
     """
     Import a single image file (in a format supported by PIL). It is either
@@ -416,6 +904,9 @@ class ImageImporter(BaseImporter):
             file_uri = self.fs.safe(file_uri)
             if not self.check_file_type(file_uri):
                 return False
+        # TIFF files may contain many pages: TiffImporter takes care of them
+        if TiffImporter(self.fs).can_import(file_uris, current_doc):
+            return False
         return True
 
     def import_doc(self, file_uris, docsearch, current_doc=None):
@@ -437,27 +928,26 @@ class ImageImporter(BaseImporter):
         page = None
 
         file_uris = [self.fs.safe(uri) for uri in file_uris]
-        for file_uri in file_uris:
-            logger.info("Importing image '%s'" % (file_uri))
-
-            with self.fs.open(file_uri, "rb") as fd:
-                img = Image.open(fd)
-                img.load()
-            page = current_doc.add_page(img, [])
-
-            if new_docs == []:
-                upd_docs_pages.append(page)
-            else:
-                new_docs_pages.append(page)
+        logger.info("Importing images %s", file_uris)
+        (imported, pages, nb_copied) = _add_image_pages(
+            current_doc, file_uris, self.nb_workers
+        )
+        if len(pages) > 0:
+            page = pages[-1]
+        if new_docs == []:
+            upd_docs_pages = pages
+        else:
+            new_docs_pages = pages
 
         return ImportResult(
-            imported_file_uris=file_uris,
+            imported_file_uris=imported,
             select_doc=current_doc, select_page=page,
             new_docs=new_docs, upd_docs=upd_docs,
             new_docs_pages=new_docs_pages,
             upd_docs_pages=upd_docs_pages,
             stats={
-                _("Image file(s)"): len(file_uris),
+                _("Image file(s)"): len(imported),
+                _("JPEG file(s) copied as is"): nb_copied,
                 _("Document(s)"): 0 if new_docs == [] else 1,
                 _("Page(s)"): len(new_docs_pages) + len(upd_docs_pages),
             }
@@ -475,11 +965,12 @@ class ImageImporter(BaseImporter):
         return _("Append the image to the current document")
 
 
-FS = fs.GioFileSystem()
+FS = fs.LocalFileSystem()
 IMPORTERS = [
     PdfDirectoryImporter(FS),
     PdfImporter(FS),
     ImageDirectoryImporter(FS),
+    TiffImporter(FS),
     ImageImporter(FS),
 ]
 
@@ -22,11 +22,14 @@ suggestions)
 import gc
 import logging
 import os.path
+import time
 
 import gi
 from gi.repository import GObject
 
 from . import fs
+from . import rebuild
+from . import rescan
 from .index import PaperworkIndexClient
 from .util import dummy_progress_cb
 
@@ -51,7 +54,7 @@ class DummyDocSearch(object):
     label_list = []
 
     def __init__(self):
-        self.fs = fs.GioFileSystem()
+        self.fs = fs.LocalFileSystem()
 
     @staticmethod
     def get_doc_examiner(*args, **kwargs):
@@ -73,6 +76,11 @@ class DummyDocSearch(object):
         """ Do nothing """
         return []
 
+    @staticmethod
+    def find_documents_ids(*args, **kwargs):
+        """ Do nothing """
+        return []
+
     @staticmethod
     def create_label(*args, **kwargs):
         """ Do nothing """
@@ -108,11 +116,21 @@ class DummyDocSearch(object):
         """ Do nothing """
         assert()
 
+    @staticmethod
+    def get_hashes_in_index(*args, **kwargs):
+        """ Do nothing """
+        assert()
+
     @staticmethod
     def guess_labels(*args, **kwargs):
         """ Do nothing """
         assert()
 
+    @staticmethod
+    def guess_labels_many(*args, **kwargs):
+        """ Do nothing """
+        assert()
+
     @staticmethod
     def get(*args, **kwargs):
         """ Do nothing """
@@ -126,6 +144,9 @@ class DummyDocSearch(object):
     def set_language(self, language):
         return
 
+    def set_write_behind(self, enabled):
+        return
+
     @staticmethod
     def close(*args, **kwargs):
         """ Do nothing """
@@ -151,21 +172,32 @@ class DocDirExaminer(GObject.GObject):
                         on_doc_modified,
                         on_doc_deleted,
                         on_doc_unchanged,
-                        progress_cb=dummy_progress_cb):
+                        progress_cb=dummy_progress_cb,
+                        nb_workers=1):
         """
         Examine the rootdir.
         Calls on_new_doc(doc), on_doc_modified(doc), on_doc_deleted(docid)
         every time a new, modified, or deleted document is found
+
+        Arguments:
+            nb_workers --- if not 1, the document directories are examined
+                by a pool of worker processes (None = one per CPU)
         """
+        if nb_workers != 1:
+            self._examine_rootdir_parallel(
+                on_new_doc, on_doc_modified, on_doc_deleted,
+                on_doc_unchanged, progress_cb, nb_workers
+            )
+            return
 
         count = self.docsearch.index.start_examine_rootdir()
 
         progress = 0
-        while True:
-            (status, doc) = self.docsearch.index.continue_examine_rootdir()
-            if status == 'end':
-                break
-            elif status == 'modified':
+        steps = self.docsearch.index.iter_steps(
+            'continue_examine_rootdir', ('end', None)
+        )
+        for (status, doc) in steps:
+            if status == 'modified':
                 on_doc_modified(doc)
             elif status == 'unchanged':
                 on_doc_unchanged(doc)
@@ -175,15 +207,44 @@ class DocDirExaminer(GObject.GObject):
                         DocSearch.INDEX_STEP_CHECKING, doc)
             progress += 1
 
-        while True:
-            (status, doc) = self.docsearch.index.continue_examine_rootdir2()
-            if status == 'end':
-                break
+        steps = self.docsearch.index.iter_steps(
+            'continue_examine_rootdir2', ('end', None)
+        )
+        for (status, doc) in steps:
             on_doc_deleted(doc)
 
         progress_cb(1, 1, DocSearch.INDEX_STEP_CHECKING)
         self.docsearch.index.end_examine_rootdir()
 
+    def _examine_rootdir_parallel(self, on_new_doc, on_doc_modified,
+                                  on_doc_deleted, on_doc_unchanged,
+                                  progress_cb, nb_workers):
+        callbacks = {
+            'new': on_new_doc,
+            'modified': on_doc_modified,
+            'unchanged': on_doc_unchanged,
+            'deleted': on_doc_deleted,
+        }
+
+        old_doc_infos = self.docsearch.index.get_indexed_doc_infos()
+
+        chunks = rescan.examine_rootdir(
+            self.docsearch.fs, self.docsearch.rootdir, old_doc_infos,
+            nb_workers=nb_workers
+        )
+        progress = 0
+        for (count, chunk) in chunks:
+            for (status, doc) in chunk:
+                if status in callbacks:
+                    callbacks[status](doc)
+                if status == 'deleted':
+                    continue
+                progress_cb(progress, count,
+                            DocSearch.INDEX_STEP_CHECKING, doc)
+                progress += 1
+
+        progress_cb(1, 1, DocSearch.INDEX_STEP_CHECKING)
+
 
 class DocIndexUpdater(GObject.GObject):
     """
@@ -213,6 +274,22 @@ class DocIndexUpdater(GObject.GObject):
         self.docsearch.index.upd_doc(doc, index_update=index_update,
                                      label_guesser_update=label_guesser_update)
 
+    def upd_docs(self, docs, index_update=True, label_guesser_update=True):
+        """
+        Update many documents in the index, with a single message to the
+        index process
+        """
+        logger.info("Updating %d modified docs", len(docs))
+        kwargs = {
+            "index_update": index_update,
+            "label_guesser_update": label_guesser_update,
+        }
+        self.docsearch.index.remote_call_many([
+            # make sure they can be serialized safely
+            ("upd_doc", (doc.clone(),), kwargs)
+            for doc in docs
+        ])
+
     def del_doc(self, doc):
         """
         Delete a document
@@ -249,6 +326,7 @@ class DocSearch(object):
     INDEX_STEP_CHECKING = "checking"
     INDEX_STEP_READING = "checking"
     INDEX_STEP_COMMIT = "commit"
+    INDEX_STEP_REBUILDING = "rebuilding"
     LABEL_STEP_UPDATING = "label updating"
     LABEL_STEP_DESTROYING = "label deletion"
 
@@ -262,7 +340,7 @@ class DocSearch(object):
         else:
             self.index = PaperworkIndexClient()
 
-        self.fs = fs.GioFileSystem()
+        self.fs = fs.LocalFileSystem()
         self.rootdir = self.fs.safe(rootdir)
 
         localdir = os.path.expanduser("~/.local")
@@ -274,6 +352,7 @@ class DocSearch(object):
             indexdir = os.path.join(base_data_dir, "paperwork")
 
         indexdir = os.path.join(indexdir, "index")
+        self.indexdir = indexdir
         label_guesser_dir = os.path.join(indexdir, "label_guessing")
         self.index.open(localdir, base_data_dir, indexdir, label_guesser_dir,
                         rootdir, language=language)
@@ -281,6 +360,31 @@ class DocSearch(object):
     def set_language(self, language):
         self.index.set_language(language)
 
+    def rebuild_index(self, progress_cb=dummy_progress_cb, nb_workers=None):
+        """
+        Rebuild the whole index from the content of the work directory,
+        using a pool of worker processes (None = one per CPU).
+
+        progress_cb is called with the step INDEX_STEP_REBUILDING, and the
+        throughput (documents / second) instead of a document.
+        """
+        start = time.monotonic()
+        for (done, total) in rebuild.rebuild_index(self.index, self.fs,
+                                                   self.rootdir,
+                                                   nb_workers=nb_workers):
+            elapsed = time.monotonic() - start
+            throughput = (done / elapsed) if elapsed > 0 else 0.0
+            progress_cb(done, total, self.INDEX_STEP_REBUILDING, throughput)
+        logger.info("Index rebuilt in %.1fs", time.monotonic() - start)
+
+    def set_write_behind(self, enabled):
+        """
+        In write-behind mode, label changes on single documents are
+        buffered and written on disk later, in batches (see
+        PaperworkIndex.set_write_behind()). close() and stop() flush them.
+        """
+        self.index.set_write_behind(enabled)
+
     def get_doc_examiner(self):
         """
         Return an object useful to find added/modified/removed documents
@@ -305,6 +409,15 @@ class DocSearch(object):
         doc = doc.clone()  # make sure it can be serialized safely
         return self.index.guess_labels(doc)
 
+    def guess_labels_many(self, docids, nb_threads=None):
+        """
+        return a prediction of labels for each of the documents
+
+        Returns:
+            {docid: set of labels, ...}
+        """
+        return self.index.guess_labels_many(docids, nb_threads)
+
     def reload_index(self, progress_cb=dummy_progress_cb):
         """
         Read the index, and load the document list from it
@@ -320,7 +433,7 @@ class DocSearch(object):
         """
         nb_results = self.index.start_reload_index()
         progress = 0
-        while self.index.continue_reload_index():
+        for _ in self.index.iter_steps('continue_reload_index', False):
             progress_cb(progress, nb_results, self.INDEX_STEP_LOADING)
             progress += 1
         progress_cb(1, 1, self.INDEX_STEP_LOADING)
@@ -356,7 +469,24 @@ class DocSearch(object):
                                          must_sort=must_sort,
                                          search_type=search_type)
 
-    def find_suggestions(self, sentence):
+    def find_documents_ids(self, sentence, limit=None, must_sort=True,
+                           search_type='fuzzy', offset=0, sort='score'):
+        """
+        Returns lightweight search results (see index.SEARCH_RESULT)
+        instead of documents. Documents can be obtained afterwards with
+        get_doc_from_docid().
+
+        Arguments:
+            offset, limit --- page of results to return
+            sort --- 'score' (most relevant first) or 'date' (most recent
+                first)
+        """
+        return self.index.find_documents_ids(sentence, limit=limit,
+                                             must_sort=must_sort,
+                                             search_type=search_type,
+                                             offset=offset, sort=sort)
+
+    def find_suggestions(self, sentence, budget=None):
         """
         Search all possible suggestions. Suggestions returned always have at
         least one document matching.
@@ -364,11 +494,20 @@ class DocSearch(object):
         Arguments:
             sentence --- keywords (single strings) for which we want
                 suggestions
+            budget --- maximum time (in seconds) to spend looking for
+                suggestions (None = no limit)
         Return:
             An array of sets of keywords. Each set of keywords (-> one string)
-            is a suggestion.
+            is a suggestion. Best suggestions come first.
         """
-        return self.index.find_suggestions(sentence)
+        return self.index.find_suggestions(sentence, budget=budget)
+
+    def get_query_cache_stats(self):
+        """
+        Statistics regarding the cache of search results: generation, size,
+        max_size, hits, misses
+        """
+        return self.index.get_query_cache_stats()
 
     def create_label(self, label, doc=None, callback=dummy_progress_cb):
         """
@@ -409,14 +548,16 @@ class DocSearch(object):
         updating the index.
         """
         current = 0
-        total = self.index.get_nb_docs()
-        self.index.start_update_label(old_label, new_label)
-        while True:
-            (op, doc) = self.index.continue_update_label()
-            if op == 'end':
-                break
-            callback(current, total, self.LABEL_STEP_UPDATING, doc)
-            current += 1
+        # only the documents having the label are updated
+        total = self.index.start_update_label(old_label, new_label)
+        try:
+            for (op, doc) in self.index.iter_steps('continue_update_label',
+                                                   ('end', None)):
+                callback(current, total, self.LABEL_STEP_UPDATING, doc)
+                current += 1
+        except BaseException:
+            self.index.abort_label_mutation()
+            raise
         self.index.end_update_label()
 
     def destroy_label(self, label, callback=dummy_progress_cb):
@@ -425,14 +566,16 @@ class DocSearch(object):
         the index.
         """
         current = 0
-        total = self.index.get_nb_docs()
-        self.index.start_destroy_label(label)
-        while True:
-            (op, doc) = self.index.continue_destroy_label()
-            if op == 'end':
-                break
-            callback(current, total, self.LABEL_STEP_DESTROYING, doc)
-            current += 1
+        # only the documents having the label are updated
+        total = self.index.start_destroy_label(label)
+        try:
+            for (op, doc) in self.index.iter_steps('continue_destroy_label',
+                                                   ('end', None)):
+                callback(current, total, self.LABEL_STEP_DESTROYING, doc)
+                current += 1
+        except BaseException:
+            self.index.abort_label_mutation()
+            raise
         self.index.end_destroy_label()
 
     def close(self):
@@ -459,6 +602,15 @@ class DocSearch(object):
         """
         return self.index.is_hash_in_index(filehash)
 
+    def get_hashes_in_index(self, filehashes):
+        """
+        Same as is_hash_in_index(), but for many file hashes at once
+
+        Returns:
+            The file hashes used by some documents
+        """
+        return self.index.get_hashes_in_index(filehashes)
+
     def __get_label_list(self):
         return self.index.get_label_list()
 
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
+import collections
+import errno
 import io
 import logging
+import mimetypes
+import mmap
 import os
-import urllib
+import shutil
+import stat
+import urllib.parse
 
 from gi.repository import Gio
 from gi.repository import GLib
@@ -11,6 +17,65 @@ from gi.repository import GLib
 logger = logging.getLogger(__name__)
 
 
+# See GioFileSystem.enumerate(). Attributes that haven't been requested are
+# None.
+FILE_INFO = collections.namedtuple(
+    "FILE_INFO",
+    ["uri", "name", "is_dir", "size", "mtime", "ctime", "content_type",
+     "stamp"]
+)
+
+# ctime is what getmtime() returns. stamp is what getstamp() returns.
+FILE_ATTRIBUTES = ("size", "mtime", "ctime", "content_type", "stamp")
+
+# see getstamp()
+GIO_STAMP_ATTRIBUTES = (
+    Gio.FILE_ATTRIBUTE_TIME_MODIFIED,
+    Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC,
+    Gio.FILE_ATTRIBUTE_TIME_CHANGED,
+    Gio.FILE_ATTRIBUTE_TIME_CHANGED_USEC,
+    Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
+    Gio.FILE_ATTRIBUTE_UNIX_INODE,
+)
+
+GIO_FILE_ATTRIBUTES = {
+    "size": Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
+    "mtime": Gio.FILE_ATTRIBUTE_TIME_MODIFIED,
+    "ctime": Gio.FILE_ATTRIBUTE_TIME_CHANGED,
+    "content_type": Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE,
+    "stamp": ",".join(GIO_STAMP_ATTRIBUTES),
+}
+
+# size of the chunks read at once from Gio streams
+READ_CHUNK_SIZE = 256 * 1024
+
+# see _can_gio_read_into()
+_GIO_READ_INTO = None
+
+
+def _can_gio_read_into():
+    """
+    Depending on the version of PyGObject, Gio.InputStream.read() either
+    fills the buffer it is given, or only a temporary copy of it. Check once
+    which one it is.
+    """
+    global _GIO_READ_INTO
+    if _GIO_READ_INTO is None:
+        buf = bytearray(1)
+        try:
+            stream = Gio.MemoryInputStream.new_from_bytes(
+                GLib.Bytes.new(b"\x01")
+            )
+            _GIO_READ_INTO = (
+                stream.read(memoryview(buf), None) == 1 and buf[0] == 1
+            )
+        except (TypeError, GLib.GError):
+            _GIO_READ_INTO = False
+        logger.info("Gio.InputStream.read() into buffers: %s",
+                    _GIO_READ_INTO)
+    return _GIO_READ_INTO
+
+
 class GioFileAdapter(io.RawIOBase):
     def __init__(self, gfile, mode='r'):
         super().__init__()
@@ -63,26 +128,52 @@ class GioFileAdapter(io.RawIOBase):
     def read(self, size=-1):
         if not self.readable():
             raise OSError("File is not readable")
-        if size <= 0:
-            size = self.size
-            if size <= 0:
-                return b""
-        assert(size > 0)
+        if size is None or size < 0:
+            return self.readall()
+        if size == 0:
+            return b""
         return self.gin.read_bytes(size).get_data()
 
     def readall(self):
-        return self.read(-1)
+        # chunk by chunk: Gio streams may return less than what has been
+        # requested anyway
+        chunks = []
+        while True:
+            chunk = self.gin.read_bytes(READ_CHUNK_SIZE).get_data()
+            if len(chunk) <= 0:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
 
     def readinto(self, b):
-        raise OSError("readinto() not supported on Gio.File objects")
+        b = memoryview(b).cast("B")
+        if len(b) <= 0:
+            return 0
+        if _can_gio_read_into():
+            # straight into the caller's buffer: no intermediate copy
+            return self.gin.read(b, None)
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
 
     def readline(self, size=-1):
-        raise OSError("readline() not supported on Gio.File objects")
-
-    def readlines(self, hint=-1):
-        logger.warning("readlines() shouldn't be called on a binary file"
-                       " descriptor. This is not cross-platform")
-        return [(x + b"\n") for x in self.readall().split(b"\n")]
+        line = bytearray()
+        while size is None or size < 0 or len(line) < size:
+            chunk_size = READ_CHUNK_SIZE
+            if size is not None and size >= 0:
+                chunk_size = min(chunk_size, size - len(line))
+            chunk = self.read(chunk_size)
+            if len(chunk) <= 0:
+                break
+            end = chunk.find(b"\n")
+            if end >= 0:
+                end += 1
+                line += chunk[:end]
+                # give back what we have read after the end of the line
+                self.seek(end - len(chunk), os.SEEK_CUR)
+                break
+            line += chunk
+        return bytes(line)
 
     def seek(self, offset, whence=os.SEEK_SET):
         whence = {
@@ -91,6 +182,7 @@ class GioFileAdapter(io.RawIOBase):
             os.SEEK_SET: GLib.SeekType.SET,
         }[whence]
         self.gfd.seek(offset, whence)
+        return self.gfd.tell()
 
     def seekable(self):
         return True
@@ -124,6 +216,8 @@ class GioFileAdapter(io.RawIOBase):
         self.write(b"".join(lines))
 
     def close(self):
+        if self.closed:
+            return
         self.flush()
         super().close()
         if self.gin:
@@ -164,16 +258,20 @@ class GioUTF8FileAdapter(io.RawIOBase):
         return r.decode("utf-8")
 
     def readlines(self, hint=-1):
-        all = self.readall()
-        if os.linesep != "\n":
-            all = all.replace(os.linesep, "\n")
-        lines = [(x + "\n") for x in all.split("\n")]
-        if lines[-1] == "\n":
-            return lines[:-1]
+        lines = []
+        total = 0
+        for line in iter(self.readline, ""):
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
         return lines
 
     def readline(self, hint=-1):
-        raise OSError("readline() not supported on Gio.File objects")
+        line = self.raw.readline(hint).decode("utf-8")
+        if os.linesep != "\n":
+            line = line.replace(os.linesep, "\n")
+        return line
 
     def seek(self, *args, **kwargs):
         return self.raw.seek(*args, **kwargs)
@@ -266,6 +364,12 @@ class GioFileSystem(object):
             raise IOError("File does not exist")
         try:
             raw = GioFileAdapter(f, mode)
+            if 'w' not in mode and 'a' not in mode:
+                # read-only: let Python buffer the reads
+                raw = io.BufferedReader(raw, READ_CHUNK_SIZE)
+                if 'b' in mode:
+                    return raw
+                return io.TextIOWrapper(raw, encoding="utf-8")
             if 'b' in mode:
                 return raw
             return GioUTF8FileAdapter(raw)
@@ -273,6 +377,18 @@ class GioFileSystem(object):
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
 
+    def open_mapped(self, uri):
+        """
+        Read-only access to the whole content of a file, without copying it
+        in memory if possible (memory-mapped).
+
+        Returns:
+            A bytes-like object (buffer protocol), to be used as a context
+            manager so it gets released.
+        """
+        with self.open(uri, 'rb') as fd:
+            return memoryview(fd.read())
+
     def join(self, base, url):
         if not base.endswith("/"):
             base += "/"
@@ -310,6 +426,112 @@ class GioFileSystem(object):
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
 
+    @staticmethod
+    def _get_gio_attributes(attributes):
+        return ",".join(
+            [Gio.FILE_ATTRIBUTE_STANDARD_NAME,
+             Gio.FILE_ATTRIBUTE_STANDARD_TYPE] +
+            [GIO_FILE_ATTRIBUTES[attr] for attr in attributes]
+        )
+
+    @staticmethod
+    def _make_info(uri, info, attributes):
+        return FILE_INFO(
+            uri=uri,
+            name=info.get_name(),
+            is_dir=(info.get_file_type() == Gio.FileType.DIRECTORY),
+            size=(
+                info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_STANDARD_SIZE)
+                if "size" in attributes else None
+            ),
+            mtime=(
+                info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+                if "mtime" in attributes else None
+            ),
+            ctime=(
+                info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_CHANGED)
+                if "ctime" in attributes else None
+            ),
+            content_type=(
+                info.get_content_type()
+                if "content_type" in attributes else None
+            ),
+            stamp=(
+                GioFileSystem._get_gio_stamp(info)
+                if "stamp" in attributes else None
+            ),
+        )
+
+    @staticmethod
+    def _get_gio_stamp(info):
+        return tuple(
+            info.get_attribute_as_string(attr)
+            for attr in GIO_STAMP_ATTRIBUTES
+        )
+
+    def enumerate(self, url, attributes=FILE_ATTRIBUTES):
+        """
+        Same as listdir(), but the information about the children are
+        obtained at the same time, in a single directory read.
+
+        Arguments:
+            attributes --- attributes (see FILE_ATTRIBUTES) to get. Only
+                request the ones you need: some are expensive
+                (content_type)
+
+        Yields:
+            FILE_INFO
+        """
+        try:
+            f = Gio.File.new_for_uri(url)
+            children = f.enumerate_children(
+                self._get_gio_attributes(attributes),
+                Gio.FileQueryInfoFlags.NONE, None
+            )
+            for child in children:
+                uri = f.get_child(child.get_name()).get_uri()
+                yield self._make_info(uri, child, attributes)
+        except GLib.GError as exc:
+            logger.warning("Gio.Gerror", exc_info=exc)
+            raise IOError(str(exc))
+
+    def get_info(self, url, attributes=FILE_ATTRIBUTES):
+        """
+        Same as enumerate(), but for a single file
+
+        Returns:
+            FILE_INFO
+        """
+        try:
+            f = Gio.File.new_for_uri(url)
+            info = f.query_info(
+                self._get_gio_attributes(attributes),
+                Gio.FileQueryInfoFlags.NONE
+            )
+            return self._make_info(url, info, attributes)
+        except GLib.GError as exc:
+            logger.warning("Gio.Gerror", exc_info=exc)
+            raise IOError(str(exc))
+
+    def enumerate_recursive(self, url, attributes=FILE_ATTRIBUTES):
+        """
+        Same as recurse(), but using enumerate(): one directory read per
+        directory, whatever the number of files in it.
+
+        Yields:
+            FILE_INFO of all the files (not the directories), depth first.
+            If url points to a file, only the information about this file.
+        """
+        info = self.get_info(url, attributes)
+        if not info.is_dir:
+            yield info
+            return
+        for child in self.enumerate(url, attributes):
+            if child.is_dir:
+                yield from self.enumerate_recursive(child.uri, attributes)
+            else:
+                yield child
+
     def rename(self, old_url, new_url):
         try:
             old = Gio.File.new_for_uri(old_url)
@@ -320,16 +542,22 @@ class GioFileSystem(object):
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
 
-    def unlink(self, url):
+    def unlink(self, url, trash=True):
+        """
+        Arguments:
+            trash --- if True, the file is moved to the trash if possible.
+                Otherwise, it is deleted right away.
+        """
         try:
             logger.info("Deleting %s ...", url)
             f = Gio.File.new_for_uri(url)
             deleted = False
-            try:
-                deleted = f.trash()
-            except Exception as exc:
-                logger.warning("Failed to trash %s. Will try to delete it"
-                               " instead", f.get_uri(), exc_info=exc)
+            if trash:
+                try:
+                    deleted = f.trash()
+                except Exception as exc:
+                    logger.warning("Failed to trash %s. Will try to delete it"
+                                   " instead", f.get_uri(), exc_info=exc)
             if not deleted:
                 try:
                     deleted = f.delete()
@@ -342,16 +570,21 @@ class GioFileSystem(object):
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
 
-    def rm_rf(self, url):
+    def rm_rf(self, url, trash=True):
+        """
+        Arguments:
+            trash --- see unlink()
+        """
         try:
             logger.info("Deleting %s ...", url)
             f = Gio.File.new_for_uri(url)
             deleted = False
-            try:
-                deleted = f.trash()
-            except Exception as exc:
-                logger.warning("Failed to trash %s. Will try to delete it"
-                               " instead", f.get_uri(), exc_info=exc)
+            if trash:
+                try:
+                    deleted = f.trash()
+                except Exception as exc:
+                    logger.warning("Failed to trash %s. Will try to delete it"
+                                   " instead", f.get_uri(), exc_info=exc)
             if not deleted:
                 self._rm_rf(f)
             logger.info("%s deleted", url)
@@ -382,6 +615,24 @@ class GioFileSystem(object):
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
 
+    def getstamp(self, url):
+        """
+        Returns:
+            A value that changes whenever the file is modified or replaced
+            (for a directory: whenever an entry is added, removed or
+            renamed). Unlike getmtime(), it has a sub-second resolution, so
+            it can be used to validate cache entries.
+        """
+        try:
+            f = Gio.File.new_for_uri(url)
+            fi = f.query_info(
+                GIO_FILE_ATTRIBUTES["stamp"], Gio.FileQueryInfoFlags.NONE
+            )
+            return self._get_gio_stamp(fi)
+        except GLib.GError as exc:
+            logger.warning("Gio.Gerror", exc_info=exc)
+            raise IOError(str(exc))
+
     def getsize(self, url):
         try:
             f = Gio.File.new_for_uri(url)
@@ -404,13 +655,22 @@ class GioFileSystem(object):
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
 
-    def copy(self, old_url, new_url):
+    def copy(self, old_url, new_url, metadata=True):
+        """
+        Arguments:
+            metadata --- if False, only the content of the file is copied
+                (not its modification time, permissions, etc)
+        """
         try:
             old = Gio.File.new_for_uri(old_url)
             new = Gio.File.new_for_uri(new_url)
             if new.query_exists():
                 new.delete()
-            old.copy(new, Gio.FileCopyFlags.ALL_METADATA)
+            old.copy(
+                new,
+                Gio.FileCopyFlags.ALL_METADATA if metadata
+                else Gio.FileCopyFlags.NONE
+            )
         except GLib.GError as exc:
             logger.warning("Gio.Gerror", exc_info=exc)
             raise IOError(str(exc))
@@ -455,3 +715,230 @@ class GioFileSystem(object):
         parent = Gio.File.new_for_uri(parent_uri)
         for f in self._recurse(parent, dir_included):
             yield f.get_uri()
+
+
+class LocalFileSystem(GioFileSystem):
+    """
+    Same interface as GioFileSystem, but local URIs (file://) are handled
+    directly with os.stat(), os.scandir() and plain file objects instead of
+    going through GVfs. Any other URI is still handled by GVfs.
+
+    Deleting files is left to GVfs so they keep going to the trash.
+    """
+
+    LOCAL_URI_PREFIX = "file://"
+
+    def _get_local_path(self, uri):
+        """
+        Returns:
+            The local path of the URI. None if the URI is not a local one.
+        """
+        if not uri.startswith(self.LOCAL_URI_PREFIX):
+            return None
+        path = uri[len(self.LOCAL_URI_PREFIX):]
+        if os.name == 'nt' and path[:1] == '/':
+            # see GioFileSystem.unsafe()
+            path = path[1:]
+        return urllib.parse.unquote(path)
+
+    def open(self, uri, mode='rb'):
+        path = self._get_local_path(uri)
+        if path is None:
+            return super().open(uri, mode)
+        if 'b' in mode:
+            return open(path, mode)
+        # Same as GioUTF8FileAdapter: line endings are only translated when
+        # reading
+        newline = None if 'r' in mode else ""
+        return open(path, mode, encoding="utf-8", newline=newline)
+
+    def open_mapped(self, uri):
+        path = self._get_local_path(uri)
+        if path is None:
+            return super().open_mapped(uri)
+        with open(path, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size <= 0:
+                # empty files cannot be mapped
+                return memoryview(b"")
+            return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def join(self, base, url):
+        if (not base.startswith(self.LOCAL_URI_PREFIX) or
+                "/." in base or
+                url in (".", "..") or
+                any(c in url for c in ":/?#")):
+            return super().join(base, url)
+        # simple file name: no need to go through urljoin()
+        if not base.endswith("/"):
+            base += "/"
+        return base + url
+
+    def basename(self, url):
+        if not url.startswith(self.LOCAL_URI_PREFIX):
+            return super().basename(url)
+        # local URIs built by safe() and listdir() have their '?' and '#'
+        # quoted: everything after the last '/' is the file name
+        return urllib.parse.unquote(url.rsplit("/", 1)[-1])
+
+    def exists(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().exists(url)
+        return os.path.exists(path)
+
+    def listdir(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            yield from super().listdir(url)
+            return
+        if not url.endswith("/"):
+            url += "/"
+        with os.scandir(path) as entries:
+            for entry in entries:
+                yield url + urllib.parse.quote(entry.name)
+
+    def _guess_content_type(self, uri, name, is_dir):
+        if is_dir:
+            return "inode/directory"
+        content_type = mimetypes.guess_type(name)[0]
+        if content_type is not None:
+            return content_type
+        # unknown extension: GVfs can look at the content of the file
+        return super().get_info(uri, ("content_type",)).content_type
+
+    def _make_local_info(self, uri, name, is_dir, st, attributes):
+        return FILE_INFO(
+            uri=uri,
+            name=name,
+            is_dir=is_dir,
+            size=st.st_size if "size" in attributes else None,
+            mtime=int(st.st_mtime) if "mtime" in attributes else None,
+            ctime=int(st.st_ctime) if "ctime" in attributes else None,
+            content_type=(
+                self._guess_content_type(uri, name, is_dir)
+                if "content_type" in attributes else None
+            ),
+            stamp=self._get_stamp(st) if "stamp" in attributes else None,
+        )
+
+    @staticmethod
+    def _get_stamp(st):
+        # the size of a directory changes with its entries on most file
+        # systems
+        return (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+
+    def enumerate(self, url, attributes=FILE_ATTRIBUTES):
+        path = self._get_local_path(url)
+        if path is None:
+            yield from super().enumerate(url, attributes)
+            return
+        need_stat = (
+            "size" in attributes or
+            "mtime" in attributes or
+            "ctime" in attributes or
+            "stamp" in attributes
+        )
+        if not url.endswith("/"):
+            url += "/"
+        with os.scandir(path) as entries:
+            for entry in entries:
+                yield self._make_local_info(
+                    url + urllib.parse.quote(entry.name), entry.name,
+                    entry.is_dir(), entry.stat() if need_stat else None,
+                    attributes
+                )
+
+    def get_info(self, url, attributes=FILE_ATTRIBUTES):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().get_info(url, attributes)
+        st = os.stat(path)
+        return self._make_local_info(
+            url, os.path.basename(os.path.normpath(path)),
+            stat.S_ISDIR(st.st_mode), st, attributes
+        )
+
+    def rename(self, old_url, new_url):
+        old_path = self._get_local_path(old_url)
+        new_path = self._get_local_path(new_url)
+        if old_path is None or new_path is None:
+            return super().rename(old_url, new_url)
+        assert(old_path != new_path)
+        # like Gio.File.move(): never overwrite the target
+        if os.path.lexists(new_path):
+            raise IOError("File {} already exists".format(new_url))
+        try:
+            os.rename(old_path, new_path)
+        except OSError as exc:
+            if exc.errno != errno.EXDEV:
+                raise
+            # different file systems: let GVfs copy and delete
+            super().rename(old_url, new_url)
+
+    def getmtime(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().getmtime(url)
+        # Gio.FILE_ATTRIBUTE_TIME_CHANGED
+        return int(os.stat(path).st_ctime)
+
+    def getstamp(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().getstamp(url)
+        return self._get_stamp(os.stat(path))
+
+    def getsize(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().getsize(url)
+        return os.stat(path).st_size
+
+    def isdir(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().isdir(url)
+        return stat.S_ISDIR(os.stat(path).st_mode)
+
+    def copy(self, old_url, new_url, metadata=True):
+        old_path = self._get_local_path(old_url)
+        new_path = self._get_local_path(new_url)
+        if old_path is None or new_path is None:
+            return super().copy(old_url, new_url, metadata)
+        if os.path.lexists(new_path):
+            os.unlink(new_path)
+        if metadata:
+            shutil.copy2(old_path, new_path)
+        else:
+            shutil.copyfile(old_path, new_path)
+
+    def mkdir_p(self, url):
+        path = self._get_local_path(url)
+        if path is None:
+            return super().mkdir_p(url)
+        os.makedirs(path, exist_ok=True)
+
+    def _recurse_local(self, path, uri, dir_included=False):
+        """
+        Same order as GioFileSystem._recurse()
+        """
+        if not os.path.isdir(path):
+            yield uri
+            return
+        with os.scandir(path) as entries:
+            entries = list(entries)
+        for entry in entries:
+            yield from self._recurse_local(
+                entry.path, uri + "/" + urllib.parse.quote(entry.name)
+            )
+        if dir_included:
+            yield uri
+
+    def recurse(self, parent_uri, dir_included=False):
+        path = self._get_local_path(parent_uri)
+        if path is None:
+            yield from super().recurse(parent_uri, dir_included)
+            return
+        if parent_uri.endswith("/"):
+            parent_uri = parent_uri[:-1]
+        yield from self._recurse_local(path, parent_uri, dir_included)
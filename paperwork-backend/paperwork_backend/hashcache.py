@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Cache of the file hashes (see BasicDoc.hash_file()). Hashing requires
+reading the whole file, while checking that a cached hash is still valid
+only requires a stat() of the file (see fs.getstamp()).
+"""
+
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# attributes required to check a cache entry (see fs.enumerate())
+HASH_FILE_ATTRIBUTES = ("stamp",)
+
+
+def sha256_file(fs, uri):
+    """
+    Hash the file through fs.open_mapped(): local files are memory-mapped,
+    so they are never copied in Python memory.
+
+    Returns:
+        sha256 of the file content, as an hexadecimal string
+    """
+    with fs.open_mapped(uri) as content:
+        return hashlib.sha256(content).hexdigest()
+
+
+class FileHashCache(object):
+    """
+    sha256 of files, keyed on (URI, stamp). The stamp includes the
+    modification time in nanoseconds, the size and the inode of the file
+    (see fs.getstamp()). Entries are kept in LRU order.
+
+    Only the process that called load() writes it back on disk (the index
+    process, in a SQLite database next to the Whoosh index). In any other
+    process, the cache only lives in memory. save() only writes the entries
+    that have been added or removed since the last load()/save().
+    """
+
+    FILENAME = "filehashes.db"
+    VERSION = 2
+    DEFAULT_MAX_SIZE = 200000  # files
+
+    # written by older versions (whole cache rewritten on each save)
+    OBSOLETE_FILENAME = "filehashes.json"
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.path = None
+        self.max_size = max_size
+        # uri --> (stamp, sha256)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # URIs to write / to delete on the next save()
+        self._dirty = set()
+        self._removed = set()
+
+    @staticmethod
+    def _encode_stamp(stamp):
+        return ",".join(str(value) for value in stamp)
+
+    def load(self, indexdir):
+        """
+        Read the cache stored in the index directory. From then on, save()
+        writes it back there.
+        """
+        obsolete_path = os.path.join(indexdir, self.OBSOLETE_FILENAME)
+        if os.path.exists(obsolete_path):
+            logger.info("Removing obsolete file hash cache %s",
+                        obsolete_path)
+            os.unlink(obsolete_path)
+
+        self.path = os.path.join(indexdir, self.FILENAME)
+        with self._lock:
+            self._entries = collections.OrderedDict()
+            self._dirty = set()
+            self._removed = set()
+        if not os.path.exists(self.path):
+            logger.info("No file hash cache found (%s)", self.path)
+            return
+        try:
+            with contextlib.closing(sqlite3.connect(self.path)) as db:
+                version = db.execute(
+                    "SELECT value FROM meta WHERE key = 'version'"
+                ).fetchone()
+                if version is None or version[0] != str(self.VERSION):
+                    logger.info("File hash cache %s is obsolete", self.path)
+                    # rewritten entirely on the next save()
+                    os.unlink(self.path)
+                    return
+                files = db.execute(
+                    "SELECT uri, stamp, hash FROM files ORDER BY used"
+                ).fetchall()
+        except sqlite3.Error as exc:
+            logger.warning("Failed to read file hash cache %s",
+                           self.path, exc_info=exc)
+            return
+
+        with self._lock:
+            for (uri, stamp, filehash) in files:
+                self._entries[uri] = (stamp, filehash)
+        logger.info("File hash cache loaded: %d files", len(self._entries))
+
+    def save(self):
+        """
+        Write the modifications back on disk (only if the cache has been
+        loaded from the disk first).
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            if len(self._dirty) <= 0 and len(self._removed) <= 0:
+                return
+            removed = self._removed
+            # LRU order is kept approximately: the entries written last
+            # are the ones used last
+            dirty = [
+                (uri,) + self._entries[uri]
+                for uri in self._entries if uri in self._dirty
+            ]
+            self._dirty = set()
+            self._removed = set()
+
+        with contextlib.closing(sqlite3.connect(self.path)) as db:
+            with db:  # single transaction
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS meta"
+                    " (key TEXT PRIMARY KEY, value TEXT)"
+                )
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS files ("
+                    " uri TEXT PRIMARY KEY, stamp TEXT, hash TEXT,"
+                    " used INTEGER)"
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value)"
+                    " VALUES ('version', ?)",
+                    (str(self.VERSION),)
+                )
+                db.executemany(
+                    "DELETE FROM files WHERE uri = ?",
+                    ((uri,) for uri in removed)
+                )
+                (used,) = db.execute(
+                    "SELECT COALESCE(MAX(used), 0) FROM files"
+                ).fetchone()
+                db.executemany(
+                    "INSERT OR REPLACE INTO files (uri, stamp, hash, used)"
+                    " VALUES (?, ?, ?, ?)",
+                    (
+                        (uri, stamp, filehash, used + idx + 1)
+                        for (idx, (uri, stamp, filehash)) in enumerate(dirty)
+                    )
+                )
+        logger.info("File hash cache written: %d files modified,"
+                    " %d files removed", len(dirty), len(removed))
+
+    def get_hash(self, fs, uri, file_info=None):
+        """
+        Arguments:
+            file_info --- fs.FILE_INFO of the file, with at least the
+                attributes HASH_FILE_ATTRIBUTES. If None, they are queried.
+
+        Returns:
+            sha256 of the file content, as an hexadecimal string
+        """
+        if file_info is None:
+            file_info = fs.get_info(uri, HASH_FILE_ATTRIBUTES)
+        stamp = self._encode_stamp(file_info.stamp)
+
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(uri)
+                return entry[1]
+
+        filehash = sha256_file(fs, uri)
+
+        with self._lock:
+            self._entries[uri] = (stamp, filehash)
+            self._entries.move_to_end(uri)
+            self._dirty.add(uri)
+            self._removed.discard(uri)
+            while len(self._entries) > self.max_size:
+                (old_uri, _) = self._entries.popitem(last=False)
+                self._dirty.discard(old_uri)
+                self._removed.add(old_uri)
+        return filehash
+
+    def forget(self, uri):
+        with self._lock:
+            if self._entries.pop(uri, None) is not None:
+                self._dirty.discard(uri)
+                self._removed.add(uri)
+
+
+FILE_HASH_CACHE = FileHashCache()
@@ -35,8 +35,10 @@ from gi.repository import Gio
 from gi.repository import Poppler
 
 from ..common.doc import BasicDoc
+from ..common.doc import DOC_DIR_CACHE
 from ..common.export import dummy_export_progress_cb
 from ..common.export import Exporter
+from ..hashcache import HASH_FILE_ATTRIBUTES
 from ..img.page import ImgPage
 from ..util import image2surface
 from ..util import surface2image
@@ -225,67 +227,6 @@ class ImgToPdfDocExporter(Exporter):
         return 'PDF'
 
 
-class _ImgPagesIterator(object):
-
-    """
-    Iterates on a page list
-    """
-
-    def __init__(self, page_list):
-        self.idx = 0
-        self.page_list = page_list
-
-    def __iter__(self):
-        return self
-
-    def next(self):
-        """
-        Provide the next element of the list.
-        """
-        if self.idx >= len(self.page_list):
-            raise StopIteration()
-        page = self.page_list[self.idx]
-        self.idx += 1
-        return page
-
-    def __next__(self):
-        return self.next()
-
-
-class _ImgPages(object):
-
-    """
-    Page list. Page are accessed using [] operator.
-    """
-
-    def __init__(self, doc):
-        self.doc = doc
-        self.__pages = None
-
-    def add(self, page):
-        self.__pages.append(page)
-
-    def __getitem__(self, idx):
-        if not self.__pages:
-            nb_pages = self.doc.nb_pages
-            self.__pages = [
-                ImgPage(self.doc, i) for i in range(0, nb_pages)
-            ]
-        return self.__pages[idx]
-
-    def __len__(self):
-        return self.doc.nb_pages
-
-    def __contains__(self, page):
-        return (page.doc == self.doc and page.page_nb <= self.doc.nb_pages)
-
-    def __eq__(self, other):
-        return (self.doc == other.doc)
-
-    def __iter__(self):
-        return _ImgPagesIterator(self)
-
-
 class ImgDoc(BasicDoc):
 
     """
@@ -299,6 +240,8 @@ class ImgDoc(BasicDoc):
     can_edit = True
     doctype = u"Img"
 
+    __slots__ = ()
+
     def __init__(self, fs, docpath, docid=None):
         """
         Arguments:
@@ -312,31 +255,45 @@ class ImgDoc(BasicDoc):
         return ImgDoc(self.fs, self.path, self.docid)
 
     def __get_last_mod(self):
-        last_mod = 0.0
-        for page in self.pages:
-            if last_mod < page.last_mod:
-                last_mod = page.last_mod
-        labels_path = self.fs.join(self.path, BasicDoc.LABEL_FILE)
         try:
-            file_last_mod = self.fs.getmtime(labels_path)
-            if file_last_mod > last_mod:
-                last_mod = file_last_mod
+            file_last_mods = self._get_file_last_mods()
         except OSError:
-            pass
-        extra_txt_path = self.fs.join(self.path, BasicDoc.EXTRA_TEXT_FILE)
-        try:
-            file_last_mod = self.fs.getmtime(extra_txt_path)
+            return 0.0
+        nb_pages = len(self._filter_page_filenames(file_last_mods.keys()))
+        filenames = [
+            "%s%d.%s" % (ImgPage.FILE_PREFIX, page_nb + 1, ImgPage.EXT_BOX)
+            for page_nb in range(0, nb_pages)
+        ]
+        filenames += [BasicDoc.LABEL_FILE, BasicDoc.EXTRA_TEXT_FILE]
+        last_mod = 0.0
+        for filename in filenames:
+            file_last_mod = file_last_mods.get(filename, 0.0)
             if file_last_mod > last_mod:
                 last_mod = file_last_mod
-        except OSError:
-            pass
         return last_mod
 
     last_mod = property(__get_last_mod)
 
-    @property
-    def pages(self):
-        return _ImgPages(self)
+    def _make_page(self, page_nb):
+        return ImgPage(self, page_nb)
+
+    def get_page_filenames(self):
+        """
+        Returns the names of the image files of the pages (unsorted)
+        """
+        return self._filter_page_filenames(
+            DOC_DIR_CACHE.get_filenames(self.fs, self.path)
+        )
+
+    @staticmethod
+    def _filter_page_filenames(filenames):
+        return [
+            filename for filename in filenames
+            if (filename[-4:].lower() == "." + ImgPage.EXT_IMG and
+                filename[-10:].lower() != "." + ImgPage.EXT_THUMB and
+                filename[:len(ImgPage.FILE_PREFIX)].lower() ==
+                ImgPage.FILE_PREFIX)
+        ]
 
     def _get_nb_pages(self):
         """
@@ -344,17 +301,7 @@ class ImgDoc(BasicDoc):
         how many JPG files there are in the document.
         """
         try:
-            filelist = self.fs.listdir(self.path)
-            count = 0
-            for filepath in filelist:
-                filename = self.fs.basename(filepath)
-                if (filename[-4:].lower() != "." + ImgPage.EXT_IMG or
-                    (filename[-10:].lower() == "." + ImgPage.EXT_THUMB) or
-                    (filename[:len(ImgPage.FILE_PREFIX)].lower() !=
-                        ImgPage.FILE_PREFIX)):
-                    continue
-                count += 1
-            return count
+            return len(self.get_page_filenames())
         except IOError as exc:
             logger.debug("Exception while trying to get the number of"
                          " pages of '%s': %s", self.docid, exc)
@@ -398,9 +345,17 @@ class ImgDoc(BasicDoc):
             logger.warn("WARNING: Document %s is empty" % self.docid)
             dochash = 0
         else:
+            # a single directory read to check all the cached page hashes
+            file_infos = {
+                info.name: info
+                for info in self.fs.enumerate(self.path, HASH_FILE_ATTRIBUTES)
+            }
             dochash = 0
             for page in self.pages:
-                dochash ^= page.get_docfilehash()
+                filename = "%s%d.%s" % (
+                    ImgPage.FILE_PREFIX, page.page_nb + 1, ImgPage.EXT_IMG
+                )
+                dochash ^= page.get_docfilehash(file_infos.get(filename))
         return dochash
 
     def add_page(self, img, boxes):
@@ -437,13 +392,13 @@ def is_img_doc(fs, docpath):
     if not fs.isdir(docpath):
         return False
     try:
-        filelist = fs.listdir(docpath)
+        filelist = DOC_DIR_CACHE.get_filenames(fs, docpath)
     except OSError as exc:
         logger.warn("Warning: Failed to list files in %s: %s"
                     % (docpath, str(exc)))
         return False
-    for filepath in filelist:
-        if (filepath.lower().endswith(ImgPage.EXT_IMG) and
-                not filepath.lower().endswith(ImgPage.EXT_THUMB)):
+    for filename in filelist:
+        if (filename.lower().endswith(ImgPage.EXT_IMG) and
+                not filename.lower().endswith(ImgPage.EXT_THUMB)):
             return True
     return False
@@ -25,7 +25,10 @@ import logging
 import pyocr
 import pyocr.builders
 
+from ..common.doc import DOC_DIR_CACHE
 from ..common.page import BasicPage
+from ..common.page import PAGE_TEXT_CACHE
+from ..hashcache import FILE_HASH_CACHE
 from ..util import image2surface
 
 
@@ -44,6 +47,8 @@ class ImgPage(BasicPage):
 
     can_edit = True
 
+    __slots__ = ()
+
     def __init__(self, doc, page_nb=None):
         if page_nb is None:
             page_nb = doc.nb_pages
@@ -83,6 +88,10 @@ class ImgPage(BasicPage):
         """
         Get the text corresponding to this page
         """
+        return PAGE_TEXT_CACHE.get(self.fs, self.__box_path,
+                                   self.__extract_text)
+
+    def __extract_text(self):
         boxes = self.boxes
         txt = []
         for line in boxes:
@@ -123,6 +132,8 @@ class ImgPage(BasicPage):
         boxfile = self.__box_path
         with self.fs.open(boxfile, 'w') as file_desc:
             pyocr.builders.LineBoxBuilder().write_file(file_desc, boxes)
+        PAGE_TEXT_CACHE.forget(boxfile)
+        DOC_DIR_CACHE.forget(self.doc.path)
 
     boxes = property(__get_boxes, __set_boxes)
 
@@ -138,6 +149,8 @@ class ImgPage(BasicPage):
     def __set_img(self, img):
         with self.fs.open(self.__img_path, 'wb') as fd:
             img.save(fd, format="JPEG")
+        DOC_DIR_CACHE.forget(self.doc.path)
+        FILE_HASH_CACHE.forget(self.__img_path)
 
     img = property(__get_img, __set_img)
 
@@ -229,6 +242,8 @@ class ImgPage(BasicPage):
                     logger.error("Error: file already exists: %s" % dst[key])
                     assert(0)
                 self.fs.rename(src[key], dst[key])
+        DOC_DIR_CACHE.forget(self.doc.path)
+        FILE_HASH_CACHE.forget(dst["img"])
 
     def destroy(self):
         """
@@ -249,6 +264,8 @@ class ImgPage(BasicPage):
         for path in paths:
             if self.fs.exists(path):
                 self.fs.unlink(path)
+        DOC_DIR_CACHE.forget(self.doc.path)
+        FILE_HASH_CACHE.forget(self.__get_img_path())
         for page_nb in range(self.page_nb + 1, current_doc_nb_pages):
             page = doc_pages[page_nb]
             page.change_index(offset=-1)
@@ -275,6 +292,9 @@ class ImgPage(BasicPage):
         for (src, dst) in to_move:
             logger.info("%s --> %s" % (src, dst))
             self.fs.rename(src, dst)
+        DOC_DIR_CACHE.forget(self.doc.path)
+        DOC_DIR_CACHE.forget(other_doc.path)
+        FILE_HASH_CACHE.forget(self.__get_img_path())
 
         if (other_doc_nb_pages <= 1):
             other_doc.destroy()
@@ -283,8 +303,12 @@ class ImgPage(BasicPage):
                 page = other_doc_pages[page_nb]
                 page.change_index(offset=-1)
 
-    def get_docfilehash(self):
-        return self.doc.hash_file(self.fs, self.__get_img_path())
+    def get_docfilehash(self, file_info=None):
+        """
+        Arguments:
+            file_info --- see BasicDoc.hash_file()
+        """
+        return self.doc.hash_file(self.fs, self.__get_img_path(), file_info)
 
     def has_ocr(self):
         # always act as if images have OCR file attached
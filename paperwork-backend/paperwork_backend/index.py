@@ -1,26 +1,37 @@
 #!/usr/bin/env python3
 
 import collections
+import concurrent.futures
 import copy
 import datetime
 import gc
+import heapq
+import itertools
 import logging
 import multiprocessing
 import threading
+import time
 
 import whoosh.fields
 import whoosh.index
 import whoosh.qparser
 import whoosh.query
 import whoosh.sorting
+import whoosh.writing
 
+from .catalog import DocCatalog
 from .common.page import BasicPage
-from .fs import GioFileSystem
+from .fs import LocalFileSystem
+from .hashcache import FILE_HASH_CACHE
+from .labels import Label
 from .labels import LabelGuesser
+from .parallel import get_nb_workers
 from .img.doc import ImgDoc
 from .img.doc import is_img_doc
 from .pdf.doc import PdfDoc
 from .pdf.doc import is_pdf_doc
+from .querycache import QueryCache
+from .termdict import TermDictionary
 from .util import hide_file
 from .util import MIN_KEYWORD_LEN
 from .util import mkdir_p
@@ -37,6 +48,22 @@ COMMAND = collections.namedtuple(
 RESULT = collections.namedtuple(
     "RESULT", ["exc", "ret"]
 )
+# Search result. Much lighter than a document object.
+# labels = label names, nb_pages = -1 if unknown
+SEARCH_RESULT = collections.namedtuple(
+    "SEARCH_RESULT", ["docid", "doctype", "date", "score", "labels",
+                      "nb_pages"]
+)
+# Many commands sent in a single message. The server replies with a list of
+# RESULT. It stops executing the commands as soon as one fails or as soon
+# as one returns 'stop_on' (if not None).
+BATCH = collections.namedtuple(
+    "BATCH", ["commands", "stop_on"]
+)
+
+# default number of calls sent in a single message by
+# PaperworkIndexClient.iter_steps()
+DEFAULT_CHUNK_SIZE = 100
 
 
 DOC_TYPE_LIST = [
@@ -45,6 +72,70 @@ DOC_TYPE_LIST = [
 ]
 
 
+def inst_doc(fs, docpath, docid, doc_type_name=None, check_exists=True):
+    """
+    Instantiate a document. If the document type is not known, it is guessed
+    by looking at the content of the document directory.
+    """
+    doc = None
+    if check_exists and not fs.exists(docpath):
+        return None
+    if doc_type_name is not None:
+        # if we already know the doc type name
+        for (is_doc_type, doc_type_name_b, doc_type) in DOC_TYPE_LIST:
+            if (doc_type_name_b == doc_type_name):
+                doc = doc_type(fs, docpath, docid)
+        if not doc:
+            logger.warning(
+                ("Warning: unknown doc type found in the index: %s") %
+                doc_type_name
+            )
+    # otherwise we guess the doc type
+    if not doc:
+        for (is_doc_type, doc_type_name, doc_type) in DOC_TYPE_LIST:
+            if is_doc_type(fs, docpath):
+                doc = doc_type(fs, docpath, docid)
+                break
+    if not doc:
+        logger.warning("Warning: unknown doc type for doc '%s'" % docid)
+
+    return doc
+
+
+def get_doc_index_fields(doc):
+    """
+    Slow: reads the whole text of the document.
+
+    Returns:
+        (fields of the Whoosh document (see PaperworkIndex.WHOOSH_SCHEMA),
+         last modification time of the document (timestamp))
+    """
+    doc_last_mod = doc.last_mod
+    last_mod = datetime.datetime.fromtimestamp(doc_last_mod)
+
+    dochash = doc.get_docfilehash()
+    dochash = (u"%X" % dochash)
+
+    doc_txt = doc.get_index_text()
+    assert(isinstance(doc_txt, str))
+    labels_txt = doc.get_index_labels()
+    assert(isinstance(labels_txt, str))
+
+    # append labels to doc txt, because we usually search on doc_txt
+    doc_txt += " " + labels_txt
+
+    fields = {
+        'docid': str(doc.docid),
+        'doctype': doc.doctype,
+        'docfilehash': dochash,
+        'content': strip_accents(doc_txt),
+        'label': strip_accents(labels_txt),
+        'date': doc.date,
+        'last_read': last_mod,
+    }
+    return (fields, doc_last_mod)
+
+
 class PaperworkIndex(object):
     WHOOSH_SCHEMA = whoosh.fields.Schema(
         # static up to date schema
@@ -58,17 +149,31 @@ class PaperworkIndex(object):
         last_read=whoosh.fields.DATETIME(stored=True),
     )
 
+    # write-behind mode: buffered changes are flushed on disk once there
+    # are WRITE_BEHIND_LIMIT of them, or after WRITE_BEHIND_PERIOD seconds
+    WRITE_BEHIND_LIMIT = 50
+    WRITE_BEHIND_PERIOD = 5.0
+    # small segments are merged once the index process has been idle for
+    # MERGE_DELAY seconds
+    MERGE_DELAY = 10.0
+    # number of threads rewriting the label files when a label is renamed
+    # or deleted
+    LABEL_UPDATE_THREADS = 4
+
     def __init__(self):
-        self.fs = GioFileSystem()
+        self.fs = LocalFileSystem()
 
         self.indexdir = None
         self.index = None
         self.label_guesser_dir = None
-        self._docs_by_id = {}  # docid --> doc
+        self._docs_by_id = {}  # docid --> doc (instantiated lazily)
+        self.catalog = None
+        self.term_dict = None
         self.labels = {}  # label name --> label
         self.__searcher = None
         self.label_guesser = None
         self.search_param_list = {}
+        self.query_cache = QueryCache()
         self.label_guesser = None
         self.rootdir = None
         self.opened = False
@@ -79,6 +184,13 @@ class PaperworkIndex(object):
         self.index_update_data = {}
         self.index_writer = None
         self.label_guesser_updater = None
+        self.write_behind = False
+        self.buffered_writer = None
+        self.buffered_since = None  # time.monotonic()
+        self.nb_buffered = 0
+        self.need_merge = False
+        # see start_rebuild()
+        self.rebuilding = False
         self.update_label_data = {}
         self.destroy_label_data = {}
 
@@ -89,14 +201,63 @@ class PaperworkIndex(object):
 
     def run(self):
         while self.running:
+            if not self.pipe_server.poll(self.__get_idle_timeout()):
+                self._run_idle_step()
+                continue
             command = self.pipe_server.recv()
-            try:
-                func = getattr(self, command.func)
-                ret = func(*command.args, **command.kwargs)
-                self.pipe_server.send(RESULT(exc=None, ret=ret))
-            except BaseException as exc:
-                logger.exception("Exception while calling '%s'", command.func)
-                self.pipe_server.send(RESULT(exc=exc, ret=None))
+            if isinstance(command, BATCH):
+                self.pipe_server.send(self._run_batch(command))
+            else:
+                self.pipe_server.send(self._run_command(command))
+
+    def _run_command(self, command):
+        try:
+            func = getattr(self, command.func)
+            ret = func(*command.args, **command.kwargs)
+            return RESULT(exc=None, ret=ret)
+        except BaseException as exc:
+            logger.exception("Exception while calling '%s'", command.func)
+            return RESULT(exc=exc, ret=None)
+
+    def __get_idle_timeout(self):
+        """
+        How long we can wait for a command before having to do some
+        background work (None = no background work to do)
+        """
+        if self.rebuilding:
+            # the rebuild holds the lock of the Whoosh index
+            return None
+        if self.buffered_writer is not None:
+            elapsed = time.monotonic() - self.buffered_since
+            return max(0.0, self.WRITE_BEHIND_PERIOD - elapsed)
+        if self.need_merge:
+            return self.MERGE_DELAY
+        return None
+
+    def _run_idle_step(self):
+        """
+        Background work, only done when no command is pending: flush the
+        write-behind buffer first, merge the segments later.
+        """
+        try:
+            if self.buffered_writer is not None:
+                self.flush()
+            elif self.need_merge:
+                self.merge_segments()
+        except Exception:
+            logger.exception("Background index update failed")
+            self.need_merge = False
+
+    def _run_batch(self, batch):
+        results = []
+        for command in batch.commands:
+            result = self._run_command(command)
+            results.append(result)
+            if result.exc:
+                break
+            if batch.stop_on is not None and result.ret == batch.stop_on:
+                break
+        return results
 
     def open(self, localdir, base_data_dir, index_path, label_guesser_path,
              rootdir, language=None):
@@ -115,6 +276,7 @@ class PaperworkIndex(object):
                 if str(self.index.schema) != str(self.WHOOSH_SCHEMA):
                     raise Exception("Index version mismatch")
                 self.__searcher = self.index.searcher()
+                self.query_cache.invalidate()
                 need_index_rewrite = False
             except Exception as exc:
                 logger.warning(
@@ -146,38 +308,49 @@ class PaperworkIndex(object):
                     prefixlength, constantscore=True
                 )
 
-        facets = [
-            whoosh.sorting.ScoreFacet(),
-            whoosh.sorting.FieldFacet("date", reverse=True)
-        ]
+        self.sort_facets = {
+            # most relevant first, then most recent first
+            'score': [
+                whoosh.sorting.ScoreFacet(),
+                whoosh.sorting.FieldFacet("date", reverse=True)
+            ],
+            # most recent first (same order than the document list)
+            'date': [
+                whoosh.sorting.FieldFacet("docid", reverse=True)
+            ],
+        }
 
         self.search_param_list = {
             'fuzzy': [
                 {
                     "query_parser": whoosh.qparser.MultifieldParser(
                         ["label", "content"], schema=self.index.schema,
-                        termclass=CustomFuzzy),
-                    "sortedby": facets
+                        termclass=CustomFuzzy)
                 },
                 {
                     "query_parser": whoosh.qparser.MultifieldParser(
                         ["label", "content"], schema=self.index.schema,
-                        termclass=whoosh.qparser.query.Prefix),
-                    "sortedby": facets
+                        termclass=whoosh.qparser.query.Prefix)
                 },
             ],
             'strict': [
                 {
                     "query_parser": whoosh.qparser.MultifieldParser(
                         ["label", "content"], schema=self.index.schema,
-                        termclass=whoosh.query.Term),
-                    "sortedby": facets
+                        termclass=whoosh.query.Term)
                 },
             ],
         }
 
+        self.catalog = DocCatalog(self.indexdir)
+        FILE_HASH_CACHE.load(self.indexdir)
+
+        self.term_dict = TermDictionary(
+            self.indexdir, self.index.schema['content'].analyzer
+        )
+
         self.label_guesser = LabelGuesser(
-            self.label_guesser_dir, len(self._docs_by_id.keys())
+            self.label_guesser_dir, len(self.catalog)
         )
         self.label_guesser.set_language(language)
 
@@ -192,44 +365,26 @@ class PaperworkIndex(object):
         self._docs_by_id = {}
         del docs_by_id
 
+        self.catalog.load()
+
         results = self.__searcher.search(
             whoosh.query.Every(), limit=None
         )
         self.reload_index_data['results'] = results
         self.reload_index_data['results_iter'] = iter(results)
-        self.reload_index_data['labels'] = set()
+        self.reload_index_data['docids'] = set()
+        self.reload_index_data['labels'] = {}  # label name --> label
         self.reload_index_data['done'] = 0
         return len(results)
 
-    def __inst_doc(self, docid, doc_type_name=None):
+    def __inst_doc(self, docid, doc_type_name=None, check_exists=True):
         """
         Instantiate a document based on its document id.
         The information are taken from the whoosh index.
         """
-        doc = None
         docpath = self.fs.join(self.rootdir, docid)
-        if not self.fs.exists(docpath):
-            return None
-        if doc_type_name is not None:
-            # if we already know the doc type name
-            for (is_doc_type, doc_type_name_b, doc_type) in DOC_TYPE_LIST:
-                if (doc_type_name_b == doc_type_name):
-                    doc = doc_type(self.fs, docpath, docid)
-            if not doc:
-                logger.warning(
-                    ("Warning: unknown doc type found in the index: %s") %
-                    doc_type_name
-                )
-        # otherwise we guess the doc type
-        if not doc:
-            for (is_doc_type, doc_type_name, doc_type) in DOC_TYPE_LIST:
-                if is_doc_type(self.fs, docpath):
-                    doc = doc_type(self.fs, docpath, docid)
-                    break
-        if not doc:
-            logger.warning("Warning: unknown doc type for doc '%s'" % docid)
-
-        return doc
+        return inst_doc(self.fs, docpath, docid, doc_type_name,
+                        check_exists=check_exists)
 
     def continue_reload_index(self):
         result = None
@@ -238,39 +393,62 @@ class PaperworkIndex(object):
         except StopIteration:
             return False
 
-        doc = self.__inst_doc(result['docid'], result['doctype'])
-        if doc is None:
-            return
+        docid = result['docid']
+        entry = self.catalog.get(docid)
+        if entry is None or entry.doctype != result['doctype']:
+            # not in the catalog yet (index written by a previous version
+            # of Paperwork) --> we have to look at the document itself
+            doc = self.__inst_doc(docid, result['doctype'])
+            if doc is None:
+                return True
+            entry = self.catalog.update_doc(
+                doc, doc.labels, result['last_read'].timestamp(),
+                result['docfilehash']
+            )
+            self._docs_by_id[docid] = doc
 
-        self._docs_by_id[result['docid']] = doc
-        for label in doc.labels:
-            self.reload_index_data['labels'].add(label)
+        self.reload_index_data['docids'].add(docid)
+        labels = self.reload_index_data['labels']
+        for (label_name, label_color) in entry.labels:
+            if label_name not in labels:
+                labels[label_name] = Label(label_name, label_color)
 
         return True
 
     def end_reload_index(self):
+        # forget about documents that are not in the index anymore
+        self.catalog.keep_only(self.reload_index_data['docids'])
+        self.catalog.save()
+
         self.label_guesser = LabelGuesser(
             self.label_guesser_dir,
-            len(self._docs_by_id.keys())
+            len(self.catalog)
         )
-        for label in self.reload_index_data['labels']:
-            self.label_guesser.load(label.name)
+        for label_name in self.reload_index_data['labels'].keys():
+            self.label_guesser.load(label_name)
 
-        self.labels = {
-            label.name: label
-            for label in self.reload_index_data['labels']
-        }
+        self.labels = self.reload_index_data['labels']
         self.reload_index_data = {}
 
-    def start_examine_rootdir(self):
+    def get_indexed_doc_infos(self):
+        """
+        Returns:
+            { docid: (doctype, last modification date), ... } for all the
+            documents currently in the index
+        """
         results = self.__searcher.search(whoosh.query.Every(), limit=None)
-        old_doc_list = set([result['docid'] for result in results])
-        old_doc_infos = {}
-        for result in results:
-            old_doc_infos[result['docid']] = (
-                result['doctype'], result['last_read']
-            )
-        docdirs = [x for x in self.fs.listdir(self.rootdir)]
+        return {
+            result['docid']: (result['doctype'], result['last_read'])
+            for result in results
+        }
+
+    def start_examine_rootdir(self):
+        old_doc_infos = self.get_indexed_doc_infos()
+        old_doc_list = set(old_doc_infos.keys())
+        docdirs = [
+            info for info in self.fs.enumerate(self.rootdir, ())
+            if info.is_dir
+        ]
         self.examine_rootdir_data['old_doc_list'] = old_doc_list
         self.examine_rootdir_data['old_doc_infos'] = old_doc_infos
         self.examine_rootdir_data['docdirs'] = docdirs
@@ -285,25 +463,31 @@ class PaperworkIndex(object):
         assert(docid is not None)
         if docid in self._docs_by_id:
             return self._docs_by_id[docid]
-        if not inst:
+        entry = self.catalog.get(docid)
+        if entry is not None:
+            # known document: the catalog tells us its type, no need to
+            # look at the work directory
+            doc = self.__inst_doc(docid, entry.doctype, check_exists=False)
+        elif not inst:
             return None
-        doc = self.__inst_doc(docid, doc_type_name)
+        else:
+            doc = self.__inst_doc(docid, doc_type_name)
         if doc is None:
             return None
         self._docs_by_id[docid] = doc
         return doc
 
     def continue_examine_rootdir(self):
-        docpath = None
+        docinfo = None
         try:
-            docpath = next(self.examine_rootdir_data['docdirs_iter'])
+            docinfo = next(self.examine_rootdir_data['docdirs_iter'])
         except StopIteration:
             self.examine_rootdir_data['old_doc_list_iter'] = iter(
                 self.examine_rootdir_data['old_doc_list']
             )
             return ('end', None)
 
-        docdir = self.fs.basename(docpath)
+        docdir = docinfo.name
         old_infos = self.examine_rootdir_data['old_doc_infos'].get(docdir)
         doctype = None
         if old_infos is not None:
@@ -348,32 +532,16 @@ class PaperworkIndex(object):
         for label in new_labels:
             self.create_label(label)
 
-        last_mod = datetime.datetime.fromtimestamp(doc.last_mod)
-        docid = str(doc.docid)
-
-        dochash = doc.get_docfilehash()
-        dochash = (u"%X" % dochash)
+        (fields, doc_last_mod) = get_doc_index_fields(doc)
+        docid = fields['docid']
 
-        doc_txt = doc.get_index_text()
-        assert(isinstance(doc_txt, str))
-        labels_txt = doc.get_index_labels()
-        assert(isinstance(labels_txt, str))
-
-        # append labels to doc txt, because we usually search on doc_txt
-        doc_txt += " " + labels_txt
+        self.catalog.update_doc(doc, doc_labels, doc_last_mod,
+                                fields['docfilehash'])
 
         query = whoosh.query.Term("docid", docid)
         index_writer.delete_by_query(query)
 
-        index_writer.update_document(
-            docid=docid,
-            doctype=doc.doctype,
-            docfilehash=dochash,
-            content=strip_accents(doc_txt),
-            label=strip_accents(labels_txt),
-            date=doc.date,
-            last_read=last_mod
-        )
+        index_writer.update_document(**fields)
         return True
 
     @staticmethod
@@ -389,6 +557,7 @@ class PaperworkIndex(object):
         Add a document to the index
         """
         if not self.index_writer and index_update:
+            self.flush()
             self.index_writer = self.index.writer()
         if not self.label_guesser_updater and label_guesser_update:
             self.label_guesser_updater = self.label_guesser.get_updater()
@@ -405,6 +574,7 @@ class PaperworkIndex(object):
         Update a document in the index
         """
         if not self.index_writer and index_update:
+            self.flush()
             self.index_writer = self.index.writer()
         if not self.label_guesser_updater and label_guesser_update:
             self.label_guesser_updater = self.label_guesser.get_updater()
@@ -419,17 +589,21 @@ class PaperworkIndex(object):
         Delete a document
         """
         if not self.index_writer:
+            self.flush()
             self.index_writer = self.index.writer()
         if not self.label_guesser_updater:
             self.label_guesser_updater = self.label_guesser.get_updater()
         logger.info("Removing doc from the index: %s" % doc)
-        if doc.docid in self._docs_by_id:
-            self._docs_by_id.pop(doc.docid)
         if isinstance(doc, str):
             # annoying case : we can't know which labels were on it
             # so we can't roll back the label guesser training ...
+            self._docs_by_id.pop(doc, None)
+            self.catalog.remove(doc)
             self._delete_doc_from_index(self.index_writer, doc)
             return
+        if doc.docid in self._docs_by_id:
+            self._docs_by_id.pop(doc.docid)
+        self.catalog.remove(doc.docid)
         self._delete_doc_from_index(self.index_writer, doc.docid)
         self.label_guesser_updater.del_doc(doc)
 
@@ -438,6 +612,7 @@ class PaperworkIndex(object):
         Apply the changes to the index
         """
         logger.info("Index: Commiting changes")
+        self.flush()
         if self.index_writer:
             if index_update:
                 self.index_writer.commit()
@@ -446,6 +621,13 @@ class PaperworkIndex(object):
             del self.index_writer
         self.index_writer = None
 
+        if index_update:
+            self.catalog.save()
+            FILE_HASH_CACHE.save()
+        else:
+            self.catalog.load()
+        self.query_cache.invalidate()
+
         self.index.refresh()
 
         if self.label_guesser:
@@ -459,18 +641,191 @@ class PaperworkIndex(object):
         Forget about the changes
         """
         logger.info("Index: Index update cancelled")
+        # changes buffered in write-behind mode were already committed as far
+        # as the callers are concerned
+        self.flush()
         if self.index_writer:
             self.index_writer.cancel()
             del self.index_writer
         self.index_writer = None
+        self.catalog.load()
+        self.query_cache.invalidate()
+        if self.label_guesser_updater:
+            self.label_guesser_updater.cancel()
+        self.label_guesser_updater = None
+
+    def start_rebuild(self):
+        """
+        Rebuild mode (see rebuild.py): the Whoosh index is written by the
+        client directly (so the index process doesn't have to receive all
+        the document texts). The index process only takes care of the
+        catalog, the labels and the label guesser.
+
+        Remove all the documents from the index.
+
+        Returns:
+            The index directory
+        """
+        self.flush()
+        if self.index_writer:
+            self.index_writer.cancel()
+            self.index_writer = None
+        writer = self.index.writer()
+        writer.commit(mergetype=whoosh.writing.CLEAR)
+        self.index.refresh()
+        self.reload_searcher()
+        # no background work on the index until end_rebuild() or
+        # abort_rebuild()
+        self.rebuilding = True
+        self.need_merge = False
+
+        self._docs_by_id = {}
+        self.catalog.keep_only(())
+        self.labels = {}
+        self.label_guesser_updater = self.label_guesser.get_updater()
+        return self.indexdir
+
+    def add_rebuilt_docs(self, docs):
+        """
+        Arguments:
+            docs --- [(catalog.CATALOG_ENTRY, labels, label guesser text),
+                ...]
+        """
+        for (entry, labels, guesser_txt) in docs:
+            for label in labels:
+                if label.name not in self.labels:
+                    self.create_label(label)
+            self.catalog.add_entry(entry)
+            self.label_guesser_updater.add_doc_txt(
+                guesser_txt, {label.name for label in labels}
+            )
+
+    def abort_rebuild(self):
+        """
+        Must be called if the rebuild has been interrupted. The index has
+        been cleared by start_rebuild(): the catalog is cleared too, so they
+        remain consistent (the rebuild will have to be restarted).
+        """
+        self.rebuilding = False
+        self.catalog.keep_only(())
+        self.catalog.save()
+        self._docs_by_id = {}
+        self.query_cache.invalidate()
         if self.label_guesser_updater:
             self.label_guesser_updater.cancel()
         self.label_guesser_updater = None
+        self.index.refresh()
+        self.reload_searcher()
+
+    def end_rebuild(self):
+        """
+        Must be called once the client has committed the Whoosh index
+        """
+        self.rebuilding = False
+        self.catalog.save()
+        FILE_HASH_CACHE.save()
+        self.label_guesser_updater.commit()
+        self.label_guesser.total_nb_documents = len(self.catalog)
+        self.index.refresh()
+        self.reload_searcher()
+
+    def set_write_behind(self, enabled):
+        """
+        In write-behind mode, label changes made on single documents
+        (create_label(), add_label(), remove_label()) are not committed
+        immediately. They are buffered and written on disk later (see
+        flush()). Searches still see them right away.
+        """
+        self.write_behind = enabled
+        if not enabled:
+            self.flush()
+
+    def __upd_doc_and_commit(self, doc):
+        """
+        Update a document in the index and commit the change (or buffer it
+        in write-behind mode)
+        """
+        if not self.write_behind or self.index_writer is not None:
+            self.upd_doc(doc)
+            self.commit()
+            return
+
+        if self.buffered_writer is None:
+            # the periodic flush is done by the main loop (see run()),
+            # not by a timer thread. Segments are merged later.
+            self.buffered_writer = whoosh.writing.BufferedWriter(
+                self.index, period=None, limit=self.WRITE_BEHIND_LIMIT,
+                commitargs={'merge': False}
+            )
+            self.buffered_since = time.monotonic()
+        if not self.label_guesser_updater:
+            self.label_guesser_updater = self.label_guesser.get_updater()
+        logger.info("Updating modified doc (write-behind): %s" % doc)
+        self._update_doc_in_index(self.buffered_writer, doc)
+        self.label_guesser_updater.upd_doc(doc)
+        self.nb_buffered += 1
+
+        if (self.nb_buffered >= self.WRITE_BEHIND_LIMIT or
+                time.monotonic() - self.buffered_since >=
+                self.WRITE_BEHIND_PERIOD):
+            self.flush()
+            return
+
+        # near-real-time view: on-disk segments + buffered documents
+        searcher = self.__searcher
+        self.__searcher = self.buffered_writer.searcher()
+        searcher.close()
+        self.query_cache.invalidate()
+
+    def flush(self):
+        """
+        Write on disk the changes buffered in write-behind mode
+        """
+        if self.buffered_writer is None:
+            return
+        logger.info("Index: Flushing %d buffered changes" % self.nb_buffered)
+        writer = self.buffered_writer
+        self.buffered_writer = None
+        self.buffered_since = None
+        self.nb_buffered = 0
+        writer.close()
+        self.need_merge = True
+
+        self.catalog.save()
+        self.index.refresh()
+        if self.label_guesser_updater is not None:
+            self.label_guesser_updater.commit()
+        self.reload_searcher()
+
+    def merge_segments(self):
+        """
+        Merge the small segments written by flush(). Run in background
+        when the index process is idle.
+        """
+        self.need_merge = False
+        if self.index_writer is not None or self.buffered_writer is not None:
+            # will be done by the next commit
+            return
+        if self.rebuilding:
+            # the rebuild writer merges the segments it commits
+            return
+        logger.info("Index: Merging segments")
+        writer = self.index.writer()
+        writer.commit(merge=True)
+        self.index.refresh()
+        self.reload_searcher()
 
     def reload_searcher(self):
         searcher = self.__searcher
         self.__searcher = self.index.searcher()
         del(searcher)
+        self.query_cache.invalidate()
+
+    def get_query_cache_stats(self):
+        """
+        Returns a dict: generation, size, max_size, hits, misses
+        """
+        return self.query_cache.get_stats()
 
     def guess_labels(self, doc):
         """
@@ -478,7 +833,7 @@ class PaperworkIndex(object):
         """
         if doc.nb_pages <= 0:
             return set()
-        self.label_guesser.total_nb_documents = len(self._docs_by_id.keys())
+        self.label_guesser.total_nb_documents = len(self.catalog)
         label_names = self.label_guesser.guess(doc)
         labels = set()
         for label_name in label_names:
@@ -486,11 +841,56 @@ class PaperworkIndex(object):
             labels.add(label)
         return labels
 
+    @staticmethod
+    def __get_guesser_txt(doc):
+        if doc is None or doc.nb_pages <= 0:
+            return u""
+        return doc.text
+
+    def guess_labels_many(self, docids, nb_threads=None):
+        """
+        Same as guess_labels(), for many documents at once. The texts of the
+        documents are read by a pool of threads (the index process cannot
+        have child processes), and the documents are scored all together.
+
+        Arguments:
+            nb_threads --- None = one thread per CPU
+
+        Returns:
+            {docid: set of labels, ...} (unknown documents are omitted)
+        """
+        docs = [self.get_doc_from_docid(docid) for docid in docids]
+        docs = [doc for doc in docs if doc is not None]
+        with concurrent.futures.ThreadPoolExecutor(
+                    get_nb_workers(nb_threads)
+                ) as pool:
+            doc_txts = list(pool.map(self.__get_guesser_txt, docs))
+
+        self.label_guesser.total_nb_documents = len(self.catalog)
+        to_guess = [
+            (doc, doc_txt) for (doc, doc_txt) in zip(docs, doc_txts)
+            if doc_txt != u""
+        ]
+        guessed = self.label_guesser.guess_txts(
+            [doc_txt for (doc, doc_txt) in to_guess]
+        )
+
+        out = {doc.docid: set() for doc in docs}
+        for ((doc, doc_txt), label_names) in zip(to_guess, guessed):
+            out[doc.docid] = {
+                self.labels[label_name] for label_name in label_names
+                if label_name in self.labels
+            }
+        return out
+
     def get_all_docs(self):
-        return [x for x in self._docs_by_id.values()]
+        docids = set(self.catalog.docids())
+        docids.update(self._docs_by_id.keys())
+        docs = (self.get_doc_from_docid(docid) for docid in docids)
+        return [doc for doc in docs if doc is not None]
 
     def get_nb_docs(self):
-        return len(self._docs_by_id)
+        return len(self.catalog)
 
     def get(self, obj_id):
         """
@@ -500,11 +900,17 @@ class PaperworkIndex(object):
         if BasicPage.PAGE_ID_SEPARATOR in obj_id:
             (docid, page_nb) = obj_id.split(BasicPage.PAGE_ID_SEPARATOR)
             page_nb = int(page_nb)
-            return self._docs_by_id[docid].pages[page_nb]
-        return self._docs_by_id[obj_id]
+            return self.__get_known_doc(docid).pages[page_nb]
+        return self.__get_known_doc(obj_id)
+
+    def __get_known_doc(self, docid):
+        doc = self.get_doc_from_docid(docid, inst=False)
+        if doc is None:
+            raise KeyError(docid)
+        return doc
 
     def find_documents(self, sentence, limit=None, must_sort=True,
-                       search_type='fuzzy'):
+                       search_type='fuzzy', offset=0, sort='score'):
         """
         Returns all the documents matching the given keywords
 
@@ -513,57 +919,123 @@ class PaperworkIndex(object):
         Returns:
             An array of document (doc objects)
         """
-        sentence = sentence.strip()
-        sentence = strip_accents(sentence)
-
-        if sentence == u"":
+        if strip_accents(sentence.strip()) == u"":
             return self.get_all_docs()
 
-        result_list_list = []
-        total_results = 0
-
-        for query_parser in self.search_param_list[search_type]:
-            query = query_parser["query_parser"].parse(sentence)
-
-            sortedby = None
-            if must_sort and "sortedby" in query_parser:
-                sortedby = query_parser['sortedby']
-            if sortedby:
-                results = self.__searcher.search(
-                    query, limit=limit, sortedby=sortedby
-                )
-            else:
-                results = self.__searcher.search(
-                    query, limit=limit
-                )
-            results = [
-                (result['docid'], result['doctype'])
-                for result in results
+        results = self.find_documents_ids(sentence, limit=limit,
+                                          must_sort=must_sort,
+                                          search_type=search_type,
+                                          offset=offset, sort=sort)
+        docs = (
+            self.get_doc_from_docid(result.docid, inst=False)
+            for result in results
+        )
+        return [doc for doc in docs if doc is not None]
+
+    def __make_search_result(self, fields, score):
+        docid = fields['docid']
+        entry = self.catalog.get(docid)
+        if entry is not None:
+            labels = [label_name for (label_name, color) in entry.labels]
+            nb_pages = entry.nb_pages
+        else:
+            # label names stored in the index have no accents
+            labels = [
+                label_name for label_name in fields.get('label', '').split(",")
+                if label_name != u""
             ]
+            nb_pages = -1
+        return SEARCH_RESULT(
+            docid=docid, doctype=fields['doctype'], date=fields['date'],
+            score=score, labels=labels, nb_pages=nb_pages
+        )
 
-            result_list_list.append(results)
-            total_results += len(results)
+    def find_documents_ids(self, sentence, limit=None, must_sort=True,
+                           search_type='fuzzy', offset=0, sort='score'):
+        """
+        Same as find_documents(), but returns lightweight search results
+        instead of document objects (see SEARCH_RESULT). Much cheaper to
+        send through the pipe.
 
-            if not must_sort and total_results >= limit:
-                break
+        Arguments:
+            offset, limit --- page of results to return. Each query parser
+                only looks for its 'offset + limit' best hits.
+            sort --- 'score' (most relevant first) or 'date' (most recent
+                first)
+        """
+        sentence = u" ".join(strip_accents(sentence).split())
+
+        # results are cached until the index is modified
+        key = (sentence, search_type, sort if must_sort else None, limit,
+               offset)
+        results = self.query_cache.get(key)
+        if results is None:
+            results = self.__find_documents_ids(
+                sentence, limit, must_sort, search_type, offset, sort
+            )
+            self.query_cache.put(key, results)
+        return list(results)
 
-        # merging results
-        docs = set()
-        for result_intermediate in result_list_list:
-            for result in result_intermediate:
-                doc = self._docs_by_id.get(result[0])
-                if doc is None:
-                    continue
-                docs.add(doc)
+    def __find_documents_ids(self, sentence, limit, must_sort, search_type,
+                             offset, sort):
+        if sentence == u"":
+            queries = [whoosh.query.Every()]
+        else:
+            queries = [
+                query_parser["query_parser"].parse(sentence)
+                for query_parser in self.search_param_list[search_type]
+            ]
 
-        docs = [d for d in docs]
+        top = None
+        if limit is not None:
+            top = offset + limit
+        sortedby = None
+        if must_sort:
+            sortedby = self.sort_facets[sort]
+
+        # searches are only run when their results are required
+        hit_lists = (
+            self.__searcher.search(query, limit=top, sortedby=sortedby)
+            for query in queries
+        )
+        if sortedby:
+            # when sorting, hit.score is actually the sort key. All the
+            # searches use the same facets, so their keys can be compared
+            hits = heapq.merge(*hit_lists, key=lambda hit: hit.score)
+        else:
+            hits = itertools.chain.from_iterable(hit_lists)
 
-        if not must_sort and limit is not None:
-            docs = docs[:limit]
+        results = []
+        docids = set()
+        for hit in hits:
+            docid = hit['docid']
+            if docid in docids:
+                continue
+            docids.add(docid)
+            if len(docids) <= offset:
+                continue
+            results.append(self.__make_search_result(
+                hit.fields(), self.__get_hit_score(hit, sortedby)
+            ))
+            if limit is not None and len(results) >= limit:
+                break
 
-        return docs
+        return results
 
-    def find_suggestions(self, sentence):
+    @staticmethod
+    def __get_hit_score(hit, sortedby):
+        if not sortedby:
+            return hit.score
+        if not isinstance(sortedby[0], whoosh.sorting.ScoreFacet):
+            # relevance not computed
+            return 0.0
+        key = hit.score
+        if isinstance(key, tuple):
+            key = key[0]
+        # ScoreFacet sort key = 0 - score
+        return -key
+
+    def find_suggestions(self, sentence, budget=None):
         """
         Search all possible suggestions. Suggestions returned always have at
         least one document matching.
@@ -571,44 +1043,85 @@ class PaperworkIndex(object):
         Arguments:
             sentence --- keywords (single strings) for which we want
                 suggestions
+            budget --- maximum time (in seconds) to spend looking for
+                suggestions (None = no limit). Once exceeded, only the
+                suggestions already found are returned.
         Return:
             An array of sets of keywords. Each set of keywords (-> one string)
-            is a suggestion.
+            is a suggestion. Best suggestions come first.
         """
         if not isinstance(sentence, str):
             sentence = str(sentence)
 
-        keywords = sentence.split(" ")
+        deadline = None
+        if budget is not None:
+            deadline = time.monotonic() + budget
 
-        query_parser = self.search_param_list['strict'][0]['query_parser']
+        keywords = sentence.split(" ")
 
         base_search = u" ".join(keywords).strip()
-        final_suggestions = []
+        final_suggestions = {}  # suggestion --> rank
         corrector = self.__searcher.corrector("content")
         label_corrector = self.__searcher.corrector("label")
         for (keyword_idx, keyword) in enumerate(keywords):
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.info("Suggestions: Time budget exceeded")
+                break
             if (len(keyword) <= MIN_KEYWORD_LEN):
                 continue
             keyword_suggestions = label_corrector.suggest(
                 keyword, limit=2
             )[:]
             keyword_suggestions += corrector.suggest(keyword, limit=5)[:]
+
+            # documents matching all the other keywords
+            other_keywords = (
+                keywords[:keyword_idx] + keywords[keyword_idx + 1:]
+            )
+            docs = self.term_dict.find_docs(
+                self.__searcher, [strip_accents(k) for k in other_keywords]
+            )
+
             for keyword_suggestion in keyword_suggestions:
                 new_suggestion = keywords[:]
                 new_suggestion[keyword_idx] = keyword_suggestion
                 new_suggestion = u" ".join(new_suggestion).strip()
 
-                if new_suggestion == base_search:
+                if (new_suggestion == base_search or
+                        new_suggestion in final_suggestions):
                     continue
 
                 # make sure it would return results
-                query = query_parser.parse(new_suggestion)
-                results = self.__searcher.search(query, limit=1)
-                if len(results) <= 0:
+                if docs is None:
+                    # the dictionary can't tell: fall back on an actual
+                    # search
+                    results = self.find_documents_ids(
+                        new_suggestion, limit=1, must_sort=False,
+                        search_type='strict'
+                    )
+                    nb_docs = len(results)
+                else:
+                    nb_docs = len(self.term_dict.find_docs(
+                        self.__searcher, [strip_accents(keyword_suggestion)],
+                        docs
+                    ))
+                if nb_docs <= 0:
                     continue
-                final_suggestions.append(new_suggestion)
-        final_suggestions.sort()
-        return final_suggestions
+
+                # the more documents, the better. Then the more frequent,
+                # the better.
+                tf = sum(
+                    self.term_dict.get_tf(self.__searcher, term)
+                    for term in self.term_dict.tokenize(
+                        strip_accents(keyword_suggestion)
+                    )
+                )
+                final_suggestions[new_suggestion] = (-nb_docs, -tf)
+
+        return sorted(
+            final_suggestions.keys(),
+            key=lambda suggestion: (final_suggestions[suggestion], suggestion)
+        )
 
     def create_label(self, label, doc=None):
         """
@@ -625,8 +1138,7 @@ class PaperworkIndex(object):
         # TODO(Jflesch): Should train with previous documents
         if doc:
             doc.add_label(label)
-            self.upd_doc(doc)
-            self.commit()
+            self.__upd_doc_and_commit(doc)
 
     def add_label(self, doc, label, update_index=True):
         """
@@ -640,8 +1152,7 @@ class PaperworkIndex(object):
         assert(label in self.labels.values())
         doc.add_label(label)
         if update_index:
-            self.upd_doc(doc)
-            self.commit()
+            self.__upd_doc_and_commit(doc)
 
     def remove_label(self, doc, label, update_index=True):
         """
@@ -649,35 +1160,114 @@ class PaperworkIndex(object):
         """
         doc.remove_label(label)
         if update_index:
-            self.upd_doc(doc)
-            self.commit()
+            self.__upd_doc_and_commit(doc)
+
+    def get_docids_with_label(self, label_name):
+        """
+        Returns:
+            The ids of the documents having the label 'label_name', according
+            to the index
+        """
+        # the 'label' field is case-sensitive, but labels are not (see
+        # Label.sort_key): look for all the spellings of the label
+        sort_key = strip_accents(label_name).strip().lower()
+        terms = [
+            term for term in self.__searcher.reader().field_terms("label")
+            if strip_accents(term).strip().lower() == sort_key
+        ]
+        if len(terms) <= 0:
+            return []
+        query = whoosh.query.Or(
+            [whoosh.query.Term("label", term) for term in terms]
+        )
+        results = self.__searcher.search(query, limit=None)
+        return [result['docid'] for result in results]
+
+    def __start_label_mutation(self, label_name, func):
+        """
+        Apply 'func' on all the documents having the label 'label_name'.
+        'func' is expected to rewrite the label file of the document. The
+        files are rewritten by a bounded pool of threads.
+
+        Returns:
+            (pool of threads, iterator on the updated documents,
+             number of documents)
+        """
+        docids = self.get_docids_with_label(label_name)
+        docs = [self.get_doc_from_docid(docid) for docid in docids]
+        docs = [doc for doc in docs if doc is not None]
+        logger.info("Label %s: %d documents to update", label_name, len(docs))
+
+        def mutate(doc):
+            func(doc)
+            return doc
+
+        pool = concurrent.futures.ThreadPoolExecutor(
+            self.LABEL_UPDATE_THREADS
+        )
+        return (pool, pool.map(mutate, docs), len(docs))
 
     def start_update_label(self, old_label, new_label):
+        """
+        Returns:
+            The number of documents that will be updated
+        """
         assert(old_label)
         assert(new_label)
         self.labels.pop(old_label.name)
         if new_label not in self.labels.values():
             self.labels[new_label.name] = new_label
-        self.update_label_data['docs'] = iter(self.get_all_docs())
+        (pool, docs, nb_docs) = self.__start_label_mutation(
+            old_label.name,
+            lambda doc: doc.update_label(old_label, new_label)
+        )
+        self.update_label_data['pool'] = pool
+        self.update_label_data['docs'] = docs
         self.update_label_data['old_label'] = old_label
         self.update_label_data['new_label'] = new_label
+        return nb_docs
 
-    def continue_update_label(self):
-        doc = None
+    def __next_label_mutation(self, data):
+        """
+        Returns:
+            The next document updated by the pool of threads of
+            __start_label_mutation(). None once they are all done.
+        """
         try:
-            doc = next(self.update_label_data['docs'])
+            return next(data['docs'])
         except StopIteration:
+            return None
+        except BaseException:
+            self.__stop_label_mutation(data)
+            raise
+
+    @staticmethod
+    def __stop_label_mutation(data):
+        pool = data.pop('pool', None)
+        if pool is not None:
+            pool.shutdown()
+
+    def abort_label_mutation(self):
+        """
+        Must be called if update_label() or destroy_label() has been
+        interrupted. Label files already rewritten remain so: the index is
+        updated accordingly.
+        """
+        for data in (self.update_label_data, self.destroy_label_data):
+            self.__stop_label_mutation(data)
+            data.clear()
+        self.commit()
+
+    def continue_update_label(self):
+        doc = self.__next_label_mutation(self.update_label_data)
+        if doc is None:
             return ('end', None)
 
-        old_label = self.update_label_data['old_label']
-        new_label = self.update_label_data['new_label']
-        must_reindex = old_label in doc.labels
-        doc.update_label(old_label, new_label)
-        if must_reindex:
-            self.upd_doc(doc, label_guesser_update=False)
+        self.upd_doc(doc, label_guesser_update=False)
         return ('updated', doc.clone())
 
     def end_update_label(self):
+        self.__stop_label_mutation(self.update_label_data)
         self.commit()
 
         old_label = self.update_label_data['old_label']
@@ -687,36 +1277,45 @@ class PaperworkIndex(object):
         self.update_label_data = {}
 
     def start_destroy_label(self, label):
+        """
+        Returns:
+            The number of documents that will be updated
+        """
         assert(label)
         self.labels.pop(label.name)
-        self.destroy_label_data['docs'] = iter(self.get_all_docs())
+        (pool, docs, nb_docs) = self.__start_label_mutation(
+            label.name, lambda doc: doc.remove_label(label)
+        )
+        self.destroy_label_data['pool'] = pool
+        self.destroy_label_data['docs'] = docs
         self.destroy_label_data['label'] = label
+        return nb_docs
 
     def continue_destroy_label(self):
-        doc = None
-        try:
-            doc = next(self.destroy_label_data['docs'])
-        except StopIteration:
+        doc = self.__next_label_mutation(self.destroy_label_data)
+        if doc is None:
             return ('end', None)
-        label = self.destroy_label_data['label']
-        must_reindex = (label in doc.labels)
-        doc.remove_label(label)
-        if must_reindex:
-            self.upd_doc(doc, label_guesser_update=False)
+        self.upd_doc(doc, label_guesser_update=False)
         return ('label_deleted', doc)
 
     def end_destroy_label(self):
         label = self.destroy_label_data['label']
+        self.__stop_label_mutation(self.destroy_label_data)
         self.commit()
         self.label_guesser.forget(label.name)
         self.destroy_label_data = {}
 
     def close(self):
+        if self.opened:
+            self.flush()
+        self.need_merge = False
+        self.rebuilding = False
         self.opened = False
         if self.__searcher:
             self.__searcher.close()
             del self.__searcher
         self.__searcher = None
+        self.query_cache.invalidate()
         if self.index:
             self.index.close()
             del self.index
@@ -749,6 +1348,20 @@ class PaperworkIndex(object):
             whoosh.query.Term('docfilehash', filehash))
         return bool(results)
 
+    def get_hashes_in_index(self, filehashes):
+        """
+        Batched version of is_hash_in_index()
+
+        Returns:
+            The subset of 'filehashes' used by some documents
+        """
+        return {
+            filehash for filehash in filehashes
+            if self.__searcher.document_number(
+                docfilehash=(u"%X" % filehash)
+            ) is not None
+        }
+
     def get_label_list(self):
         labels = [label for label in self.labels.values()]
         labels.sort()
@@ -776,10 +1389,11 @@ class MethodProxy(object):
 
 
 class PaperworkIndexClient(object):
-    def __init__(self):
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
         server = PaperworkIndex()
         self.pipe = server.pipe_client
         self.lock = threading.Lock()
+        self.chunk_size = chunk_size
 
     def remote_call(self, func_name, *args, **kwargs):
         with self.lock:
@@ -790,5 +1404,49 @@ class PaperworkIndexClient(object):
                 raise ret.exc
             return ret.ret
 
+    def remote_call_many(self, calls, stop_on=None):
+        """
+        Send many calls in a single message.
+
+        Arguments:
+            calls --- [(func_name, args, kwargs), ...]
+            stop_on --- if not None, stop as soon as a call returns this
+                value
+
+        Returns:
+            The list of the returned values. If 'stop_on' has been
+            returned, it is the last element of the list and the following
+            calls have not been made.
+        """
+        with self.lock:
+            batch = BATCH(
+                commands=[
+                    COMMAND(func=func_name, args=args, kwargs=kwargs)
+                    for (func_name, args, kwargs) in calls
+                ],
+                stop_on=stop_on
+            )
+            self.pipe.send(batch)
+            results = self.pipe.recv()
+        for result in results:
+            if result.exc:
+                raise result.exc
+        return [result.ret for result in results]
+
+    def iter_steps(self, func_name, end_value, chunk_size=None):
+        """
+        Call repeatedly the method 'func_name' (without arguments) until it
+        returns 'end_value' and yield the returned values. Calls are sent
+        'chunk_size' by 'chunk_size' in a single message.
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        calls = [(func_name, (), {})] * chunk_size
+        while True:
+            for ret in self.remote_call_many(calls, stop_on=end_value):
+                if ret == end_value:
+                    return
+                yield ret
+
     def __getattr__(self, name):
         return MethodProxy(self, name)
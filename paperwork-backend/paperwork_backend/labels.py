@@ -17,16 +17,13 @@
 """
 Code to manage document labels
 """
-import base64
-import hashlib
 import logging
-import os
+import threading
 
 from gi.repository import Gdk
-import simplebayes
 
+from .bayes import MultiLabelBayes
 from .util import mkdir_p
-from .util import rm_rf
 from .util import strip_accents
 
 
@@ -37,91 +34,112 @@ class Label(object):
 
     """
     Represents a Label (color + string).
+
+    Labels are immutable and interned: Label(name, color) always returns the
+    same object for the same name and color. The normalized name (used to
+    sort and compare labels) and the color components are computed only
+    once.
     """
 
-    def __init__(self, name=u"", color="#000000000000"):
+    __slots__ = ("name", "_color", "_color_str", "sort_key", "rgb")
+
+    _registry = {}  # (name, color) --> label
+    _registry_lock = threading.Lock()
+
+    def __new__(cls, name=u"", color="#000000000000"):
         """
         Arguments:
             name --- label name
             color --- label color (string representation, see get_color_str())
         """
-        if isinstance(name, str):
-            self.name = name
-        else:
-            self.name = str(name)
-        self._color = color
+        if not isinstance(name, str):
+            name = str(name)
+        key = (name, color)
+        with cls._registry_lock:
+            label = cls._registry.get(key)
+            if label is not None:
+                return label
+
+            label = object.__new__(cls)
+            gdk_color = Gdk.RGBA()
+            gdk_color.parse(color)
+            object.__setattr__(label, "name", name)
+            object.__setattr__(label, "_color", color)
+            object.__setattr__(label, "_color_str", gdk_color.to_string())
+            object.__setattr__(
+                label, "sort_key", strip_accents(name).lower()
+            )
+            object.__setattr__(
+                label, "rgb",
+                (gdk_color.red, gdk_color.green, gdk_color.blue)
+            )
+            cls._registry[key] = label
+            return label
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Labels are immutable")
+
+    def __reduce__(self):
+        # unpickled labels must be interned too
+        return (Label, (self.name, self._color))
 
     def _get_color(self):
         color = Gdk.RGBA()
         color.parse(self._color)
         return color
 
-    def _set_color(self, color):
-        self._color = color.to_string()
-
-    color = property(_get_color, _set_color)
+    color = property(_get_color)
 
     def __copy__(self):
-        return Label(self.name, self.get_color_str())
-
-    def __label_cmp(self, other):
-        """
-        Comparaison function. Can be used to sort labels alphabetically.
-        """
-        if other is None:
-            return -1
-
-        label_name = strip_accents(self.name).lower()
-        other_name = strip_accents(other.name).lower()
-        if label_name < other_name:
-            return -1
-        elif label_name == other_name:
-            return 0
-        else:
-            return 1
+        return self
 
-        if self.get_color_str() < other.get_color_str():
-            return -1
-        elif self.get_color_str() == other.get_color_str():
-            return 0
-        else:
-            return 1
+    def __deepcopy__(self, memo):
+        return self
 
     def __lt__(self, other):
-        return self.__label_cmp(other) < 0
+        if other is None:
+            return True
+        return self.sort_key < other.sort_key
 
     def __gt__(self, other):
-        return self.__label_cmp(other) > 0
+        if other is None:
+            return False
+        return self.sort_key > other.sort_key
 
     def __eq__(self, other):
-        return self.__label_cmp(other) == 0
+        # the same name may have been stored with different colors in the
+        # label files of the documents: those labels are still equal.
+        if self is other:
+            return True
+        if other is None:
+            return False
+        return self.sort_key == other.sort_key
 
     def __le__(self, other):
-        return self.__label_cmp(other) <= 0
+        return not self.__gt__(other)
 
     def __ge__(self, other):
-        return self.__label_cmp(other) >= 0
+        return not self.__lt__(other)
 
     def __ne__(self, other):
-        return self.__label_cmp(other) != 0
+        return not self.__eq__(other)
 
     def __hash__(self):
-        return hash(self.name)
+        return hash(self.sort_key)
 
     def get_html_color(self):
         """
         get a string representing the color, using HTML notation
         """
-        color = self.color
         return ("#%02x%02x%02x" % (
-            int(color.red), int(color.green), int(color.blue)
+            int(self.rgb[0]), int(self.rgb[1]), int(self.rgb[2])
         ))
 
     def get_color_str(self):
         """
         Returns a string representation of the color associated to this label.
         """
-        return self.color.to_string()
+        return self._color_str
 
     def get_html(self):
         """
@@ -141,8 +159,7 @@ class Label(object):
             return (1.0, 1.0, 1.0)  # white
 
     def get_rgb_bg(self):
-        color = self.color
-        return (color.red, color.green, color.blue)
+        return self.rgb
 
     def __str__(self):
         return ("Color: %s ; Text: %s"
@@ -157,7 +174,11 @@ class LabelGuessUpdater(object):
         self.guesser = guesser
         self.updated_docs = set()
 
-    def _get_doc_txt(self, doc):
+    @staticmethod
+    def get_doc_txt(doc):
+        """
+        Returns the text used to train the label guesser
+        """
         if doc.nb_pages <= 0:
             return u""
         # document is added page per page --> the first page only
@@ -170,54 +191,48 @@ class LabelGuessUpdater(object):
         return txt
 
     def add_doc(self, doc):
-        doc_txt = self._get_doc_txt(doc)
+        doc_txt = self.get_doc_txt(doc)
         if doc_txt == "":
             return
+        self.add_doc_txt(doc_txt, {label.name for label in doc.labels})
+        self.updated_docs.add(doc)
 
-        labels = {label.name for label in doc.labels}
+    def add_doc_txt(self, doc_txt, labels):
+        """
+        Same as add_doc(), for when only the text of the document (see
+        get_doc_txt()) and the names of its labels are known
+        """
+        if doc_txt == "":
+            return
 
         # just in case, make sure all the labels are loaded
         for label in labels:
             self.guesser.load(label)
 
-        for (label, guesser) in self.guesser._bayes.items():
-            value = "yes" if label in labels else "no"
-            guesser.train(value, doc_txt)
-
-        self.updated_docs.add(doc)
+        bayes = self.guesser._get_bayes()
+        bayes.train(bayes.tokenize(doc_txt), labels)
 
     def upd_doc(self, doc):
-        doc_txt = self._get_doc_txt(doc)
+        doc_txt = self.get_doc_txt(doc)
         if doc_txt == "":
             return
 
         new_labels = {label.name for label in doc.labels}
         old_labels = {label.name for label in doc._previous_labels}
+        added = new_labels.difference(old_labels)
+        removed = old_labels.difference(new_labels)
 
-        for new_label in new_labels:
-            if new_label in old_labels:
-                # unchanged
-                continue
-            # just in case, make sure all the labels are loaded
-            self.guesser.load(new_label)
-            guesser = self.guesser._bayes[new_label]
-            guesser.untrain("no", doc_txt)
-            guesser.train("yes", doc_txt)
-
-        for old_label in old_labels:
-            if old_label in new_labels:
-                # unchanged
-                continue
-            # just in case, make sure all the labels are loaded
-            self.guesser.load(old_label)
-            guesser = self.guesser._bayes[old_label]
-            guesser.untrain("yes", doc_txt)
-            guesser.train("no", doc_txt)
+        # just in case, make sure all the labels are loaded
+        for label in added.union(removed):
+            self.guesser.load(label)
+
+        bayes = self.guesser._get_bayes()
+        bayes.relabel(bayes.tokenize(doc_txt), removed, added)
 
         self.updated_docs.add(doc)
 
     def del_doc(self, doc):
-        doc_txt = self._get_doc_txt(doc)
+        doc_txt = self.get_doc_txt(doc)
         if doc_txt == "":
             return
 
@@ -227,32 +242,38 @@ class LabelGuessUpdater(object):
         for label in labels:
             self.guesser.load(label)
 
-        for (label, guesser) in self.guesser._bayes.items():
-            value = "yes" if label in labels else "no"
-            guesser.untrain(value, doc_txt)
+        bayes = self.guesser._get_bayes()
+        bayes.untrain(bayes.tokenize(doc_txt), labels)
 
         self.updated_docs.add(doc)
 
     def commit(self):
-        for baye in self.guesser._bayes.values():
-            baye.cache_persist()
+        self.guesser.save()
         for doc in self.updated_docs:
             # Acknowledge the new labels
             doc._previous_labels = doc.labels[:]
         self.updated_docs = set()
 
     def cancel(self):
-        names = [x for x in self.guesser._bayes.keys()]  # copy
-        for label_name in names:
-            self.guesser.load(label_name, force_reload=True)
+        self.guesser.reload()
         self.updated_docs = set()
 
 
 class LabelGuesser(object):
+    """
+    Guess the labels of a document. All the labels are handled by a single
+    classifier (see bayes.MultiLabelBayes), stored in 'bayes_dir'.
+
+    The classifier is only loaded when it is actually needed (first
+    scoring or training).
+    """
+
     def __init__(self, bayes_dir, total_nb_documents, lang=None):
         self._bayes_dir = bayes_dir
         self.total_nb_documents = total_nb_documents
-        self._bayes = {}
+        self._bayes = None  # see _get_bayes()
+        # labels to add to the classifier once loaded
+        self._pending_labels = set()
 
         self.set_language(lang)
 
@@ -262,45 +283,63 @@ class LabelGuesser(object):
         # Not used yet
         pass
 
-    def _get_baye_dir(self, label_name):
-        label_bytes = label_name.encode("utf-8")
-        label_hash = hashlib.sha1(label_bytes).digest()
-        label_hash = base64.encodebytes(label_hash).decode('utf-8').strip()
-        label_hash = label_hash.replace('/', '_')
-        return os.path.join(self._bayes_dir, label_hash)
-
-    def load(self, label_name, force_reload=False):
-        baye_dir = self._get_baye_dir(label_name)
-        mkdir_p(baye_dir)
-        if label_name not in self._bayes or force_reload:
-            self._bayes[label_name] = simplebayes.SimpleBayes(
-                cache_path=baye_dir
-            )
-            self._bayes[label_name].cache_train()
+    def _get_bayes(self):
+        if self._bayes is None:
+            self._bayes = MultiLabelBayes()
+            self._bayes.load(self._bayes_dir)
+            for label_name in self._pending_labels:
+                self._bayes.add_label(label_name)
+            self._pending_labels = set()
+        return self._bayes
+
+    def load(self, label_name):
+        """
+        Make sure the label is known by the classifier
+        """
+        if self._bayes is None:
+            self._pending_labels.add(label_name)
+        else:
+            self._bayes.add_label(label_name)
+
+    def reload(self):
+        """
+        Drop all the changes that haven't been saved
+        """
+        if self._bayes is None:
+            return
+        self._pending_labels.update(self._bayes.labels)
+        self._bayes = None
+
+    def save(self):
+        if self._bayes is None:
+            return
+        mkdir_p(self._bayes_dir)
+        self._bayes.save(self._bayes_dir)
 
     def forget(self, label_name):
         """
         Forget training for label 'label_name'
         """
-        self._bayes.pop(label_name)
-        baye_dir = self._get_baye_dir(label_name)
-        logger.info("Deleting label training {} : {}".format(
-            label_name, baye_dir
-        ))
-        rm_rf(baye_dir)
+        logger.info("Deleting label training {}".format(label_name))
+        self._pending_labels.discard(label_name)
+        self._get_bayes().remove_label(label_name)
+        self.save()
 
     def rename(self, old_label_name, new_label_name):
         """
         Take into account that a label has been renamed
         """
         assert(old_label_name != new_label_name)
-        self._bayes.pop(old_label_name)
-        old_baye_dir = self._get_baye_dir(old_label_name)
-        new_baye_dir = self._get_baye_dir(new_label_name)
-        logger.info("Renaming label training {} -> {} : {} -> {}".format(
-            old_label_name, new_label_name, old_baye_dir, new_baye_dir
+        logger.info("Renaming label training {} -> {}".format(
+            old_label_name, new_label_name
         ))
-        os.rename(old_baye_dir, new_baye_dir)
+        self._pending_labels.discard(old_label_name)
+        bayes = self._get_bayes()
+        if bayes.has_label(old_label_name):
+            bayes.rename_label(old_label_name, new_label_name)
+        else:
+            bayes.add_label(new_label_name)
+        self.save()
 
     def get_updater(self):
         return LabelGuessUpdater(self)
@@ -309,24 +348,24 @@ class LabelGuesser(object):
         doc_txt = doc.text
         if doc_txt == u"":
             return {}
-        out = {}
-        for (label_name, guesser) in self._bayes.items():
-            scores = guesser.score(doc_txt)
-            yes = scores['yes'] if 'yes' in scores else 0.0
-            no = scores['no'] if 'no' in scores else 0.0
-            logger.info("Score for {}: Yes: {} ({})".format(
-                label_name, yes, type(doc_txt)
-            ))
-            logger.info("Score for {}: No: {} ({})".format(
-                label_name, no, type(doc_txt)
+        out = self.score_txts([doc_txt])[0]
+        for (label_name, scores) in out.items():
+            logger.debug("Score for {}: Yes: {} ; No: {}".format(
+                label_name, scores['yes'], scores['no']
             ))
-            out[label_name] = {"yes": yes, "no": no}
         return out
 
-    def guess(self, doc, scores=None):
-        if not scores:
-            scores = self.score(doc)
+    def score_txts(self, doc_txts):
+        """
+        Score many document texts at once
+
+        Returns:
+            [{label name: {"yes": score, "no": score}, ...}, ...]
+        """
+        bayes = self._get_bayes()
+        return bayes.score_many([bayes.tokenize(txt) for txt in doc_txts])
 
+    def _get_label_names(self, scores):
         label_names = set()
         for (label_name, scores) in scores.items():
             yes = scores['yes']
@@ -340,3 +379,20 @@ class LabelGuesser(object):
                 label_names.add(label_name)
 
         return label_names
+
+    def guess(self, doc, scores=None):
+        if not scores:
+            scores = self.score(doc)
+        return self._get_label_names(scores)
+
+    def guess_txts(self, doc_txts):
+        """
+        Same as guess(), for many document texts at once
+
+        Returns:
+            [set of label names, ...]
+        """
+        return [
+            self._get_label_names(scores)
+            for scores in self.score_txts(doc_txts)
+        ]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import logging
+import multiprocessing
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_nb_workers(nb_workers=None):
+    """
+    None or <= 0 --> one worker per CPU
+    """
+    if nb_workers is None or nb_workers <= 0:
+        nb_workers = multiprocessing.cpu_count()
+    return nb_workers
+
+
+def make_pool(nb_workers=None):
+    """
+    Returns a pool of worker processes.
+
+    Workers are spawned instead of forked: the caller may be the GUI, with
+    GLib/Gtk threads running, and forking them is not safe.
+    Beware that PaperworkIndex runs as a daemon process and therefore cannot
+    use this (daemon processes are not allowed to have children).
+    """
+    nb_workers = get_nb_workers(nb_workers)
+    logger.info("Starting %d worker processes", nb_workers)
+    ctx = multiprocessing.get_context("spawn")
+    return ctx.Pool(nb_workers)
+
+
+def split_in_batches(iterable, batch_size):
+    """
+    Yield lists of at most 'batch_size' elements
+    """
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
@@ -21,6 +21,7 @@ from gi.repository import Gio
 from gi.repository import Poppler
 
 from ..common.doc import BasicDoc
+from ..common.doc import DOC_DIR_CACHE
 from ..common.export import Exporter
 from ..common.export import dummy_export_progress_cb
 from ..pdf.page import PdfPage
@@ -29,6 +30,26 @@ PDF_FILENAME = "doc.pdf"
 logger = logging.getLogger(__name__)
 
 
+def check_pdf(file_uri):
+    """
+    Make sure the file is a PDF file that Poppler can open.
+
+    Returns:
+        (number of pages, None) or (None, error message)
+    """
+    gfile = Gio.File.new_for_uri(file_uri)
+    try:
+        pdf = Poppler.Document.new_from_gfile(gfile)
+        return (pdf.get_n_pages(), None)
+    except GLib.GError as exc:
+        logger.error(
+            "Warning: Unable to open the PDF to import: {}/{}".format(
+                file_uri, exc
+            )
+        )
+        return (None, str(exc))
+
+
 class PdfDocExporter(Exporter):
     def __init__(self, doc, page_nb):
         super().__init__(doc, 'PDF')
@@ -61,48 +82,12 @@ class PdfDocExporter(Exporter):
         return 'PDF'
 
 
-class PdfPagesIterator(object):
-    def __init__(self, pdfdoc):
-        self.pdfdoc = pdfdoc
-        self.idx = 0
-        self.pages = [pdfdoc.pages[i] for i in range(0, pdfdoc.nb_pages)]
-
-    def __iter__(self):
-        return self
-
-    def next(self):
-        if self.idx >= self.pdfdoc.nb_pages:
-            raise StopIteration()
-        page = self.pages[self.idx]
-        self.idx += 1
-        return page
-
-    def __next__(self):
-        return self.next()
-
-
-class PdfPages(object):
-    def __init__(self, pdfdoc, on_disk_cache=False):
-        self.pdfdoc = pdfdoc
-        self.on_disk_cache = on_disk_cache
-
-    def __getitem__(self, idx):
-        if idx < 0:
-            idx = self.pdf.get_n_pages() + idx
-        return PdfPage(self.pdfdoc, idx,
-                       self.on_disk_cache)
-
-    def __len__(self):
-        return self.pdf.get_n_pages()
-
-    def __iter__(self):
-        return PdfPagesIterator(self.pdfdoc)
-
-
 class _CommonPdfDoc(BasicDoc):
     can_edit = False
     doctype = u"PDF"
 
+    __slots__ = ("pdfpath", "_on_disk_cache", "_nb_pages")
+
     def __init__(self, fs, pdfpath, docpath, docid=None, on_disk_cache=False):
         super().__init__(fs, docpath, docid)
         self.pdfpath = fs.safe(pdfpath)
@@ -130,10 +115,8 @@ class _CommonPdfDoc(BasicDoc):
         filepath = Gio.File.new_for_uri(self.pdfpath)
         return Poppler.Document.new_from_gfile(filepath, password=None)
 
-    def __get_pages(self):
-        return PdfPages(self, self._on_disk_cache)
-
-    pages = property(__get_pages)
+    def _make_page(self, page_nb):
+        return PdfPage(self, page_nb, self._on_disk_cache)
 
     def _get_nb_pages(self):
         if self._nb_pages >= 0:
@@ -174,6 +157,8 @@ class PdfDoc(_CommonPdfDoc):
     can_edit = False
     doctype = u"PDF"
 
+    __slots__ = ()
+
     def __init__(self, fs, docpath, docid=None):
         super().__init__(
             fs,
@@ -186,39 +171,32 @@ class PdfDoc(_CommonPdfDoc):
         return PdfDoc(self.fs, self.path, self.docid)
 
     def _get_last_mod(self):
-        last_mod = super()._get_last_mod()
-        labels_path = self.fs.join(self.path, self.LABEL_FILE)
-        try:
-            file_last_mod = self.fs.getmtime(labels_path)
-            if file_last_mod > last_mod:
-                last_mod = file_last_mod
-        except OSError:
-            pass
-        extra_txt_path = self.fs.join(self.path, self.EXTRA_TEXT_FILE)
-        try:
-            file_last_mod = self.fs.getmtime(extra_txt_path)
+        # the PDF file, the page files and the label file are all in the
+        # document directory: a single directory read is enough
+        file_last_mods = self._get_file_last_mods()
+        if PDF_FILENAME not in file_last_mods:
+            raise IOError("File {} does not exist".format(self.pdfpath))
+        last_mod = file_last_mods[PDF_FILENAME]
+        for (filename, file_last_mod) in file_last_mods.items():
+            is_page_file = (
+                filename.startswith(PdfPage.FILE_PREFIX) and
+                filename.endswith("." + PdfPage.EXT_BOX)
+            )
+            if (not is_page_file and
+                    filename not in (self.LABEL_FILE, self.EXTRA_TEXT_FILE)):
+                continue
             if file_last_mod > last_mod:
                 last_mod = file_last_mod
-        except OSError:
-            pass
         return last_mod
 
     last_mod = property(_get_last_mod)
 
     def import_pdf(self, file_uri):
         logger.info("PDF: Importing '%s'" % (file_uri))
-        gfile = Gio.File.new_for_uri(file_uri)
-        try:
-            # try opening it to make sure it's valid
-            pdf = Poppler.Document.new_from_gfile(gfile)
-            pdf.get_n_pages()
-        except GLib.GError as exc:
-            logger.error(
-                "Warning: Unable to open the PDF to import: {}/{}".format(
-                    file_uri, exc
-                )
-            )
-            return str(exc)
+        # try opening it to make sure it's valid
+        (nb_pages, error) = check_pdf(file_uri)
+        if error is not None:
+            return error
 
         try:
             dest = Gio.File.new_for_uri(self.path)
@@ -232,9 +210,30 @@ class PdfDoc(_CommonPdfDoc):
         f.copy(dest,
                0,  # TODO(Jflesch): Missing flags: don't keep attributes
                None, None, None)
+        DOC_DIR_CACHE.forget(self.path)
         self.pdfpath = dest.get_uri()
+        self._nb_pages = nb_pages
         return None
 
+    def copy_pdf(self, file_uri, nb_pages=None):
+        """
+        Lighter version of import_pdf(): the file must have been checked
+        already (see check_pdf()) and the document directory must exist.
+        Thread-safe as long as each thread has its own document.
+
+        Arguments:
+            nb_pages --- if known, the PDF won't have to be opened again to
+                count its pages
+        """
+        logger.info("PDF: Copying '%s' to '%s'", file_uri, self.path)
+        # for a new document, the path of the PDF file has been computed
+        # before the document id was allocated
+        self.pdfpath = self.fs.join(self.path, PDF_FILENAME)
+        self.fs.copy(file_uri, self.pdfpath, metadata=False)
+        DOC_DIR_CACHE.forget(self.path)
+        if nb_pages is not None:
+            self._nb_pages = nb_pages
+
 
 class ExternalPdfDoc(_CommonPdfDoc):
     """
@@ -285,8 +284,7 @@ def is_pdf_doc(fs, docpath):
     if not fs.isdir(docpath):
         return False
     try:
-        filelist = fs.listdir(docpath)
-        filelist = [fs.basename(filepath) for filepath in filelist]
+        filelist = DOC_DIR_CACHE.get_filenames(fs, docpath)
     except OSError as exc:
         logger.exception("Warning: Failed to list files in %s: %s"
                          % (docpath, str(exc)))
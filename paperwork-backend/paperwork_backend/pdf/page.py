@@ -21,6 +21,7 @@ import pyocr
 import pyocr.builders
 
 from ..common.page import BasicPage
+from ..common.page import PAGE_TEXT_CACHE
 from ..util import surface2image
 
 
@@ -86,6 +87,8 @@ def custom_split(input_str, input_rects, splitter):
 class PdfPage(BasicPage):
     EXT_TXT = "txt"
 
+    __slots__ = ("_size", "__boxes", "_on_disk_cache")
+
     def __init__(self, doc, page_nb, on_disk_cache=True):
         super().__init__(doc, page_nb)
         self._size = None  # page size never change --> can be cached
@@ -134,19 +137,23 @@ class PdfPage(BasicPage):
 
         boxfile = self.__get_box_path()
         if self.fs.exists(boxfile):
-            # reassemble text based on boxes
-            boxes = self.boxes
-            txt = []
-            for line in boxes:
-                txt_line = u""
-                for box in line.word_boxes:
-                    txt_line += u" " + box.content
-                txt.append(txt_line)
-            return txt
+            return PAGE_TEXT_CACHE.get(self.fs, boxfile,
+                                       self.__extract_text)
         else:
             txt = self.pdf_page.get_text()
             return txt.split(u"\n")
 
+    def __extract_text(self):
+        # reassemble text based on boxes
+        boxes = self.boxes
+        txt = []
+        for line in boxes:
+            txt_line = u""
+            for box in line.word_boxes:
+                txt_line += u" " + box.content
+            txt.append(txt_line)
+        return txt
+
     def __get_boxes(self):
         """
         Get all the word boxes of this page.
@@ -196,6 +203,7 @@ class PdfPage(BasicPage):
         boxfile = self.__get_box_path()
         with self.fs.open(boxfile, 'w') as file_desc:
             pyocr.builders.LineBoxBuilder().write_file(file_desc, boxes)
+        PAGE_TEXT_CACHE.forget(boxfile)
 
     boxes = property(__get_boxes, __set_boxes)
 
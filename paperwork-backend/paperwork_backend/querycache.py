@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import collections
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache(object):
+    """
+    Bounded LRU cache of search results.
+
+    All the entries are only valid for a given generation of the index:
+    each time the index is modified (or the searcher reloaded), the
+    generation must be bumped with invalidate().
+    """
+
+    DEFAULT_MAX_SIZE = 256
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()  # key --> results
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns None if the results of this query are not known
+        """
+        try:
+            results = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return results
+
+    def put(self, key, results):
+        self._entries[key] = results
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        self._entries.clear()
+        self.generation += 1
+        logger.debug("Query cache invalidated (generation: %d)",
+                     self.generation)
+
+    def get_stats(self):
+        return {
+            'generation': self.generation,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
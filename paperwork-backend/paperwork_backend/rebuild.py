@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Rebuild the index from scratch: the document texts are extracted by a pool
+of worker processes and written by the calling process (not by the index
+process).
+"""
+
+import logging
+
+import whoosh.index
+
+from .catalog import make_catalog_entry
+from .fs import LocalFileSystem
+from .index import get_doc_index_fields
+from .index import inst_doc
+from .labels import LabelGuessUpdater
+from .parallel import make_pool
+from .parallel import split_in_batches
+
+
+logger = logging.getLogger(__name__)
+
+# number of documents extracted by a worker in one go
+DEFAULT_BATCH_SIZE = 10
+
+
+def _extract_docs(docdirs):
+    """
+    Run in a worker process.
+
+    Arguments:
+        docdirs --- [(docpath, docid), ...]
+
+    Returns:
+        (number of document directories examined,
+         [(Whoosh fields, catalog entry, labels, label guesser text), ...])
+    """
+    fs = LocalFileSystem()
+    out = []
+    for (docpath, docid) in docdirs:
+        try:
+            doc = inst_doc(fs, docpath, docid)
+            if doc is None:
+                continue
+            (fields, last_mod) = get_doc_index_fields(doc)
+            labels = doc.labels
+            entry = make_catalog_entry(
+                doc, labels, last_mod, fields['docfilehash']
+            )
+            out.append((
+                fields, entry, labels, LabelGuessUpdater.get_doc_txt(doc)
+            ))
+        except Exception as exc:
+            logger.warning("Failed to extract %s", docpath, exc_info=exc)
+    return (len(docdirs), out)
+
+
+def rebuild_index(index_client, fs, rootdir, nb_workers=None,
+                  batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Must be run from a process allowed to have children (not from the index
+    process itself).
+
+    Arguments:
+        index_client --- index.PaperworkIndexClient
+        nb_workers --- None = one worker per CPU. Used for the text
+            extraction.
+
+    Yields:
+        (nb_docdirs_done, nb_docdirs)
+    """
+    docdirs = [
+        (info.uri, info.name)
+        for info in fs.enumerate(rootdir, ())
+        if info.is_dir
+    ]
+    nb_docdirs = len(docdirs)
+
+    logger.info("Rebuilding the index: %d document directories", nb_docdirs)
+    indexdir = index_client.start_rebuild()
+    index = whoosh.index.open_dir(indexdir)
+    # Whoosh multi-process writers fork: not safe from the GUI (see
+    # parallel.make_pool()). The workers of the pool do the expensive part
+    # (the text extraction) anyway.
+    writer = index.writer()
+
+    try:
+        done = 0
+        with make_pool(nb_workers) as pool:
+            batches = split_in_batches(docdirs, batch_size)
+            for (nb_done, docs) in pool.imap_unordered(_extract_docs,
+                                                       batches):
+                for (fields, entry, labels, guesser_txt) in docs:
+                    writer.add_document(**fields)
+                index_client.add_rebuilt_docs([
+                    (entry, labels, guesser_txt)
+                    for (fields, entry, labels, guesser_txt) in docs
+                ])
+                done += nb_done
+                yield (done, nb_docdirs)
+        logger.info("Rebuilding the index: committing")
+        writer.commit()
+    except BaseException:
+        logger.warning("Index rebuild interrupted")
+        writer.cancel()
+        index_client.abort_rebuild()
+        raise
+    finally:
+        index.close()
+
+    index_client.end_rebuild()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Parallel examination of the work directory: find the new, modified,
+unchanged and deleted documents using a pool of worker processes.
+"""
+
+import datetime
+import logging
+
+from .fs import LocalFileSystem
+from .img.doc import ImgDoc
+from .index import inst_doc
+from .parallel import make_pool
+from .parallel import split_in_batches
+
+
+logger = logging.getLogger(__name__)
+
+# number of document directories examined by a worker in one go
+DEFAULT_BATCH_SIZE = 50
+
+
+def _examine_docdirs(docdirs):
+    """
+    Run in a worker process.
+
+    Arguments:
+        docdirs --- [(docpath, docid, doctype or None), ...]
+
+    Returns:
+        [(docid, doc or None, last_mod), ...]
+    """
+    fs = LocalFileSystem()
+    out = []
+    for (docpath, docid, doctype) in docdirs:
+        try:
+            doc = inst_doc(fs, docpath, docid, doctype, check_exists=False)
+            if doc is None:
+                out.append((docid, None, None))
+                continue
+            out.append((docid, doc, doc.last_mod))
+        except Exception as exc:
+            logger.warning("Failed to examine %s", docpath, exc_info=exc)
+            out.append((docid, None, None))
+    return out
+
+
+def examine_rootdir(fs, rootdir, old_doc_infos, nb_workers=None,
+                    batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Shard the document directories across a pool of worker processes.
+
+    Arguments:
+        old_doc_infos --- see PaperworkIndex.get_indexed_doc_infos()
+        nb_workers --- None = one worker per CPU
+
+    Yields:
+        (nb_docdirs, [(status, doc), ...]) where status is one of 'new',
+        'modified', 'unchanged', 'deleted' (doc may be None if the directory
+        doesn't contain a valid document). Deleted documents come last.
+    """
+    docdirs = [
+        (info.uri, info.name)
+        for info in fs.enumerate(rootdir, ())
+        if info.is_dir
+    ]
+    nb_docdirs = len(docdirs)
+    old_doc_list = set(old_doc_infos.keys())
+
+    batches = split_in_batches(
+        (
+            (docpath, docid, old_doc_infos.get(docid, (None, None))[0])
+            for (docpath, docid) in docdirs
+        ),
+        batch_size
+    )
+
+    logger.info("Examining %d document directories", nb_docdirs)
+    with make_pool(nb_workers) as pool:
+        for results in pool.imap_unordered(_examine_docdirs, batches):
+            chunk = []
+            for (docid, doc, last_mod) in results:
+                if doc is None:
+                    chunk.append(('continue', None))
+                    continue
+                if docid not in old_doc_list:
+                    chunk.append(('new', doc))
+                    continue
+                old_doc_list.remove(docid)
+                last_mod = datetime.datetime.fromtimestamp(last_mod)
+                if old_doc_infos[docid][1] != last_mod:
+                    chunk.append(('modified', doc))
+                else:
+                    chunk.append(('unchanged', doc))
+            yield (nb_docdirs, chunk)
+
+    for docids in split_in_batches(old_doc_list, batch_size):
+        yield (nb_docdirs, [
+            ('deleted', ImgDoc(fs, fs.join(rootdir, docid), docid))
+            for docid in docids
+        ])
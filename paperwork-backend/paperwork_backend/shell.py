@@ -1,3 +1,4 @@
+import collections
 import gc
 import itertools
 import json
@@ -5,20 +6,21 @@ import os
 import sys
 
 import gi
-import pyocr
 
 gi.require_version('Gdk', '3.0')
 gi.require_version('PangoCairo', '1.0')
 gi.require_version('Poppler', '0.18')
 
+from . import batchocr  # noqa: E402
 from . import config  # noqa: E402
 from . import docimport  # noqa: E402
 from . import docsearch  # noqa: E402
 from .labels import Label  # noqa: E402
+from .parallel import split_in_batches  # noqa: E402
 from . import fs  # noqa: E402
 
 
-FS = fs.GioFileSystem()
+FS = fs.LocalFileSystem()
 
 
 def is_verbose():
@@ -325,13 +327,43 @@ def cmd_export_doc(*args):
     reply(r)
 
 
+# number of documents sent to the index process in one go by guess_labels
+GUESS_LABELS_BATCH_SIZE = 50
+
+
+def _apply_guessed_labels(dsearch, doc, guessed):
+    """
+    Returns True if the labels of the document have been changed.
+    The index is not updated.
+    """
+    changed = False
+    for label in guessed:
+        if label not in doc.labels:
+            dsearch.add_label(doc, label, update_index=False)
+            changed = True
+    for label in doc.labels:
+        if label not in guessed:
+            dsearch.remove_label(doc, label, update_index=False)
+            changed = True
+    return changed
+
+
 def cmd_guess_labels(*args):
     """
     Arguments: <document id> [-- [--apply]]
+        or: -- <--all|--label-less> [--apply] [--jobs <N>]
 
     Guess the labels that should be set on the document.
     Example: paperwork-shell guess_labels -- 20161207_1144_00_8 --apply
 
+    With --all (all the documents) or --label-less (only the documents
+    without any label), the documents are handled by batches, and one reply
+    is written for each document as soon as its labels have been guessed.
+    A last reply gives the number of documents examined and modified.
+
+    --jobs: number of threads used to read the document texts. Default is
+    one per CPU.
+
     Possible JSON replies:
         --
         {
@@ -346,6 +378,12 @@ def cmd_guess_labels(*args):
             "guessed_labels": ["label_b", "label_c"],
             "applied": "yes",
         }
+        --
+        {
+            "status": "ok",
+            "nb_docs": 20000,
+            "nb_changed": 123,
+        }
     """
     args = list(args)
 
@@ -353,6 +391,16 @@ def cmd_guess_labels(*args):
     if "--apply" in args:
         apply_labels = True
         args.remove("--apply")
+    nb_threads = None
+    if "--jobs" in args:
+        idx = args.index("--jobs")
+        nb_threads = int(args[idx + 1])
+        args.pop(idx)
+        args.pop(idx)
+    if "--all" in args or "--label-less" in args:
+        return _guess_labels_many(
+            "--label-less" in args, apply_labels, nb_threads
+        )
     docid = args[0]
 
     dsearch = get_docsearch()
@@ -383,14 +431,7 @@ def cmd_guess_labels(*args):
 
     changed = False
     if apply_labels:
-        for label in guessed:
-            if label not in doc.labels:
-                dsearch.add_label(doc, label, update_index=False)
-                changed = True
-        for label in doc.labels:
-            if label not in guessed:
-                dsearch.remove_label(doc, label, update_index=False)
-                changed = True
+        changed = _apply_guessed_labels(dsearch, doc, guessed)
 
     if changed:
         index_updater = dsearch.get_index_updater(optimize=False)
@@ -402,6 +443,52 @@ def cmd_guess_labels(*args):
     reply(r)
 
 
+def _guess_labels_many(label_less, apply_labels, nb_threads):
+    dsearch = get_docsearch()
+
+    # search results already know the labels of the documents: no need to
+    # instantiate them
+    results = dsearch.find_documents_ids("", must_sort=False)
+    docids = sorted(
+        result.docid for result in results
+        if not label_less or len(result.labels) <= 0
+    )
+    verbose("Guessing labels of {} documents".format(len(docids)))
+
+    index_updater = None
+    nb_changed = 0
+    nb_done = 0
+    for batch in split_in_batches(docids, GUESS_LABELS_BATCH_SIZE):
+        guessed_labels = dsearch.guess_labels_many(batch, nb_threads)
+        for docid in batch:
+            if docid not in guessed_labels:
+                continue
+            guessed = guessed_labels[docid]
+            doc = dsearch.get(docid)
+            r = {
+                'docid': docid,
+                'current_labels': [label.name for label in doc.labels],
+                'guessed_labels': [label.name for label in guessed],
+                'applied': "yes" if apply_labels else "no",
+            }
+            if apply_labels and _apply_guessed_labels(dsearch, doc, guessed):
+                if index_updater is None:
+                    index_updater = dsearch.get_index_updater(optimize=False)
+                index_updater.upd_doc(doc)
+                nb_changed += 1
+            reply(r)
+        nb_done += len(batch)
+        verbose("[{}/{}] documents examined".format(nb_done, len(docids)))
+
+    if index_updater is not None:
+        verbose("Updating the index ...")
+        index_updater.commit()
+    reply({
+        'nb_docs': len(docids),
+        'nb_changed': nb_changed,
+    })
+
+
 def _get_importer(fileuris, doc):
     importers = docimport.get_possible_importers(fileuris, current_doc=doc)
 
@@ -427,7 +514,7 @@ def _get_importer(fileuris, doc):
 
 
 def _do_import(filepaths, dsearch, doc, ocr=None, ocr_lang=None,
-               guess_labels=True):
+               guess_labels=True, nb_workers=None):
     index_updater = dsearch.get_index_updater(optimize=False)
 
     fileuris = [FS.safe(f) for f in filepaths]
@@ -438,6 +525,8 @@ def _do_import(filepaths, dsearch, doc, ocr=None, ocr_lang=None,
             raise FileNotFoundError(fileuri)  # NOQA (Python 3.x only)
 
     importer = _get_importer(fileuris, doc)
+    if nb_workers is not None:
+        importer.nb_workers = nb_workers
     verbose("Files {}: Importer = {}".format(fileuris, importer))
     import_result = importer.import_doc(
         fileuris, dsearch, current_doc=doc
@@ -451,6 +540,7 @@ def _do_import(filepaths, dsearch, doc, ocr=None, ocr_lang=None,
     }
 
     if ocr is not None:
+        pages = []
         for page in itertools.chain(
             import_result.new_docs_pages,
             import_result.upd_docs_pages
@@ -460,12 +550,16 @@ def _do_import(filepaths, dsearch, doc, ocr=None, ocr_lang=None,
                     page.pageid
                 ))
                 continue
-            verbose("Running OCR on page {}".format(page.pageid))
-            page.boxes = ocr.image_to_string(
-                page.img,
-                lang=ocr_lang,
-                builder=pyocr.builders.LineBoxBuilder()
-            )
+            pages.append(page)
+        verbose("Running OCR on {} pages".format(len(pages)))
+        for (page, error) in batchocr.ocr_pages(pages, ocr, ocr_lang,
+                                                nb_workers):
+            if error is not None:
+                verbose("OCR failed on page {}: {}".format(
+                    page.pageid, error
+                ))
+                continue
+            verbose("OCR done on page {}".format(page.pageid))
             r['ocr'].append(page.pageid)
 
     for doc in import_result.new_docs:
@@ -502,11 +596,15 @@ def cmd_import(*args):
     """
     Arguments:
         <file_or_folder> [<file_or_folder> [...]]
-            [-- [--no_ocr] [--no_label_guessing] [--append <document_id>]]
+            [-- [--no_ocr] [--no_label_guessing] [--append <document_id>]
+                [--jobs <N>]]
 
     Import a file or a PDF folder. OCR is run by default on images
     and on PDF pages without text (PDF containing only images)
 
+    --jobs: number of worker processes used to hash and check the files of
+    a PDF folder, and to run the OCR. Default is one per CPU.
+
     Please keep in mind that documents that are already in the word directory
     are never imported again and are simply ignored.
 
@@ -562,15 +660,15 @@ def cmd_import(*args):
         }
     """
     guess_labels = True
-    ocr = pyocr.get_available_tools()
+    ocr = batchocr.get_ocr_tool()
     docid = None
     doc = None
+    nb_workers = None
 
     args = list(args)
 
-    if len(ocr) <= 0:
+    if ocr is None:
         raise Exception("No OCR tool found")
-    ocr = ocr[0]
 
     if "--no_label_guessing" in args:
         guess_labels = False
@@ -583,6 +681,11 @@ def cmd_import(*args):
         docid = args[idx + 1]
         args.pop(idx)
         args.pop(idx)
+    if "--jobs" in args:
+        idx = args.index("--jobs")
+        nb_workers = int(args[idx + 1])
+        args.pop(idx)
+        args.pop(idx)
     if len(args) <= 0:
         sys.stderr.write("Nothing to import.\n")
         return
@@ -600,14 +703,89 @@ def cmd_import(*args):
         pconfig = config.PaperworkConfig()
         pconfig.read()
         ocr_lang = pconfig.settings['ocr_lang'].value
-    return _do_import(args, dsearch, doc, ocr, ocr_lang, guess_labels)
+    return _do_import(args, dsearch, doc, ocr, ocr_lang, guess_labels,
+                      nb_workers)
+
+
+# number of documents updated in the index at once by the OCR (the queue of
+# pages is written back on disk each time)
+OCR_INDEX_BATCH_SIZE = 50
+
+
+def _ocr_queue(dsearch, queue, ocr, nb_workers):
+    """
+    Run the pages of the queue through the OCR. The index is updated and
+    the queue written back on disk every OCR_INDEX_BATCH_SIZE documents.
+
+    Only the pages that went through the OCR successfully leave the queue:
+    the others remain there for the next run with --resume.
+
+    Returns:
+        (IDs of the pages that went through the OCR successfully,
+         IDs of the pages on which the OCR failed)
+    """
+    pages = []
+    for pageid in queue.pageids:
+        page = dsearch.get(pageid)
+        if page is None:
+            verbose("Page {} not found".format(pageid))
+            continue
+        pages.append(page)
+    if len(pages) < len(queue.pageids):
+        queue.remove(set(queue.pageids).difference(
+            page.pageid for page in pages
+        ))
+
+    # a document is ready to be indexed once all its pages are done
+    nb_remaining = collections.Counter(page.doc.docid for page in pages)
+    ocred = []
+    failed = []
+    done = collections.defaultdict(list)  # docid --> pageids
+    ready = []
+
+    index_updater = dsearch.get_index_updater(optimize=False)
+
+    def update_index():
+        verbose("Updating index ...")
+        index_updater.upd_docs(ready)
+        index_updater.commit()
+        # only the pages of the documents indexed can leave the queue
+        queue.remove(
+            pageid for doc in ready for pageid in done.pop(doc.docid, ())
+        )
+        ready.clear()
+
+    nb_pages = 0
+    for (page, error) in batchocr.ocr_pages(pages, ocr, queue.ocr_lang,
+                                            nb_workers):
+        nb_pages += 1
+        if error is not None:
+            verbose("[{}/{}] OCR failed on {}: {}".format(
+                nb_pages, len(pages), page.pageid, error
+            ))
+            failed.append(page.pageid)
+        else:
+            verbose("[{}/{}] OCR done on {}".format(
+                nb_pages, len(pages), page.pageid
+            ))
+            ocred.append(page.pageid)
+            done[page.doc.docid].append(page.pageid)
+        nb_remaining[page.doc.docid] -= 1
+        if nb_remaining[page.doc.docid] <= 0:
+            ready.append(page.doc)
+            if len(ready) >= OCR_INDEX_BATCH_SIZE:
+                update_index()
+    if len(ready) > 0:
+        update_index()
+    return (ocred, failed)
 
 
 def cmd_ocr(*args):
     """
     Arguments:
         <document id or page id> [<document id or page id> [...]]
-        [-- [--lang <ocr_lang>] [--empty_only]]
+        [-- [--lang <ocr_lang>] [--empty_only] [--all] [--jobs <N>]
+            [--resume]]
 
     Re-run the OCR on the specified elements. Elements can be whole documents
     or specific pages.
@@ -618,12 +796,24 @@ def cmd_ocr(*args):
     --empty_only: if set, only the pages with no text are run through the OCR.
     Otherwise, all pages are run through it.
 
+    --all: run the OCR on all the documents of the work directory.
+
+    --jobs: number of worker processes running the OCR. Default is one per
+    CPU.
+
+    --resume: resume the previous run, if it has been interrupted or if the
+    OCR failed on some pages. Pages are queued when the run starts and
+    removed from the queue once the index has been updated.
+
     Examples:
         Documents:
           paperwork-shell ocr 20170512_1252_51 20170512_1241_40
           paperwork-shell ocr 20170512_1252_51 20170512_1241_40 -- --lang fra
         Pages:
           paperwork-shell ocr "20170512_1252_51|2" "20170512_1241_40|1"
+        Whole work directory:
+          paperwork-shell ocr -- --all --empty_only --jobs 4
+          paperwork-shell ocr -- --resume --jobs 4
 
     Possible JSON replies:
         --
@@ -637,18 +827,23 @@ def cmd_ocr(*args):
             "ocr": [
                 "20170602_1513_12|0",
                 "20170602_1513_12|1"
+            ],
+            "failed": [
+                "20170602_1513_12|2"
             ]
         }
     """
     ocr_lang = None
     empty_only = False
+    all_docs = False
+    resume = False
+    nb_workers = None
 
     args = list(args)
 
-    ocr = pyocr.get_available_tools()
-    if len(ocr) <= 0:
+    ocr = batchocr.get_ocr_tool()
+    if ocr is None:
         raise Exception("No OCR tool found")
-    ocr = ocr[0]
 
     if "--lang" in args:
         idx = args.index("--lang")
@@ -660,44 +855,63 @@ def cmd_ocr(*args):
         empty_only = True
         args.remove("--empty_only")
 
-    if ocr_lang is None:
-        pconfig = config.PaperworkConfig()
-        pconfig.read()
-        ocr_lang = pconfig.settings['ocr_lang'].value
+    if "--all" in args:
+        all_docs = True
+        args.remove("--all")
 
-    dsearch = get_docsearch()
-    pages = set()
-    docs = set()
+    if "--resume" in args:
+        resume = True
+        args.remove("--resume")
 
-    for objid in args:
-        obj = dsearch.get(objid)
-        if hasattr(obj, 'pages'):
-            pages.update(obj.pages)
-        else:
-            pages.add(obj)
+    if "--jobs" in args:
+        idx = args.index("--jobs")
+        nb_workers = int(args[idx + 1])
+        args.pop(idx)
+        args.pop(idx)
 
-    index_updater = dsearch.get_index_updater(optimize=False)
+    dsearch = get_docsearch()
+    queue = batchocr.OcrQueue(dsearch.indexdir)
 
-    for page in set(pages):
-        if empty_only and len(page.boxes) > 0:
-            pages.remove(page)
-            continue
-        verbose("Running OCR on {} ...".format(page.pageid))
-        page.boxes = ocr.image_to_string(
-            page.img,
-            lang=ocr_lang,
-            builder=pyocr.builders.LineBoxBuilder()
-        )
-        docs.add(page.doc)
+    if resume:
+        if not queue.load():
+            sys.stderr.write("No OCR run to resume\n")
+            return
+        verbose("Resuming OCR: {} pages remaining".format(
+            len(queue.pageids)
+        ))
+    else:
+        if ocr_lang is None:
+            pconfig = config.PaperworkConfig()
+            pconfig.read()
+            ocr_lang = pconfig.settings['ocr_lang'].value
+
+        objs = dsearch.docs if all_docs else [
+            dsearch.get(objid) for objid in args
+        ]
+        pages = []
+        for obj in objs:
+            if hasattr(obj, 'pages'):
+                pages += list(obj.pages)
+            else:
+                pages.append(obj)
+        pageids = collections.OrderedDict()
+        for page in pages:
+            if empty_only and len(page.boxes) > 0:
+                continue
+            pageids[page.pageid] = None
+        queue.start(pageids.keys(), ocr_lang)
 
-    verbose("Updating index ...")
-    for doc in docs:
-        index_updater.upd_doc(doc)
-    index_updater.commit()
-    verbose("Done")
+    (ocred, failed) = _ocr_queue(dsearch, queue, ocr, nb_workers)
+    if len(failed) <= 0:
+        queue.clear()
+        verbose("Done")
+    else:
+        verbose("Done. OCR failed on {} pages: run again with --resume to"
+                " retry them".format(len(failed)))
 
     reply({
-        "ocr": [page.pageid for page in pages]
+        "ocr": ocred,
+        "failed": failed,
     })
 
 
@@ -798,7 +1012,8 @@ def cmd_rename(old_docid, new_docid):
 
 
 class RescanManager(object):
-    def __init__(self):
+    def __init__(self, nb_workers=None):
+        self.nb_workers = nb_workers
         self.dsearch = get_docsearch()
         self.dexaminer = self.dsearch.get_doc_examiner()
         self.index_updater = self.dsearch.get_index_updater()
@@ -854,7 +1069,8 @@ class RescanManager(object):
             self._on_upd_doc,
             self._on_del_doc,
             self._on_doc_unchanged,
-            self._on_progress
+            self._on_progress,
+            nb_workers=self.nb_workers
         )
         if is_verbose():
             sys.stdout.write("\b" * 100 + " " * 100)
@@ -864,11 +1080,16 @@ class RescanManager(object):
         verbose("Done")
 
 
-def cmd_rescan():
+def cmd_rescan(*args):
     """
+    Arguments: [-- [--jobs <N>]]
+
     Rescan the work directory. Look for new, updated or deleted documents
     and update the index accordingly.
 
+    --jobs: number of worker processes used to examine the documents.
+    Default is one per CPU.
+
     Possible JSON replies:
         --
         {
@@ -883,7 +1104,17 @@ def cmd_rescan():
             "deleted_docs": ["xxx", "yyy"],
         }
     """
-    rm = RescanManager()
+    nb_workers = None
+
+    args = list(args)
+
+    if "--jobs" in args:
+        idx = args.index("--jobs")
+        nb_workers = int(args[idx + 1])
+        args.pop(idx)
+        args.pop(idx)
+
+    rm = RescanManager(nb_workers)
     rm.rescan()
     reply(rm.reply)
 
@@ -986,13 +1217,13 @@ def cmd_search(*args):
 
     r = {'results': []}
 
-    docs = dsearch.find_documents(" ".join(args))
-    docs.sort(key=lambda doc: doc.docid)
-    for doc in docs:
+    results = dsearch.find_documents_ids(" ".join(args))
+    results.sort(key=lambda result: result.docid)
+    for result in results:
         r['results'].append({
-            'docid': doc.docid,
-            'nb_pages': doc.nb_pages,
-            'labels': [l.name for l in doc.labels],
+            'docid': result.docid,
+            'nb_pages': result.nb_pages,
+            'labels': result.labels,
         })
     reply(r)
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import re
+
+
+logger = logging.getLogger(__name__)
+
+
+# keywords that the term dictionary cannot evaluate by itself
+QUERY_SYNTAX_REGEX = re.compile(r'[:"()*?~^\[\]{}]')
+QUERY_OPERATORS = {"AND", "OR", "NOT", "ANDNOT", "ANDMAYBE"}
+
+FIELD = "content"
+
+
+class TermDictionary(object):
+    """
+    Term frequency / document frequency of the 'content' field.
+
+    It is used to rank and validate search suggestions without running a
+    search for each of them: for each term, it knows how many times it
+    appears (tf), and in which documents (and therefore in how many: df).
+
+    Everything is read from the term statistics and the postings of the
+    Whoosh index itself (through the current searcher): nothing has to be
+    kept in memory or written on disk. Beware that Whoosh only updates tf
+    and df of deleted documents when merging segments (good enough for
+    ranking). The postings are always exact.
+    """
+
+    # written by older versions (copy of the whole index in JSON)
+    OBSOLETE_FILENAME = "terms.json"
+
+    def __init__(self, indexdir, analyzer):
+        """
+        Arguments:
+            analyzer --- analyzer of the 'content' field. Used to split
+                the keywords in terms.
+        """
+        self.analyzer = analyzer
+        obsolete_path = os.path.join(indexdir, self.OBSOLETE_FILENAME)
+        if os.path.exists(obsolete_path):
+            logger.info("Removing obsolete term dictionary %s",
+                        obsolete_path)
+            os.unlink(obsolete_path)
+
+    def tokenize(self, text):
+        return [token.text for token in self.analyzer(text)]
+
+    @staticmethod
+    def get_tf(searcher, term):
+        return int(searcher.reader().frequency(FIELD, term))
+
+    @staticmethod
+    def get_df(searcher, term):
+        return searcher.reader().doc_frequency(FIELD, term)
+
+    def find_docs(self, searcher, keywords, docs=None):
+        """
+        Look for the documents containing all the keywords (same thing as
+        a strict search).
+
+        Arguments:
+            docs --- if not None, only look among those documents (as
+                returned by a previous call, with the same searcher)
+
+        Returns:
+            A set of Whoosh document numbers (only valid for this searcher).
+            None if the keywords use some query syntax that the dictionary
+            cannot evaluate.
+        """
+        reader = searcher.reader()
+        for keyword in keywords:
+            if (QUERY_SYNTAX_REGEX.search(keyword) or
+                    keyword in QUERY_OPERATORS):
+                return None
+            for term in self.tokenize(keyword):
+                if (FIELD, term) not in reader:
+                    return set()
+                docnums = set(reader.postings(FIELD, term).all_ids())
+                if docs is None:
+                    docs = docnums
+                else:
+                    docs = docs.intersection(docnums)
+                if len(docs) <= 0:
+                    return docs
+        if docs is None:
+            docs = set(reader.all_doc_ids())
+        return docs
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Compare GioFileSystem (GVfs) and LocalFileSystem on what a rescan and a
+reload of the index do with the work directory: list it, instantiate each
+document, and look at its modification time, page count and labels.
+
+Usage: bench_fs.py [<work directory> [<number of runs>]]
+(default: the work directory from the configuration, 3 runs)
+"""
+
+import sys
+import time
+
+import paperwork_backend.config as config
+import paperwork_backend.fs as fs
+import paperwork_backend.index as index
+from paperwork_backend.common.doc import DOC_DIR_CACHE
+
+
+def rescan(pfs, workdir):
+    # see rescan._examine_docdirs()
+    docs = []
+    for info in pfs.enumerate(workdir, ()):
+        if not info.is_dir:
+            continue
+        doc = index.inst_doc(pfs, info.uri, info.name, check_exists=False)
+        if doc is None:
+            continue
+        doc.last_mod
+        docs.append(doc)
+    return docs
+
+
+def reload(pfs, workdir, doctypes):
+    # see PaperworkIndex.continue_reload_index() when the catalog is missing
+    for (docid, doctype) in doctypes:
+        docpath = pfs.join(workdir, docid)
+        doc = index.inst_doc(pfs, docpath, docid, doctype)
+        if doc is None:
+            continue
+        doc.nb_pages
+        doc.labels
+
+
+def run(name, func, docpaths, nb_runs):
+    best = None
+    for _ in range(nb_runs):
+        # the directory listings must not come from the cache
+        for docpath in docpaths:
+            DOC_DIR_CACHE.forget(docpath)
+        start = time.time()
+        func()
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    print("  %-6s: %.3fs (%.1f docs/s)" % (
+        name, best, len(docpaths) / max(best, 0.000001)
+    ))
+
+
+def main():
+    if len(sys.argv) > 1:
+        workdir = sys.argv[1]
+    else:
+        pconfig = config.PaperworkConfig()
+        pconfig.read()
+        workdir = pconfig.settings['workdir'].value
+    nb_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    for pfs in (fs.GioFileSystem(), fs.LocalFileSystem()):
+        uri = pfs.safe(workdir)
+        docs = rescan(pfs, uri)
+        doctypes = [(doc.docid, doc.doctype) for doc in docs]
+        docpaths = [doc.path for doc in docs]
+
+        print("%s (%d documents, best of %d runs):" % (
+            type(pfs).__name__, len(docs), nb_runs
+        ))
+        run("rescan", lambda: rescan(pfs, uri), docpaths, nb_runs)
+        run("reload", lambda: reload(pfs, uri, doctypes), docpaths, nb_runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Measure how much memory the document objects use once instantiated, as they
+are kept by the index process and the GUI.
+
+Usage: bench_memory.py [<work directory>]
+(default: the work directory from the configuration)
+"""
+
+import gc
+import sys
+import tracemalloc
+
+import paperwork_backend.config as config
+import paperwork_backend.fs as fs
+import paperwork_backend.index as index
+
+
+def main():
+    if len(sys.argv) > 1:
+        workdir = sys.argv[1]
+    else:
+        pconfig = config.PaperworkConfig()
+        pconfig.read()
+        workdir = pconfig.settings['workdir'].value
+
+    gfs = fs.LocalFileSystem()
+    workdir = gfs.safe(workdir)
+    docdirs = [
+        (docpath, gfs.basename(docpath))
+        for docpath in gfs.listdir(workdir)
+    ]
+    print("Work directory: %s (%d directories)" % (workdir, len(docdirs)))
+
+    gc.collect()
+    tracemalloc.start()
+
+    docs = []
+    for (docpath, docid) in docdirs:
+        doc = index.inst_doc(gfs, docpath, docid)
+        if doc is not None:
+            docs.append(doc)
+    gc.collect()
+    (docs_only, _) = tracemalloc.get_traced_memory()
+
+    # what the GUI does at least: look at the first page of each document
+    nb_pages = 0
+    for doc in docs:
+        if doc.nb_pages > 0:
+            doc.pages[0]
+            nb_pages += 1
+    gc.collect()
+    (with_pages, _) = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+
+    nb_docs = max(1, len(docs))
+    print("Documents: %d" % len(docs))
+    print("Memory used by the documents: %d bytes (%d bytes per document)"
+          % (docs_only, docs_only / nb_docs))
+    print("Memory used with their first page: %d bytes"
+          " (%d bytes per document)"
+          % (with_pages, with_pages / nb_docs))
+    if nb_pages > 0:
+        print("Memory used per page object: %d bytes"
+              % ((with_pages - docs_only) / nb_pages))
+
+
+if __name__ == "__main__":
+    main()
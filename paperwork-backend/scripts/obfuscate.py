@@ -122,11 +122,9 @@ def clone_page_content(src_page, dst_page, mapping, salt):
 
 
 def clone_doc_content(src_doc, dst_doc, mapping, salt):
-    dst_pages = dst_doc.pages
     for src_page in src_doc.pages:
         dst_page = ImgPage(dst_doc)
         clone_page_content(src_page, dst_page, mapping, salt)
-        dst_pages.add(dst_page)
         sys.stdout.write("%d " % src_page.page_nb)
         sys.stdout.flush()
 
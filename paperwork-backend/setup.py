@@ -77,7 +77,7 @@ There is no GUI here. The GUI is https://github.com/openpaperwork/paperwork .
         "pyocr",
         "termcolor",  # used by paperwork-chkdeps
         "Whoosh",
-        "simplebayes",
+        "numpy",
         # paperwork-shell chkdeps take care of all the dependencies that can't
         # be handled here. Mainly, dependencies using gobject introspection
         # (libpoppler, etc)
@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+import unittest
+
+from paperwork_backend import bayes
+
+try:
+    import simplebayes
+except ImportError:
+    simplebayes = None
+
+
+DOCS = [
+    ("Invoice number 42: 3 hours of plumbing. Total: 120 EUR",
+     {"invoice", "house"}),
+    ("Electricity bill, invoice for march. Total: 60 EUR", {"invoice"}),
+    ("Dear customer, your contract has been renewed", {"contract"}),
+    ("Rental contract of the house, signed by both parties",
+     {"contract", "house"}),
+    ("Payslip of march. Net salary: 2000 EUR", {"salary"}),
+    ("Payslip of april. Net salary: 2000 EUR. Bonus: 200 EUR", {"salary"}),
+    ("Invoice: new roof for the house. Total: 8000 EUR", {"house"}),
+]
+
+LABELS = ["invoice", "house", "contract"]
+
+QUERIES = [
+    "Invoice for the roof of the house: 500 EUR",
+    "Payslip of may, net salary",
+    "Unknown words only: foo bar",
+    "contract contract contract invoice",
+]
+
+
+class TestMultiLabelBayes(unittest.TestCase):
+    """
+    The scores must be the ones of one simplebayes classifier per label
+    (with "yes" and "no" as categories)
+    """
+
+    def setUp(self):
+        self.model = bayes.MultiLabelBayes()
+        self.reference = {}
+        for label in LABELS:
+            self._add_label(label)
+
+    def _add_label(self, label):
+        self.model.add_label(label)
+        self.reference[label] = simplebayes.SimpleBayes(
+            tokenizer=lambda text: bayes.TOKEN_REGEX.findall(text.lower())
+        )
+
+    def _train(self, text, labels):
+        self.model.train(self.model.tokenize(text), labels)
+        for (label, reference) in self.reference.items():
+            reference.train("yes" if label in labels else "no", text)
+
+    def _untrain(self, text, labels):
+        self.model.untrain(self.model.tokenize(text), labels)
+        for (label, reference) in self.reference.items():
+            reference.untrain("yes" if label in labels else "no", text)
+
+    def _relabel(self, text, removed, added):
+        self.model.relabel(self.model.tokenize(text), removed, added)
+        for label in removed:
+            self.reference[label].untrain("yes", text)
+            self.reference[label].train("no", text)
+        for label in added:
+            self.reference[label].untrain("no", text)
+            self.reference[label].train("yes", text)
+
+    def _check_scores(self, model):
+        scores = model.score_many(
+            [model.tokenize(query) for query in QUERIES]
+        )
+        self.assertEqual(len(scores), len(QUERIES))
+        for (query, query_scores) in zip(QUERIES, scores):
+            self.assertEqual(set(query_scores), set(self.reference))
+            for (label, reference) in self.reference.items():
+                expected = reference.score(query)
+                for category in ("yes", "no"):
+                    self.assertAlmostEqual(
+                        query_scores[label][category],
+                        expected.get(category, 0.0),
+                        msg="{} / {} / {}".format(query, label, category)
+                    )
+
+    @unittest.skipIf(simplebayes is None, "simplebayes not installed")
+    def test_train(self):
+        self._add_label("salary")
+        for (text, labels) in DOCS:
+            self._train(text, labels)
+        self._check_scores(self.model)
+
+    @unittest.skipIf(simplebayes is None, "simplebayes not installed")
+    def test_update(self):
+        for (text, labels) in DOCS[:4]:
+            self._train(text, labels)
+        # only trained with the documents that come after
+        self._add_label("salary")
+        for (text, labels) in DOCS[4:]:
+            self._train(text, labels)
+        self._relabel(DOCS[1][0], {"invoice"}, {"house"})
+        self._untrain(DOCS[6][0], DOCS[6][1])
+        self._check_scores(self.model)
+
+    @unittest.skipIf(simplebayes is None, "simplebayes not installed")
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp(prefix="paperwork_tests_")
+        try:
+            for (text, labels) in DOCS[:3]:
+                self._train(text, labels)
+            self.model.save(tmpdir)
+            self._add_label("salary")
+            for (text, labels) in DOCS[3:]:
+                self._train(text, labels)
+            self._untrain(DOCS[0][0], DOCS[0][1])
+            # incremental save
+            self.model.save(tmpdir)
+
+            model = bayes.MultiLabelBayes()
+            self.assertTrue(model.load(tmpdir))
+            self._check_scores(model)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,128 @@
+import io
+import os
+import shutil
+import tempfile
+import types
+import unittest
+
+from PIL import Image
+
+from paperwork_backend import docimport
+from paperwork_backend import fs
+
+
+class TestImageImport(unittest.TestCase):
+    def setUp(self):
+        self.fs = fs.LocalFileSystem()
+        self.tmpdir = tempfile.mkdtemp(prefix="paperwork_tests_")
+        self.srcdir = os.path.join(self.tmpdir, "src")
+        self.workdir = os.path.join(self.tmpdir, "work")
+        os.mkdir(self.srcdir)
+        os.mkdir(self.workdir)
+        self.docsearch = types.SimpleNamespace(
+            rootdir=self.fs.safe(self.workdir)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _make_img(self, name, mode, img_format):
+        img = Image.new(mode, (60, 40))
+        img.save(os.path.join(self.srcdir, name), format=img_format)
+
+    def _get_doc_files(self, doc):
+        return sorted(os.listdir(self.fs.unsafe(doc.path)))
+
+    def test_mixed_folder(self):
+        """
+        Images that JPEG can't store as is (RGBA, P) must be converted, and
+        images that can't be imported at all must be skipped without
+        leaving any file behind.
+        """
+        self._make_img("1.jpg", "RGB", "JPEG")
+        self._make_img("2.png", "RGBA", "PNG")
+        with open(os.path.join(self.srcdir, "3.png"), "wb") as fd:
+            fd.write(b"\x89PNG\r\n\x1a\nnot really a PNG")
+        self._make_img("4.gif", "P", "GIF")
+        self._make_img("5.jpg", "L", "JPEG")
+
+        importer = docimport.ImageDirectoryImporter(self.fs)
+        importer.nb_workers = 1
+        result = importer.import_doc(
+            [self.fs.safe(self.srcdir)], self.docsearch
+        )
+
+        self.assertEqual(len(result.new_docs), 1)
+        doc = result.new_docs[0]
+        self.assertEqual(doc.nb_pages, 4)
+        self.assertEqual(len(result.imported_file_uris), 4)
+        self.assertEqual(result.stats["JPEG file(s) copied as is"], 2)
+        self.assertEqual(
+            [f for f in self._get_doc_files(doc) if f.endswith(".jpg")],
+            ["paper.1.jpg", "paper.2.jpg", "paper.3.jpg", "paper.4.jpg"]
+        )
+        for page in doc.pages:
+            self.assertEqual(page.img.size, (60, 40))
+
+    def test_failed_last_image(self):
+        """
+        If the last image can't be imported, no empty page file must remain
+        """
+        self._make_img("1.png", "RGBA", "PNG")
+        with open(os.path.join(self.srcdir, "2.jpg"), "wb") as fd:
+            fd.write(b"\xff\xd8\xffnot really a JPEG")
+
+        importer = docimport.ImageDirectoryImporter(self.fs)
+        importer.nb_workers = 1
+        result = importer.import_doc(
+            [self.fs.safe(self.srcdir)], self.docsearch
+        )
+
+        doc = result.new_docs[0]
+        self.assertEqual(doc.nb_pages, 1)
+        self.assertNotIn("paper.2.jpg", self._get_doc_files(doc))
+        self.assertEqual(
+            [f for f in self._get_doc_files(doc) if f.endswith(".tmp")], []
+        )
+
+    def test_failed_append(self):
+        """
+        If nothing can be appended to an existing document, it must remain
+        untouched
+        """
+        self._make_img("1.png", "RGBA", "PNG")
+        with open(os.path.join(self.srcdir, "2.png"), "wb") as fd:
+            fd.write(b"not an image")
+
+        importer = docimport.ImageImporter(self.fs)
+        importer.nb_workers = 1
+        result = importer.import_doc(
+            [self.fs.safe(os.path.join(self.srcdir, "1.png"))],
+            self.docsearch
+        )
+        doc = result.new_docs[0]
+        files = self._get_doc_files(doc)
+
+        with self.assertRaises(Exception):
+            importer.import_doc(
+                [self.fs.safe(os.path.join(self.srcdir, "2.png"))],
+                self.docsearch, current_doc=doc
+            )
+        self.assertEqual(doc.nb_pages, 1)
+        self.assertEqual(self._get_doc_files(doc), files)
+
+
+class TestJpegPassthrough(unittest.TestCase):
+    def _open(self, mode, img_format="JPEG", **kwargs):
+        buf = io.BytesIO()
+        Image.new(mode, (10, 10)).save(buf, format=img_format, **kwargs)
+        buf.seek(0)
+        return Image.open(buf)
+
+    def test_can_copy(self):
+        self.assertTrue(docimport._can_copy_jpeg(self._open("RGB")))
+        self.assertTrue(docimport._can_copy_jpeg(self._open("L")))
+        self.assertFalse(docimport._can_copy_jpeg(self._open("CMYK")))
+        self.assertFalse(
+            docimport._can_copy_jpeg(self._open("RGB", img_format="PNG"))
+        )
@@ -250,8 +250,10 @@ class LabelEditor(object):
 
         if (response == Gtk.ResponseType.OK):
             logger.info("Label validated")
-            self.label.name = name_entry.get_text()
-            self.label.color = self._color_chooser.get_rgba()
+            self.label = Label(
+                name_entry.get_text(),
+                self._color_chooser.get_rgba().to_string()
+            )
             logger.info("Label after editing: %s" % self.label)
         else:
             logger.info("Label editing canceled")
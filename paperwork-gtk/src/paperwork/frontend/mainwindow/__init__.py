@@ -144,6 +144,13 @@ class JobIndexLoader(Job):
         """
         if not self.can_run:
             raise StopIteration()
+        if step == DocSearch.INDEX_STEP_REBUILDING:
+            # 'doc' is actually the throughput (documents / second)
+            txt = _('Rebuilding the index ...')
+            txt += (" (%d docs/s)" % doc)
+            self.emit('index-loading-progression',
+                      float(progression) / total, txt)
+            return
         if progression % 50 != 0:
             return
         txt = None
@@ -164,6 +171,7 @@ class JobIndexLoader(Job):
             self.emit('index-loading-start')
             self.started = True
         try:
+            must_rebuild = False
             if (self.__config.CURRENT_INDEX_VERSION !=
                     self.__config['index_version'].value):
                 logger.info("Index structure is obsolete."
@@ -171,6 +179,7 @@ class JobIndexLoader(Job):
                 docsearch = DocSearch(self.__config['workdir'].value)
                 # we destroy the index to force its rebuilding
                 docsearch.destroy_index()
+                must_rebuild = True
                 self.__config['index_version'].value = \
                     self.__config.CURRENT_INDEX_VERSION
                 self.__config.write()
@@ -182,6 +191,16 @@ class JobIndexLoader(Job):
             docsearch.set_language(self.__config['ocr_lang'].value)
             docsearch.reload_index(progress_cb=self.__progress_cb)
 
+            if ((must_rebuild or docsearch.nb_docs <= 0) and
+                    self.__has_docdirs(docsearch)):
+                # first-time indexing: much faster than letting the
+                # index updater add the documents one by one
+                docsearch.rebuild_index(progress_cb=self.__progress_cb)
+                docsearch.reload_index(progress_cb=self.__progress_cb)
+
+            # label changes are usually made in bursts
+            docsearch.set_write_behind(True)
+
             if not self.can_run:
                 return
 
@@ -190,6 +209,13 @@ class JobIndexLoader(Job):
         except StopIteration:
             logger.info("Index loading interrupted")
 
+    @staticmethod
+    def __has_docdirs(docsearch):
+        for info in docsearch.fs.enumerate(docsearch.rootdir, ()):
+            if info.is_dir:
+                return True
+        return False
+
     def stop(self, will_resume=False):
         if not will_resume and not self.done:
             self.emit('index-loading-end', None)
@@ -287,7 +313,8 @@ class JobDocExaminer(Job):
                 self.__on_doc_changed,
                 self.__on_doc_missing,
                 self.__on_doc_unchanged,
-                self.__progress_cb)
+                self.__progress_cb,
+                nb_workers=None)
             self.emit('doc-examination-end')
             self.done = True
         except StopIteration:
@@ -513,7 +540,7 @@ class JobDocSearcher(Job):
                          (GObject.TYPE_PYOBJECT, )),
         # user made a typo
         'search-invalid': (GObject.SignalFlags.RUN_LAST, None, ()),
-        # array of documents
+        # array of search results (see paperwork_backend.index.SEARCH_RESULT)
         'search-results': (GObject.SignalFlags.RUN_LAST, None,
                            # XXX(Jflesch): TYPE_STRING would turn the Unicode
                            # object into a string object
@@ -527,11 +554,17 @@ class JobDocSearcher(Job):
     can_stop = True
     priority = 500
 
+    # maximum time (in seconds) spent looking for suggestions
+    SUGGESTIONS_BUDGET = 0.3
+
     def __init__(self, factory, id, config, docsearch, sort_func,
-                 search_type, search):
+                 search_type, search, limit=None):
         Job.__init__(self, factory, id)
         self.search = search
-        self.__search_type = search_type
+        self.search_type = search_type
+        # only the first page of results is obtained here. The following
+        # ones are requested by the document list when required
+        self.limit = limit
         self.__docsearch = docsearch
         self.__sort_func = sort_func
         self.__config = config
@@ -547,9 +580,11 @@ class JobDocSearcher(Job):
 
         try:
             logger.info("Searching: [%s]" % self.search)
-            documents = self.__docsearch.find_documents(
+            # sort='date': same order than sort_documents_by_date()
+            documents = self.__docsearch.find_documents_ids(
                 self.search,
-                search_type=self.__search_type)
+                search_type=self.search_type,
+                limit=self.limit, sort='date')
         except Exception as exc:
             logger.error("Invalid search: [%s]" % self.search)
             logger.error("Exception was: %s: %s" % (type(exc), str(exc)))
@@ -570,7 +605,9 @@ class JobDocSearcher(Job):
         if not self.can_run:
             logger.info("Search cancelled. Won't look for suggestions")
             return
-        suggestions = self.__docsearch.find_suggestions(self.search)
+        suggestions = self.__docsearch.find_suggestions(
+            self.search, budget=self.SUGGESTIONS_BUDGET
+        )
         self.emit('search-suggestions', suggestions)
 
     def stop(self, will_resume=False):
@@ -587,15 +624,17 @@ class JobFactoryDocSearcher(JobFactory):
         self.__main_win = main_win
         self.__config = config
 
-    def make(self, docsearch, sort_func, search_type, search):
+    def make(self, docsearch, sort_func, search_type, search, limit=None):
         job = JobDocSearcher(self, next(self.id_generator), self.__config,
-                             docsearch, sort_func, search_type, search)
+                             docsearch, sort_func, search_type, search,
+                             limit)
         job.connect('search-start', lambda searcher, search:
                     GLib.idle_add(self.__main_win.on_search_start_cb, search))
         job.connect('search-results',
                     lambda searcher, search, documents:
                     GLib.idle_add(self.__main_win.on_search_results_cb,
-                                  search, documents))
+                                  search, documents, searcher.search_type,
+                                  searcher.limit))
         job.connect('search-invalid',
                     lambda searcher: GLib.idle_add(
                         self.__main_win.on_search_invalid_cb))
@@ -3371,7 +3410,7 @@ class MainWindow(object):
 
         # no document --> add the introduction document
         docpath = get_documentation('intro')
-        docuri = fs.GioFileSystem().safe(docpath)
+        docuri = fs.LocalFileSystem().safe(docpath)
         importers = docimport.get_possible_importers([docuri], self.doc)
         job_importer = self.job_factories['importer']
         job_importer = job_importer.make(importers[0], [docuri])
@@ -3446,12 +3485,14 @@ class MainWindow(object):
                 revealer.set_reveal_child(visible)
         self.search_box.set_visible(to != 'doc_properties')
 
-    def on_search_results_cb(self, search, documents):
+    def on_search_results_cb(self, search, documents, search_type='fuzzy',
+                             limit=None):
         logger.info("Got {} documents".format(len(documents)))
         self.search_field.override_color(Gtk.StateFlags.NORMAL, None)
         self.doclist.set_docs(
             documents,
-            all_docs=(search.strip() == u"")
+            all_docs=(search.strip() == u""),
+            search=search, search_type=search_type, limit=limit
         )
 
     def on_search_suggestions_cb(self, suggestions):
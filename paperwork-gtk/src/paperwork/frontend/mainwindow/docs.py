@@ -1,4 +1,3 @@
-from copy import copy
 import datetime
 import gettext
 import logging
@@ -538,12 +537,13 @@ class ActionEditLabel(SimpleAction):
         label_color = label_box.get_children()[1].get_rgba().to_string()
         label = Label(label_name, label_color)
 
-        new_label = copy(label)
-        self._dialog = editor = LabelEditor(new_label)
+        self._dialog = editor = LabelEditor(label)
         reply = editor.edit(self.__main_win.window)
         if reply != "ok":
             logger.warning("Label edition cancelled")
             return
+        # labels are immutable: the editor provides a new one
+        new_label = editor.label
         logger.info("Label edited. Applying changes")
         job = self.__doc_properties.job_factories['label_updater'].make(
             self.__main_win.docsearch, label, new_label)
@@ -678,6 +678,9 @@ class DocList(object):
         self.model = {
             'has_new': False,
             'docids': [],
+            # search for which more results may be obtained (see
+            # _load_next_page()). None if all the results are known
+            'pager': None,
             'by_row': {},  # Gtk.ListBoxRow: docid
             'by_id': {},  # docid: Gtk.ListBoxRow
             # keep the thumbnails in cache
@@ -1039,9 +1042,41 @@ class DocList(object):
     def show_loading(self):
         GLib.idle_add(self._show_loading)
 
+    def _load_next_page(self):
+        """
+        Search results are obtained one page at a time, when they are
+        about to be displayed.
+        """
+        pager = self.model['pager']
+        if pager is None:
+            return
+        results = self.__main_win.docsearch.find_documents_ids(
+            pager['search'], search_type=pager['search_type'],
+            offset=pager['offset'], limit=self.LIST_CHUNK,
+            sort='date'
+        )
+        logger.info("Got {} more documents".format(len(results)))
+        pager['offset'] += len(results)
+        if len(results) < self.LIST_CHUNK:
+            self.model['pager'] = None
+        # the index may have been updated in the meantime
+        known = set(self.model['docids'])
+        self.model['docids'] += [
+            result.docid for result in results if result.docid not in known
+        ]
+        self._update_nb_results()
+
+    def _update_nb_results(self):
+        nb_results = str(len(self.model['docids']))
+        if self.model['pager'] is not None:
+            nb_results += "+"
+        self.gui['nb_results'].set_text(nb_results)
+
     def _add_boxes(self):
         start = self.gui['nb_boxes']
         stop = self.gui['nb_boxes'] + self.LIST_CHUNK
+        if stop > len(self.model['docids']):
+            self._load_next_page()
         docs = self.model['docids'][start:stop]
 
         logger.info("Will display documents {}:{} (actual number: {})".format(
@@ -1049,36 +1084,61 @@ class DocList(object):
         ))
 
         for docid in docs:
-            rowbox = self.model['by_id'][docid]
-            self.gui['list'].add(rowbox)
             self.gui['nb_boxes'] += 1
+            # documents are only instantiated when they are displayed
+            doc = self.__main_win.docsearch.get_doc_from_docid(
+                docid, inst=False
+            )
+            if doc is None:
+                continue
+            rowbox = Gtk.ListBoxRow()
+            selected = (docid == self.__main_win.doc.docid)
+            self._make_listboxrow_doc_widget(doc, rowbox, selected)
+            self.model['by_row'][rowbox] = docid
+            self.model['by_id'][docid] = rowbox
+            self.gui['list'].add(rowbox)
 
-    def set_docs(self, documents, all_docs=True):
+    def set_docs(self, documents, all_docs=True, search=None,
+                 search_type='fuzzy', limit=None):
         self.__main_win.schedulers['main'].cancel_all(
             self.job_factories['doc_thumbnailer']
         )
 
         self.clear()
-        GLib.idle_add(self._set_docs, documents, all_docs)
+        GLib.idle_add(self._set_docs, documents, all_docs, search,
+                      search_type, limit)
 
-    def _set_docs(self, documents, all_docs=True):
+    def _set_docs(self, documents, all_docs=True, search=None,
+                  search_type='fuzzy', limit=None):
+        """
+        Arguments:
+            documents --- documents or search results (only their docids
+                are used)
+            search, search_type, limit --- if 'documents' is only the first
+                page of results ('limit' results), the following pages
+                will be requested when required
+        """
         need_new_doc = all_docs
         display_count = not all_docs
 
         title = _("Documents") if all_docs else _("Matching papers")
         self.gui['headerbar'].set_title(title)
 
+        self.model['docids'] = [doc.docid for doc in documents]
+        self.model['pager'] = None
+        if (search is not None and limit is not None and
+                len(documents) >= limit):
+            self.model['pager'] = {
+                'search': search,
+                'search_type': search_type,
+                # number of results obtained so far. Not the number of
+                # docids: duplicates are dropped
+                'offset': len(documents),
+            }
+
         self.gui['nb_results'].set_visible(display_count)
         if display_count:
-            self.gui['nb_results'].set_text(str(len(documents)))
-
-        self.model['docids'] = [doc.docid for doc in documents]
-        for doc in documents:
-            rowbox = Gtk.ListBoxRow()
-            selected = (doc.docid == self.__main_win.doc.docid)
-            self._make_listboxrow_doc_widget(doc, rowbox, selected)
-            self.model['by_row'][rowbox] = doc.docid
-            self.model['by_id'][doc.docid] = rowbox
+            self._update_nb_results()
 
         self.gui['list'].freeze_child_notify()
         try:
@@ -1117,6 +1177,9 @@ class DocList(object):
                     doc, rowbox,
                     doc.docid == self.__main_win.doc.docid
                 )
+            elif doc.docid in self.model['docids']:
+                # not displayed yet. Its box will be built when required
+                continue
             else:
                 # refresh the whole list for now, it's much simpler
                 self.refresh()
@@ -1151,7 +1214,8 @@ class DocList(object):
             docsearch=self.__main_win.docsearch,
             sort_func=self.__main_win.get_doc_sorting()[1],
             search_type='fuzzy',
-            search=search)
+            search=search,
+            limit=self.LIST_CHUNK)
         self.__main_win.schedulers['search'].schedule(job)
 
     def has_multiselect(self):